@@ -1,13 +1,74 @@
+import argparse
 import importlib
+import signal
 from icarus_v2.backend.configuration_manager import ConfigurationManager
-from icarus_v2.gui.main_window import MainWindow
 from icarus_v2.backend.data_handler import DataHandler
-from PySide6.QtWidgets import QApplication
-from PySide6.QtGui import QIcon
+from icarus_v2.backend.status_server import DEFAULT_SOCKET
+from icarus_v2.backend.event_server import EventServer, DEFAULT_ADDRESS
+from icarus_v2.backend.metrics import MetricsRegistry, collect_event_server
+from icarus_v2.backend.tracing import LatencyTracer
+from icarus_v2.backend.stall_watchdog import StallWatchdog
+from icarus_v2.backend.sampling_profiler import SamplingProfiler
+from icarus_v2.backend.runtime_profile import reserve_acquisition_cpu
+from icarus_v2.backend.metrics_server import MetricsServer, DEFAULT_ADDRESS as DEFAULT_METRICS_ADDRESS
 
 
 # Application entry point
 def main():
+    parser = argparse.ArgumentParser(prog="icarus", description="Monitoring software for the Icarus Pressure Jump apparatus")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run acquisition, logging and pulsing without a GUI. Status is served on a local socket.")
+    parser.add_argument("--socket", metavar="NAME", default=DEFAULT_SOCKET,
+                        help=f"Name of the local status socket in headless mode. Default: {DEFAULT_SOCKET}")
+    parser.add_argument("--pulse", action="store_true",
+                        help="Start pulsing as soon as the device is connected in headless mode.")
+    parser.add_argument("--shared-buffer", action="store_true",
+                        help="Keep the acquired data in shared memory in headless mode, so that other processes can attach "
+                             "to it by the buffer name given in the status. Handlers then read copies of the data.")
+    parser.add_argument("--stream", metavar="ADDRESS", nargs="?", const=DEFAULT_ADDRESS, default=None,
+                        help=f"Stream live events to local clients on a loopback host:port or a Unix socket path. Default: {DEFAULT_ADDRESS}")
+    parser.add_argument("--metrics", metavar="ADDRESS", nargs="?", const=DEFAULT_METRICS_ADDRESS, default=None,
+                        help=f"Serve pipeline metrics for Prometheus at http://ADDRESS/metrics. Default: {DEFAULT_METRICS_ADDRESS}")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="On exit, write the latency of recent events at each stage from USB to screen as Chrome trace JSON.")
+    parser.add_argument("--profile", metavar="FILE", default=None,
+                        help="Sample the stacks of every thread while running and write them to FILE as collapsed stacks on exit.")
+    parser.add_argument("--raw", metavar="FILE", default=None,
+                        help="TESTING ONLY. Play back a raw data file instead of connecting to a device.")
+    parser.add_argument("--emulate", action="store_true",
+                        help="TESTING ONLY. Connect to an emulated DI-4108 instead of a USB device.")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="TESTING ONLY. Use simulated pressure data that reacts to the pulse controls.")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile is not None:
+        profiler = SamplingProfiler()
+        profiler.start()
+
+    usb_backend = None
+    if args.emulate:
+        from icarus_v2.utils.di4108_emulator import DI4108Backend, DI4108Emulator
+        from icarus_v2.utils.synthetic_device import PressureModel
+        usb_backend = DI4108Backend(DI4108Emulator(source=PressureModel()))
+
+    if args.headless:
+        run_headless(args, usb_backend)
+    else:
+        run_gui(args, usb_backend)
+
+    if profiler is not None:
+        profiler.stop()
+        profiler.export(args.profile)
+
+
+# Runs until the main window is closed
+def run_gui(args, usb_backend):
+    # GUI modules are only imported when they are used, so that headless mode does not need a display
+    from icarus_v2.gui.main_window import MainWindow
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtGui import QIcon
+
     app = QApplication([])
     app.setApplicationName('Icarus')
 
@@ -16,17 +77,99 @@ def main():
 
     # initialize singleton ConfigurationManager
     ConfigurationManager()
+    # Before any other thread is started, so that they all leave the CPU of acquisition free
+    reserve_acquisition_cpu()
+
+    # Reports freezes of the GUI and the code causing them
+    watchdog = StallWatchdog()
+    watchdog.start()
 
     # initialize gui
     window = MainWindow()
     window.showMaximized()
 
     # start data collection
-    data_handler = DataHandler()
+    data_handler = DataHandler(raw_file=args.raw, usb_backend=usb_backend, synthetic=args.synthetic)
     window.set_device(data_handler)
+    server = start_event_server(args.stream, data_handler)
+    metrics_server = start_metrics_server(args.metrics)
     data_handler.start()
 
     app.exec()
+    watchdog.close()
+    if server is not None:
+        server.close()
+    if metrics_server is not None:
+        metrics_server.close()
+    if args.trace is not None:
+        LatencyTracer().export(args.trace)
+
+
+# Returns None if not streaming
+def start_event_server(address, data_handler):
+    if address is None:
+        return None
+    server = EventServer(address)
+    server.attach_data_handler(data_handler)
+    server.start()
+    MetricsRegistry().add_collector(lambda: collect_event_server(server))
+    print(f"Streaming events on {server.get_address()}", flush=True)
+    return server
+
+
+# Returns None if metrics are not served
+def start_metrics_server(address):
+    if address is None:
+        return None
+    server = MetricsServer(address)
+    server.start()
+    print(f"Serving metrics on http://{server.get_address()}/metrics", flush=True)
+    return server
+
+
+# Runs until interrupted or sent "quit" on the status socket
+def run_headless(args, usb_backend):
+    from PySide6.QtCore import QCoreApplication, QTimer
+    from icarus_v2.backend.headless_daemon import HeadlessDaemon
+
+    app = QCoreApplication([])
+    app.setApplicationName('Icarus')
+
+    # initialize singleton ConfigurationManager
+    ConfigurationManager()
+    # Before any other thread is started, so that they all leave the CPU of acquisition free
+    reserve_acquisition_cpu()
+
+    # Only shared if asked for, since handlers in this process must then copy what they read
+    data_handler = DataHandler(raw_file=args.raw, usb_backend=usb_backend, synthetic=args.synthetic,
+                               shared_memory=args.shared_buffer)
+    # Status requests and the sentry response are served from the event loop, so its stalls are reported too
+    watchdog = StallWatchdog()
+    daemon = HeadlessDaemon(app, data_handler, args.socket, pulse=args.pulse, watchdog=watchdog)
+    server = start_event_server(args.stream, data_handler)
+    metrics_server = start_metrics_server(args.metrics)
+
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    # Python signal handlers only run between Python instructions, so wake the interpreter regularly
+    timer = QTimer()
+    timer.timeout.connect(lambda: None)
+    timer.start(200)
+
+    watchdog.start()
+    data_handler.start()
+    app.exec()
+
+    watchdog.close()
+    daemon.stop_pulsing()
+    data_handler.quit()
+    daemon.close()
+    if server is not None:
+        server.close()
+    if metrics_server is not None:
+        metrics_server.close()
+    if args.trace is not None:
+        LatencyTracer().export(args.trace)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+import os
+import sys
+
+# PySide6 is optional for the Qt-free core. Without it, the locations QStandardPaths would give are built here,
+# so that scripts and the application share their settings and logs.
+try:
+    from PySide6.QtCore import QStandardPaths, QCoreApplication
+except ImportError:
+    QStandardPaths = None
+
+
+APP_NAME = "Icarus"
+
+
+# Directory of settings.json
+def get_config_dir():
+    if QStandardPaths is not None:
+        set_application_name()
+        return QStandardPaths.writableLocation(QStandardPaths.AppConfigLocation)
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser(os.path.join("~", "AppData", "Local")))
+    elif sys.platform == "darwin":
+        base = os.path.expanduser(os.path.join("~", "Library", "Preferences"))
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser(os.path.join("~", ".config"))
+    return os.path.join(base, APP_NAME)
+
+
+# Directory of logs and other data written by the application
+def get_data_dir():
+    if QStandardPaths is not None:
+        set_application_name()
+        return QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA", os.path.expanduser(os.path.join("~", "AppData", "Roaming")))
+    elif sys.platform == "darwin":
+        base = os.path.expanduser(os.path.join("~", "Library", "Application Support"))
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser(os.path.join("~", ".local", "share"))
+    return os.path.join(base, APP_NAME)
+
+
+# Scripts using the backend without a QCoreApplication share the locations of the application
+def set_application_name():
+    if QCoreApplication.applicationName() == "":
+        QCoreApplication.setApplicationName(APP_NAME)
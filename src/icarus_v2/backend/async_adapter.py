@@ -0,0 +1,68 @@
+import asyncio
+from collections import deque
+
+
+# Async iterator over what is published on one topic of an EventBus, for asyncio code consuming a Pipeline:
+#   async with pipeline.events(Event.DEPRESSURIZE) as events:
+#       async for event in events:
+# Publishing threads hand each item to the event loop without waiting for it to be consumed.
+# If the consumer falls more than maxsize items behind, the oldest are dropped and counted in self.dropped.
+# Iteration ends when close() is called or the end topic is published.
+class EventStream:
+    def __init__(self, bus, topic, maxsize=1000, loop=None, end=None) -> None:
+        self.loop = loop if loop is not None else asyncio.get_running_loop()
+        self.items = deque(maxlen=maxsize)
+        self.waiter = None
+        self.dropped = 0
+        self.closed = False
+
+        self.unsubscribe = [bus.subscribe(topic, self.publish)]
+        if end is not None:
+            self.unsubscribe.append(bus.subscribe(end, lambda *_: self.loop.call_soon_threadsafe(self.close)))
+
+    # Called in the publishing thread. Topics with several arguments give a tuple.
+    def publish(self, *args):
+        item = args[0] if len(args) == 1 else args
+        try:
+            self.loop.call_soon_threadsafe(self.put, item)
+        except RuntimeError:
+            # The event loop has been closed
+            self.closed = True
+
+    def put(self, item):
+        if self.closed:
+            return
+        if len(self.items) == self.items.maxlen:
+            self.dropped += 1
+        self.items.append(item)
+        self.wake()
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    # Must be called in the thread of the event loop. Items already received are still iterated.
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for unsubscribe in self.unsubscribe:
+            unsubscribe()
+        self.wake()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while len(self.items) == 0:
+            if self.closed:
+                raise StopAsyncIteration
+            self.waiter = self.loop.create_future()
+            await self.waiter
+        return self.items.popleft()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
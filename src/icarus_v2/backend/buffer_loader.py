@@ -1,41 +1,138 @@
-from PySide6.QtCore import QThread, Signal
-from icarus_v2.backend.ring_buffer import RingBuffer, SPMCRingBufferReader
+from bisect import bisect_right
+from collections import deque
+from time import perf_counter
+from icarus_v2.backend.ring_buffer import RingBuffer, SharedRingBuffer, SPMCRingBufferReader
 import numpy as np
 import usb.core
 from icarus_v2.backend.logger import Logger
+from icarus_v2.backend.pubsub import Topic
+from icarus_v2.backend.worker import Worker
+from icarus_v2.backend.metrics import MetricsRegistry
+from icarus_v2.backend.runtime_profile import apply_acquisition_profile
+
+
+# Latency (s) of the first block. 64 points at 4 kHz, as the device was originally read.
+INITIAL_BLOCK_LATENCY = 0.016
+# Blocks are never larger than this many seconds of data
+MAX_BLOCK_LATENCY = 0.1
+# Fraction of the duration of a block spent processing it above which blocks grow, and below which they shrink
+MAX_OVERHEAD = 0.2
+MIN_OVERHEAD = 0.05
+# Reads between block size changes
+ADAPT_INTERVAL = 50
+# Bits of the digital word which are always 0. Digital inputs are in bits 8-14.
+DIGITAL_ZERO_MASK = 0x80FC
+# Consecutive valid frames needed to resync after framing is lost
+MIN_RESYNC_FRAMES = 32
+MAX_DIGITAL_CHANGES = 8
+# Reads used to relate sample indices to perf_counter() time
+ARRIVAL_HISTORY = 500
 
 
 # This class is responsible for creating a buffer, reading from the device, processing the data, and putting it into the buffer.
-class BufferLoader(QThread):
-    device_disconnected = Signal()
+# Reads may return any number of bytes. Partial frames (one sample of every channel) are carried over to the next read.
+# Framing is checked against the digital word, which is the last in every frame, and recovered if bytes are lost.
+# The block size requested from the device adapts to keep per-read overhead low without adding latency.
+# device_disconnected is emitted from the thread of the loader when the device is lost or a raw log ends.
+class BufferLoader(Worker):
 
-    def __init__(self, buffer_seconds=120) -> None:
+    # The buffer holds buffer_seconds of data at the sample rate of the device
+    # If shared_memory, the buffer is a SharedRingBuffer which other processes can read. release() must then be called.
+    def __init__(self, buffer_seconds=120, shared_memory=False) -> None:
         super().__init__()
-        num_channels = 8
-        buffer_capacity = int(buffer_seconds * 4000)
-        self.buffer = RingBuffer((buffer_capacity, num_channels), np.int16)
+        self.buffer_seconds = buffer_seconds
+        self.shared_memory = shared_memory
+        self.device_disconnected = Topic("disconnected")
+        self.buffer = None
         self.device = None
 
+        self.frame_bytes = None
+        self.block_bytes = None
+        self.partial = bytearray() # Bytes of an incomplete frame from the last read
+        self.last_digital = None # Last digital inputs, used to pick between alignments when resyncing
+        self.arrivals = deque(maxlen=ARRIVAL_HISTORY) # (buffer write index, perf_counter() time) after recent reads
+
+        # Metrics
+        self.reads = 0
+        self.bytes_read = 0
+        self.resyncs = 0
+        self.dropped_bytes = 0
+        self.framing_errors = 0
+        self.overflows = 0
+        # Difference between the time between reads and the duration of a block. Blocks arrive as they fill,
+        # so anything delaying reads, e.g. garbage collection or another thread holding the GIL, shows up here.
+        self.read_jitter = MetricsRegistry().summary("usb_read_jitter_seconds",
+                                                     "Difference of the time between reads from the duration of a block.")
+        self.processing_time = 0 # Seconds spent processing blocks since the last block size change
+        self.load_time = 0 # Seconds spent processing the last block
+
         # TESTING ONLY. logs all example data.
         self.log_raw = False
 
 
+    # Buffer is reallocated if the device has a different sample rate or number of channels than the last one.
+    # Readers must be created after this.
     def set_device(self, device):
         self.device = device
+        shape = (int(self.buffer_seconds * device.sample_rate), device.channels_to_read)
+        if self.buffer is None or self.buffer.buffer.shape != shape:
+            if self.shared_memory:
+                self.release()
+                self.buffer = SharedRingBuffer(shape, np.int16)
+            else:
+                self.buffer = RingBuffer(shape, np.int16)
+
+        self.frame_bytes = 2 * device.channels_to_read
+        self.partial = bytearray()
+        self.last_digital = None
+        self.arrivals.clear()
+        self.set_block_latency(INITIAL_BLOCK_LATENCY)
+
+
+    # Sets the number of bytes to read at once to the nearest whole number of device packets
+    def set_block_latency(self, latency):
+        unit = getattr(self.device, "packet_bytes", self.frame_bytes)
+        bytes_per_second = self.device.sample_rate * self.frame_bytes
+        packets = int(round(latency * bytes_per_second / unit))
+        max_packets = max(1, int(MAX_BLOCK_LATENCY * bytes_per_second / unit))
+        self.block_bytes = min(max(1, packets), max_packets) * unit
+        self.processing_time = 0
+
+
+    # Seconds of data in one block
+    def get_block_latency(self):
+        return self.block_bytes / self.frame_bytes / self.device.sample_rate
+
+
+    # Grows blocks if processing them takes a large fraction of their duration, since most of that is per-read overhead.
+    # Shrinks them again once there is time to spare.
+    def adapt_block_size(self):
+        overhead = self.processing_time / (ADAPT_INTERVAL * self.get_block_latency())
+        if overhead > MAX_OVERHEAD:
+            self.set_block_latency(2 * self.get_block_latency())
+        elif overhead < MIN_OVERHEAD and self.get_block_latency() > INITIAL_BLOCK_LATENCY:
+            self.set_block_latency(max(INITIAL_BLOCK_LATENCY, self.get_block_latency() / 2))
+        else:
+            self.processing_time = 0
 
 
     def run(self):
         if self.device is None: return
 
+        # Pins this thread and raises its priority as set in runtime_settings
+        apply_acquisition_profile()
+
         if self.log_raw:
             self.raw_logger = Logger(is_raw=True)
+            self.raw_logger.set_device_settings(self.device.get_device_settings())
             self.raw_logger.new_log_file()
 
         self.device.start_scan()
 
+        last_read = None
         while self.device.acquiring:
             try:
-                data = self.device.read_data()
+                data = self.device.read_data(self.block_bytes)
             except usb.core.USBError:
                 # Device disconnected
                 self.device.acquiring = False
@@ -48,26 +145,175 @@ class BufferLoader(QThread):
                     self.device_disconnected.emit()
                     return
                 else:
+                    if "overflow" in str(e):
+                        self.overflows += 1
                     raise e
 
+            start = perf_counter()
+            if last_read is not None:
+                self.read_jitter.observe(abs(start - last_read - self.get_block_latency()))
+            last_read = start
             if self.log_raw:
                 self.raw_logger.log_raw(data)
-            processed_data = self.process_data(data)
-            self.buffer.enqueue(processed_data)
+            self.load(data, start)
+            self.load_time = perf_counter() - start
+            self.processing_time += self.load_time
+
+            if self.reads % ADAPT_INTERVAL == 0:
+                self.adapt_block_size()
 
         self.device.end_scan()
 
 
+    # Processes one read from the device and adds it to the buffer
+    # arrival_time is the perf_counter() time the data was read, if it was read live
+    def load(self, data, arrival_time=None):
+        self.reads += 1
+        self.bytes_read += len(data)
+        processed_data = self.process_data(data)
+        if len(processed_data) > 0:
+            self.buffer.enqueue(processed_data)
+            if arrival_time is not None:
+                self.arrivals.append((self.buffer.write_index, arrival_time))
+
+
+    # Estimated perf_counter() time at which the sample at index in the buffer was acquired, or None if not read live.
+    # Every read arrives some time after its last sample was acquired, so the read that arrived soonest after its
+    # samples gives the best estimate. Times are late by the shortest transfer delay of the recent reads.
+    def get_sample_time(self, index):
+        arrivals = list(self.arrivals)
+        if len(arrivals) == 0:
+            return None
+        sample_rate = self.device.sample_rate
+        # Time of sample 0 as implied by each read
+        origin = min(arrival - (write_index - 1) / sample_rate for write_index, arrival in arrivals)
+        return origin + index / sample_rate
+
+
+    # perf_counter() time at which the read containing the sample at index in the buffer arrived,
+    # or None if it was not read live or is no longer in the history of reads.
+    def get_arrival(self, index):
+        arrivals = list(self.arrivals)
+        # Reads are recorded with the write index after them, so the first one past index contains it
+        position = bisect_right(arrivals, index, key=lambda arrival: arrival[0])
+        # Unknown if index may be in a read before the history, or its read has not been recorded yet
+        if position == 0 or position == len(arrivals):
+            return None
+        return arrivals[position][1]
+
+
+    # Returns the whole frames in data and any partial frame left from the last read
     def process_data(self, data):
-        data_shape = (self.device.points_to_read, self.device.channels_to_read)
+        data = self.partial + data
+        self.partial = bytearray()
+        return self.process_frames(data)
 
-        int_array = np.frombuffer(data, dtype=np.int16)
-        reshaped_array = np.reshape(int_array, data_shape)
-        reshaped_array[:,-1] = reshaped_array[:,-1] >> 8    # Digital is only in the 1st byte
 
+    # Converts data to frames, resyncing wherever the digital word is not where it should be.
+    # Bytes after the last whole frame are kept for the next read.
+    def process_frames(self, data):
+        blocks = []
+        offset = 0
+        while len(data) - offset >= self.frame_bytes:
+            frames = (len(data) - offset) // self.frame_bytes
+            valid = self.count_aligned(data, offset, frames)
+            if valid == 0:
+                # Wait for more data to resync with confidence
+                if frames < MIN_RESYNC_FRAMES:
+                    break
+                alignment = self.find_alignment(data, offset, frames)
+                if alignment is None:
+                    # A corrupt frame rather than lost bytes. Keep the current framing, but drop the frame,
+                    # as its digital word would otherwise show up as valve and log edges. The frames after it are
+                    # checked again, so only corrupt ones are dropped.
+                    self.framing_errors += 1
+                    self.dropped_bytes += self.frame_bytes
+                    offset += self.frame_bytes
+                    continue
+                else:
+                    # Bytes before the first whole frame are lost
+                    self.resyncs += 1
+                    self.dropped_bytes += alignment
+                    offset += alignment
+                    continue
+
+            blocks.append(self.to_frames(data, offset, valid))
+            offset += valid * self.frame_bytes
+
+        self.partial += data[offset:]
+        if len(blocks) == 1:
+            return blocks[0]
+        if len(blocks) == 0:
+            return np.empty((0, self.device.channels_to_read), dtype=np.int16)
+        return np.concatenate(blocks)
+
+
+    def to_frames(self, data, offset, frames):
+        int_array = np.frombuffer(data, dtype=np.int16, count=frames * self.frame_bytes // 2, offset=offset)
+        reshaped_array = np.reshape(int_array, (frames, self.device.channels_to_read))
+        reshaped_array[:,-1] = reshaped_array[:,-1] >> 8    # Digital is only in the 1st byte
+        self.last_digital = int(reshaped_array[-1, -1])
         return reshaped_array
 
 
+    # Number of frames from offset bytes into data that look correctly framed, up to the first one that does not.
+    # Frames must end with a valid digital word, and the digital inputs must not change more than
+    # MAX_DIGITAL_CHANGES times in MIN_RESYNC_FRAMES frames. Analog channels read as digital words change constantly.
+    def count_aligned(self, data, offset, frames):
+        words = np.frombuffer(data, dtype=np.uint16, count=frames * self.frame_bytes // 2, offset=offset)
+        digital = words[self.frame_bytes // 2 - 1::self.frame_bytes // 2]
+        valid = frames
+
+        invalid = np.flatnonzero(digital & DIGITAL_ZERO_MASK)
+        if len(invalid) > 0:
+            valid = int(invalid[0])
+
+        changes = np.flatnonzero(np.diff(digital[:valid] >> 8)) + 1
+        if len(changes) > MAX_DIGITAL_CHANGES:
+            dense = np.flatnonzero(changes[MAX_DIGITAL_CHANGES:] - changes[:-MAX_DIGITAL_CHANGES] < MIN_RESYNC_FRAMES)
+            if len(dense) > 0:
+                valid = int(changes[dense[0]])
+
+        return valid
+
+
+    # Returns the number of bytes after offset to the first whole frame, or None if no alignment is likely.
+    # The alignment must give at least MIN_RESYNC_FRAMES valid frames. Analog channels which read near 0 can look like
+    # digital words, so the alignment with the most valid frames is chosen, preferring the last digital inputs read.
+    def find_alignment(self, data, offset, frames):
+        best = None
+        best_score = None
+        # The device sends whole 16 bit words, so only word boundaries are considered
+        for alignment in range(2, self.frame_bytes, 2):
+            available = (len(data) - offset - alignment) // self.frame_bytes
+            valid = self.count_aligned(data, offset + alignment, min(frames, available))
+            if valid < MIN_RESYNC_FRAMES:
+                continue
+            first = np.frombuffer(data, dtype=np.uint16, count=1, offset=offset + alignment + self.frame_bytes - 2)[0]
+            score = (valid, first >> 8 == self.last_digital)
+            if best_score is None or score > best_score:
+                best = alignment
+                best_score = score
+        return best
+
+
+    # Current block size, latency and framing statistics
+    def get_metrics(self):
+        metrics = {
+            "reads": self.reads,
+            "resyncs": self.resyncs,
+            "dropped_bytes": self.dropped_bytes,
+            "framing_errors": self.framing_errors,
+        }
+        if self.device is not None and self.block_bytes is not None:
+            metrics["block_bytes"] = self.block_bytes
+            metrics["block_points"] = self.block_bytes // self.frame_bytes
+            metrics["block_latency_ms"] = 1000 * self.get_block_latency()
+            # Time from the first sample of a block being acquired to it being in the buffer, excluding USB transfer
+            metrics["latency_ms"] = 1000 * (self.get_block_latency() + self.load_time)
+        return metrics
+
+
     def new_reader(self):
         return SPMCRingBufferReader(self.buffer)
 
@@ -76,6 +322,13 @@ class BufferLoader(QThread):
         return self.device.sample_rate
 
 
+    # Frees a shared memory buffer. Readers in every process must have stopped.
+    def release(self):
+        if isinstance(self.buffer, SharedRingBuffer):
+            self.buffer.release()
+        self.buffer = None
+
+
     def quit(self):
         self.may_start = False
         if self.device is not None and self.device.acquiring:
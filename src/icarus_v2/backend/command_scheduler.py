@@ -0,0 +1,116 @@
+import heapq
+from collections import deque
+from itertools import count
+from threading import Thread, Condition, Event
+from time import perf_counter
+
+
+# One command waiting to be written. Times are perf_counter() seconds.
+class ScheduledCommand:
+    def __init__(self, command, priority, check_echo, write=None) -> None:
+        self.command = command
+        self.priority = priority
+        self.check_echo = check_echo
+        self.write = write # Replaces the write function of the scheduler for this command
+        self.submitted = perf_counter()
+        self.written = None # Time the write to the device returned
+        self.result = None # Return value of the write
+        self.error = None
+        self.done = Event()
+
+    # Seconds from submission until the command was written
+    def get_latency(self):
+        return None if self.written is None else self.written - self.submitted
+
+
+# Owns all writes to a device so that commands from the GUI, PulseGenerator and the loader never interleave.
+# Commands are written one at a time from a single thread, lowest priority value first and in order of submission
+# within a priority, so valve commands jump ahead of configuration.
+# write(command, check_echo) does the I/O. It is called from the scheduler thread, or from the caller once stopped.
+class CommandScheduler:
+    VALVE = 0
+    CONTROL = 1
+    CONFIG = 2
+
+    def __init__(self, write, history_size=1000) -> None:
+        self.write = write
+        self.queue = [] # heap of (priority, sequence, ScheduledCommand)
+        self.sequence = count()
+        self.condition = Condition()
+        self.running = False
+        self.thread = None
+        self.history = deque(maxlen=history_size) # Written commands, oldest first
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = Thread(target=self.run, name="CommandScheduler", daemon=True)
+        self.thread.start()
+
+    # Commands already queued are written before the thread exits
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    # Queues a command. If wait, blocks until it has been written and re-raises any error from writing it.
+    # Commands are written directly if the scheduler is not running, e.g. while closing the device.
+    # write may be given to write this command differently, e.g. a batch of commands.
+    # Returns the ScheduledCommand.
+    def submit(self, command, priority=CONFIG, check_echo=True, wait=True, timeout=10, write=None):
+        scheduled = ScheduledCommand(command, priority, check_echo, write)
+        with self.condition:
+            running = self.running
+            if running:
+                heapq.heappush(self.queue, (priority, next(self.sequence), scheduled))
+                self.condition.notify_all()
+        if not running:
+            self.execute(scheduled)
+        if wait:
+            self.wait(scheduled, timeout)
+        return scheduled
+
+    # Blocks until a submitted command has been written and re-raises any error from writing it.
+    # Returns the time it was written.
+    def wait(self, scheduled, timeout=10):
+        if not scheduled.done.wait(timeout):
+            raise RuntimeError(f"Operation timed out: command \"{scheduled.command}\" was not written within {timeout}s.")
+        if scheduled.error is not None:
+            raise scheduled.error
+        return scheduled.written
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and len(self.queue) == 0:
+                    self.condition.wait()
+                if len(self.queue) == 0:
+                    return
+                _, _, scheduled = heapq.heappop(self.queue)
+            self.execute(scheduled)
+
+    def execute(self, scheduled):
+        try:
+            write = self.write if scheduled.write is None else scheduled.write
+            scheduled.result = write(scheduled.command, scheduled.check_echo)
+        except Exception as e:
+            scheduled.error = e
+        scheduled.written = perf_counter()
+        self.history.append(scheduled)
+        scheduled.done.set()
+
+    # Number of commands written and their latency from submission to write, per priority
+    def get_metrics(self):
+        metrics = {"queued": len(self.queue)}
+        for name, priority in (("valve", self.VALVE), ("control", self.CONTROL), ("config", self.CONFIG)):
+            latencies = [c.get_latency() for c in list(self.history) if c.priority == priority]
+            metrics[f"{name}_commands"] = len(latencies)
+            if len(latencies) > 0:
+                metrics[f"{name}_latency_mean_ms"] = 1000 * sum(latencies) / len(latencies)
+                metrics[f"{name}_latency_max_ms"] = 1000 * max(latencies)
+        return metrics
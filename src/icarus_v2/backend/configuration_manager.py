@@ -1,20 +1,31 @@
 import json
 import os
-import importlib
+import importlib.resources
 import threading
 from copy import deepcopy
-from PySide6.QtCore import Signal, QObject, QStandardPaths, QMetaObject, Q_ARG, Qt
 from icarus_v2.backend.event import Channel
+from icarus_v2.backend.app_paths import get_config_dir
+from icarus_v2.backend.pubsub import Topic
+
+# Without PySide6, settings_updated is a Topic, whose callbacks run in the thread that saves the settings
+try:
+    from PySide6.QtCore import Signal, QObject, QMetaObject, Q_ARG, Qt
+except ImportError:
+    QObject = None
+
+
+if QObject is not None:
+    # Emits settings_updated in the thread it belongs to, so slots of Qt objects run in their own thread
+    class SettingsNotifier(QObject):
+        settings_updated = Signal(str)
 
 
 # Responsible for loading and saving settings
 # Thread-safe singleton
-class ConfigurationManager(QObject):
+class ConfigurationManager:
     _instance = None
     _lock = threading.Lock()  # Lock for thread safety
     FILENAME = "settings.json"
-    # Signal to let subscribers know that settings[key] was changed
-    settings_updated = Signal(str)
 
     def __new__(cls):
         with cls._lock:
@@ -24,14 +35,21 @@ class ConfigurationManager(QObject):
 
     def __init__(self):
         if not hasattr(self, "initialized"):
-            super().__init__()
             self._initialize()
 
     def _initialize(self):
         self.initialized = True
 
+        # Signal or Topic to let subscribers know that settings[key] was changed
+        if QObject is not None:
+            self.notifier = SettingsNotifier()
+            self.settings_updated = self.notifier.settings_updated
+        else:
+            self.notifier = None
+            self.settings_updated = Topic("settings_updated")
+
         # Get the application configuration path
-        self.config_path = QStandardPaths.writableLocation(QStandardPaths.AppConfigLocation)
+        self.config_path = get_config_dir()
         os.makedirs(self.config_path, exist_ok=True)  # Create the directory if it doesn't exist
 
         self.filename = os.path.join(self.config_path, self.FILENAME)
@@ -72,8 +90,11 @@ class ConfigurationManager(QObject):
                 json.dump(self.settings, file, indent=4)
 
         if emit and key is not None:
-            # Emit in a thread-safe way
-            QMetaObject.invokeMethod(self, "settings_updated", Qt.QueuedConnection, Q_ARG(str, key))
+            if self.notifier is not None:
+                # Emit in a thread-safe way
+                QMetaObject.invokeMethod(self.notifier, "settings_updated", Qt.QueuedConnection, Q_ARG(str, key))
+            else:
+                self.settings_updated.emit(key)
 
     @staticmethod
     def get_default_settings():
@@ -1,13 +1,15 @@
 # General utility imports
 from icarus_v2.backend.logger import Logger
-from PySide6.QtCore import Signal, QThread
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from PySide6.QtCore import Signal, QThread, Qt
 from time import sleep
 from threading import Lock
 from icarus_v2.utils.udev_setup import setup_udev_rules
 from icarus_v2.utils.raw_log_reader import RawLogReader
-from pathlib import Path
+from icarus_v2.utils.synthetic_device import SyntheticPressureDevice
 # Data collection & Device imports
 from icarus_v2.backend.dataq_interface import DataqInterface
+from icarus_v2.backend.device_watcher import DeviceWatcher
 from icarus_v2.backend.buffer_loader import BufferLoader
 from icarus_v2.backend.pulse_generator import PulseGenerator
 from icarus_v2.backend.event import Event
@@ -18,8 +20,16 @@ from icarus_v2.backend.period_handler import PeriodHandler
 from icarus_v2.backend.pressure_handler import PressureHandler
 from icarus_v2.backend.pump_handler import PumpHandler
 from icarus_v2.backend.log_handler import LogHandler
+from icarus_v2.backend.valve_calibrator import ValveCalibrator
 from icarus_v2.backend.sentry import Sentry
+from icarus_v2.backend.interlock import Interlock
 from icarus_v2.backend.sample_sensor_detector import SampleSensorDetector
+from icarus_v2.backend.qt_adapter import forward
+from icarus_v2.backend.metrics import (
+    MetricsRegistry, collect_loader, collect_handlers, collect_logger, collect_device, collect_pulse_generator,
+    collect_valve_calibrator
+)
+from icarus_v2.backend.runtime_profile import GCController, collect_runtime_profile
 
 
 # Define the DataHandler class
@@ -36,16 +46,22 @@ class DataHandler(QThread):
     display_error = Signal(str)
     # Show warning or error in toolbar
     toolbar_warning = Signal(str,str)
-    # Signal to tell device control panel to shut down
-    # Ideally this is unnecessary as the signal should be directly sent to the pulse_generator
-    # But currently the control panel can not check the state of the device. This is a workaround.
+    # Emitted once the interlock has acted on a sentry error, so the device control panel can follow the device
     shutdown_signal = Signal()
     # Start new log file
     log_signal = Signal(bool)
     # Tell GUI whether the sample sensor is connected
     sample_sensor_connected = Signal(bool)
-
-    def __init__(self):
+    # Valve latency and width error estimates
+    calibration_signal = Signal(dict)
+    # Emitted by the loader thread. Handled in the thread of this object so that the loader can be waited for.
+    loader_disconnected = Signal()
+
+    # raw_file: TESTING ONLY. Plays back a raw data file instead of connecting to a device
+    # usb_backend: pyusb backend used to find the device, e.g. an emulated DI-4108. None uses the system default.
+    # synthetic: TESTING ONLY. Uses a simulated pressure device instead of connecting to a device
+    # shared_memory: keeps the buffer in shared memory so that other processes can read it
+    def __init__(self, raw_file=None, usb_backend=None, synthetic=False, shared_memory=False):
         super().__init__()
 
         self.pulse_generator = PulseGenerator()
@@ -55,19 +71,18 @@ class DataHandler(QThread):
         self.logger = None
 
         # TESTING ONLY!!!. reads a raw data file instead of connecting to a device
-        # edit raw_file to change the playback to a different file
-        self.load_raw = False
-        if self.load_raw:
-            raw_file = "2.1_to_1.5kBar.xz"
-            project_root = Path(__file__).resolve().parents[3]
-            self.raw_file = project_root / 'logs' / 'raw' / raw_file
+        self.raw_file = raw_file
+        self.load_raw = raw_file is not None
+        self.usb_backend = usb_backend
+        self.synthetic = synthetic
 
         # Loads data from device into buffer
-        self.loader = BufferLoader()
-        self.loader.device_disconnected.connect(self.device_disconnected)
+        self.loader = BufferLoader(shared_memory=shared_memory)
+        forward(self.loader.device_disconnected, self.loader_disconnected)
+        self.loader_disconnected.connect(self.device_disconnected)
 
-        # Event handlers
-        sample_rate = 4000
+        # Event handlers. The sample rate is set once the device is known.
+        sample_rate = None
         event_update_hz = 30
         pressure_update_hz = 5
         event_display_bounds = (-10, 140)
@@ -99,16 +114,40 @@ class DataHandler(QThread):
             pressure_update_hz)
         self.pump_handler = PumpHandler(self.loader, self.pump_event_signal, sample_rate)
         self.log_handler = LogHandler(self.loader, self.log_signal, sample_rate, pressure_update_hz)
-
-        # Sentry
+        self.valve_calibrator = ValveCalibrator(
+            self.loader,
+            self.calibration_signal,
+            sample_rate,
+            event_update_hz,
+            self.pulse_generator.timing
+        )
+        self.pulse_generator.set_calibrator(self.valve_calibrator)
+        self.handlers = [
+            self.pressurize_handler,
+            self.depressurize_handler,
+            self.period_handler,
+            self.pressure_handler,
+            self.pump_handler,
+            self.log_handler,
+            self.valve_calibrator
+        ]
+        # Settings of the last device. Handlers keep running across a reconnect to a device with the same settings.
+        self.device_settings = None
+        # Waits for the device to be plugged in while disconnected
+        self.watcher = DeviceWatcher(usb_backend)
+
+        # Sentry. Runs in the handler threads rather than the GUI thread, so the interlock does not wait for the GUI.
         self.sentry = Sentry()
-        self.log_signal.connect(self.sentry.handle_experiment)
-        self.pump_event_signal.connect(self.sentry.handle_pump)
-        self.depressurize_event_signal.connect(self.sentry.handle_depressurize)
+        self.log_signal.connect(self.sentry.handle_experiment, Qt.DirectConnection)
+        self.pump_event_signal.connect(self.sentry.handle_pump, Qt.DirectConnection)
+        self.depressurize_event_signal.connect(self.sentry.handle_depressurize, Qt.DirectConnection)
+        # Connected first so that the safe state is written before anything else is done about an error
+        self.interlock = Interlock(self.pulse_generator)
+        self.sentry.error_signal.connect(self.interlock.trip)
+        self.interlock.tripped.connect(lambda x: self.shutdown_signal.emit())
         self.sentry.warning_signal.connect(lambda x: self.toolbar_warning.emit(str(x),"orange"))
         self.sentry.error_signal.connect(lambda x: self.toolbar_warning.emit(str(x),"red")) 
         self.sentry.error_signal.connect(lambda x: self.display_error.emit(str(x))) 
-        self.sentry.error_signal.connect(lambda x: self.shutdown_signal.emit())
 
         # Logger
         if not self.load_raw:
@@ -125,6 +164,10 @@ class DataHandler(QThread):
             self.sentry.warning_signal.connect(self.logger.log_error)
             self.sentry.error_signal.connect(self.logger.log_error)
 
+        # Defers garbage collection during experiments if set in runtime_settings
+        self.gc_controller = GCController()
+        self.log_signal.connect(self.gc_controller.set_log_bit)
+
         # Sample sensor detector
         self.sample_sensor_detector = SampleSensorDetector(self.sample_sensor_connected)
         self.depressurize_event_signal.connect(self.sample_sensor_detector.detect)
@@ -133,35 +176,48 @@ class DataHandler(QThread):
         # Without this, the cleanup code would run and then the QThreads would be initialized.
         self.quit_lock = Lock()
 
+        self.remove_collector = MetricsRegistry().add_collector(self.collect_metrics)
+
         self.acquiring_signal.emit(False)
 
     # Connect to a device
     def run(self):
         self.connecting = True
+        self.watcher.reset()
         self.quit_lock.acquire()
         udev_installed = False
 
         while self.connecting:
 
             # TESTING ONLY
-            if self.load_raw:
-                self.device = RawLogReader(self.raw_file)
+            if self.load_raw or self.synthetic:
+                if self.load_raw:
+                    self.device = RawLogReader(self.raw_file)
+                else:
+                    settings = ConfigurationManager().get_settings('acquisition_settings')
+                    sample_rate = 60000000 / (settings['srate'] * settings['dec'])
+                    self.device = SyntheticPressureDevice(sample_rate=sample_rate, scan_list=settings.get('scan_list'))
                 self.connecting = False
                 self.connected = True
                 break
 
             try:
-                self.device = DataqInterface()
+                self.device = DataqInterface(backend=self.usb_backend)
                 self.connecting = False
                 self.connected = True
             except Exception as e:
                 # Continue connecting
-                if (
-                        "USB device not found" in str(e) or
+                if "USB device not found" in str(e) or "No backend available" in str(e):
+                    # Wait for the device to be plugged in rather than trying to set it up repeatedly
+                    self.quit_lock.release()
+                    self.watcher.wait_for_device()
+                    if not self.connecting:
+                        return
+                    self.quit_lock.acquire()
+                elif (
                         "No such device (it may have been disconnected)" in str(e) or
                         "Operation timed out" in str(e) or
-                        "Input/Output Error" in str(e) or
-                        "No backend available" in str(e)
+                        "Input/Output Error" in str(e)
                         ):
                     self.quit_lock.release()
                     sleep(0.5)
@@ -182,15 +238,29 @@ class DataHandler(QThread):
                     break
 
         if self.device is not None:
+            # Handlers still running from before a disconnect carry on reading the same buffer.
+            # Otherwise, they are restarted with new readers, since the buffer may be reallocated.
+            # They are stopped before the loader gets the device, as a shared buffer is freed when reallocated.
+            device_settings = self.device.get_device_settings()
+            restart = device_settings != self.device_settings or not all(handler.isRunning() for handler in self.handlers)
+            if restart:
+                for handler in self.handlers:
+                    handler.quit()
+                for handler in self.handlers:
+                    handler.wait()
+
             self.loader.set_device(self.device)
             self.pulse_generator.set_device(self.device)
+            if self.logger is not None:
+                self.logger.set_device_settings(device_settings)
+
+            if restart:
+                for handler in self.handlers:
+                    handler.set_sample_rate(self.device.sample_rate)
+                    handler.set_scan_list(self.device.scan_list)
+                    handler.start()
+            self.device_settings = device_settings
 
-            self.pressurize_handler.start()
-            self.depressurize_handler.start()
-            self.period_handler.start()
-            self.pressure_handler.start()
-            self.pump_handler.start()
-            self.log_handler.start()
             self.loader.start()
 
             self.acquiring_signal.emit(True)
@@ -200,25 +270,52 @@ class DataHandler(QThread):
         # Start event loop so that signals sent to this thread may be processed
         self.exec()
 
+    # Waits for the device to be plugged in again. Handlers and the buffer are kept, so only the device is replaced.
     def device_disconnected(self):
         self.connected = False
-        self.quit()
-
-        # Reset persistent states
-        self.pressurize_handler.last_pressurize_bit = None
-        self.depressurize_handler.last_depressurize_bit = None
-        self.period_handler.last_depressurize_bit = None
-        self.period_handler.last_depressurize_event = None
-        self.log_handler.last_log_bit = None
-        self.sample_sensor_detector.last_result = True
-        self.pump_handler.reset()
+        self.acquiring_signal.emit(False)
+        self.pulse_generator.quit()
+        self.pulse_generator.wait()
+        self.loader.wait()
+        if self.device is not None:
+            # A lost device may come back with its power-on configuration at the same address
+            if isinstance(self.device, DataqInterface):
+                self.device.forget_configuration()
+            self.device.close_device()
+        if self.logger is not None:
+            self.logger.close()
+
+        # Stop this thread's event loop so that it can be started again
+        super().quit()
+        self.wait()
+
+        # Reset persistent states. Handlers may still be processing a chunk, so each resets itself before its next one.
+        for handler in self.handlers:
+            handler.request_reset()
+        self.sample_sensor_detector.request_reset()
         self.sentry.reset()
 
         # Try to reconnect to device
         self.start()
 
+    # Samples of the metrics registry. Read from whichever thread collects them.
+    def collect_metrics(self):
+        samples = collect_loader(self.loader) + collect_handlers(self.handlers)
+        if self.logger is not None:
+            samples += collect_logger(self.logger, "events")
+        device = self.device
+        if device is not None:
+            samples += collect_device(device)
+        samples += collect_pulse_generator(self.pulse_generator)
+        samples += collect_valve_calibrator(self.valve_calibrator)
+        samples += collect_runtime_profile()
+        return samples
+
     def quit(self):
+        self.remove_collector()
+        self.gc_controller.close()
         self.connecting = False
+        self.watcher.stop()
         acquired = self.quit_lock.acquire(timeout=10)
 
         if self.logger is not None:
@@ -226,20 +323,12 @@ class DataHandler(QThread):
 
         self.acquiring_signal.emit(False)
         # Cleanup QThreads
-        self.pressurize_handler.quit()
-        self.depressurize_handler.quit()
-        self.period_handler.quit()
-        self.pressure_handler.quit()
-        self.pump_handler.quit()
-        self.log_handler.quit()
+        for handler in self.handlers:
+            handler.quit()
         self.pulse_generator.quit()
 
-        self.pressurize_handler.wait()
-        self.depressurize_handler.wait()
-        self.period_handler.wait()
-        self.pressure_handler.wait()
-        self.pump_handler.wait()
-        self.log_handler.wait()
+        for handler in self.handlers:
+            handler.wait()
         self.pulse_generator.wait()
 
         if self.connected:
@@ -257,8 +346,10 @@ class DataHandler(QThread):
 
         self.loader.quit()
         self.loader.wait()
+        self.loader.release()
 
         super().quit()
         self.wait()
+        self.watcher.close()
         if acquired:
             self.quit_lock.release()
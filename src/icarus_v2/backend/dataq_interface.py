@@ -1,22 +1,42 @@
 import usb.core
 from array import array
 from threading import Lock
+from time import perf_counter
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.command_scheduler import CommandScheduler
+from icarus_v2.backend.event import FULL_SCAN_LIST, SCAN_PROFILES
 
 
 # Device information
 DI_4108_VENDOR_ID = 0x0683
 DI_4108_PRODUCT_ID = 0x4108
+# Highest sample rate (Hz) summed over all channels in the scan list
+DI_4108_MAX_THROUGHPUT = 200000
+# Analog channels that event detection and statistics can not work without
+REQUIRED_CHANNELS = SCAN_PROFILES["Pressure Only"]
 
 
 # Interface to the Di4108 USB device, capable of reading from its DIO and Analog channels and sending instructions.
+# Commands are written by a single CommandScheduler thread, whichever thread sends them. Data is read by the caller.
 class DataqInterface:
-    def __init__(self) -> None:
+    # Configuration commands last sent to each device, by (bus, address), while the device is known to have kept them.
+    # A device gets a new address whenever it is plugged in. A device power-cycled without being enumerated again keeps
+    # its address, so the entry is also forgotten whenever the device is lost, e.g. by a read failing.
+    configuration_cache = {}
+
+    def __init__(self, backend=None) -> None:
         """
         Initializes a DataqInterface object and sets up device for reading.
+
+        :param backend: pyusb backend used to find the device. None uses the system default.
         """
+        self.backend = backend
         self.stop_lock = Lock()  # Used to make sure you do not stop the device while reading
 
         self.device = None
+        self.srate = None
+        self.dec = None
+        self.scan_list = None
         self.endpoint_out = None
         self.endpoint_in = None
         self.usb_buff = None
@@ -24,11 +44,20 @@ class DataqInterface:
         self.points_to_read = None
         self.channels_to_read = None
         self.bytes_to_read = None
+        self.packet_bytes = None
         self.current_dio = None
         self.acquiring = None
+        self.setup_metrics = {}
+        self.dio_lock = Lock()  # Keeps current_dio in the same order as dout commands are queued
+        self.scheduler = CommandScheduler(self._write_cmd)
 
         self.find_device()
-        self.setup_device()
+        self.scheduler.start()
+        try:
+            self.setup_device()
+        except Exception:
+            self.scheduler.stop()
+            raise
 
     def find_device(self):
         """
@@ -38,7 +67,7 @@ class DataqInterface:
         """
         try:
             # Find the USB device
-            self.device = usb.core.find(idVendor=DI_4108_VENDOR_ID, idProduct=DI_4108_PRODUCT_ID)
+            self.device = usb.core.find(idVendor=DI_4108_VENDOR_ID, idProduct=DI_4108_PRODUCT_ID, backend=self.backend)
             if self.device is None:
                 raise RuntimeError("USB device not found. Please ensure the device is connected.")
             else:
@@ -60,8 +89,18 @@ class DataqInterface:
                 raise RuntimeError(e)
 
     def setup_device(self):
+        start_time = perf_counter()
+        configuration = self.get_configuration()
+
+        # The cached configuration is dropped until this one is known to be good
+        identity = (self.device.bus, self.device.address)
+        cached = DataqInterface.configuration_cache.pop(identity, None)
+        # Entries can not be removed from the scan list, so a device with a different one is set up from scratch
+        reuse = cached is not None and get_scan_commands(cached) == get_scan_commands(configuration)
+
         # Reinitialize device
-        self.device.reset()
+        if not reuse:
+            self.device.reset()
         # Set the first configuration as active
         self.device.set_configuration()
 
@@ -80,42 +119,116 @@ class DataqInterface:
 
         # Stop in case device was left running
         self.stop()
-        # Set all dio ports to switches
-        self.send_cmd("endo 127")
-        # Define binary output mode
-        self.send_cmd("encode 0")
-        # Set packet size = 1024 bytes
-        self.send_cmd("ps 6")
-        # Set all channels to CIC filtering
-        self.send_cmd("filter * 1")
+
+        # Only commands which change the configuration of the device are sent
+        commands = [command for key, command in configuration.items() if not reuse or cached.get(key) != command]
+        if self.send_batch(commands):
+            DataqInterface.configuration_cache[identity] = configuration
+
+        self.setup_metrics = {
+            "setup_ms": 1000 * (perf_counter() - start_time),
+            "commands_sent": len(commands),
+            "commands_skipped": len(configuration) - len(commands),
+            "reset": not reuse,
+        }
+
+    # Returns the configuration commands for the acquisition settings, by what they set, in the order to send them.
+    # Also sets the scan list, sample rate and sizes of reads.
+    # Raises ValueError if the settings can not be used.
+    def get_configuration(self):
+        configuration = {
+            # Set all dio ports to switches
+            "endo": "endo 127",
+            # Define binary output mode
+            "encode": "encode 0",
+            # Set packet size = 1024 bytes
+            "ps": "ps 6",
+            # Set all channels to CIC filtering
+            "filter": "filter * 1",
+        }
+        self.packet_bytes = 1024
+
+        settings = ConfigurationManager().get_settings('acquisition_settings')
 
         # Set slist which is order of channels to sample. See device protocol for more info.
-        # This is A0-A6 at +-10V, Digital
-        slist = ["0 0", "1 1", "2 2", "3 3", "4 4", "5 5", "6 6", "7 8"]
-        for i in slist:
-            self.send_cmd("slist " + i)
+        # This is the analog channels of the scan list at +-10V, then Digital.
+        # Leaving out unused channels allows a higher sample rate on the rest.
+        self.scan_list = [int(channel) for channel in settings.get('scan_list', FULL_SCAN_LIST)]
+        for channel in REQUIRED_CHANNELS:
+            if channel not in self.scan_list:
+                raise ValueError(f"Scan list must include analog channel {channel}.")
+        slist = [f"{i} {channel}" for i, channel in enumerate(self.scan_list)]
+        slist.append(f"{len(self.scan_list)} 8")
+        for i, entry in enumerate(slist):
+            configuration[f"slist {i}"] = "slist " + entry
 
         # Sample rate (Hz) = 60,000,000 / (srate * dec * deca)
         # Device reports 1 value per (dec * deca) readings. (default is by CIC filtering)
-        srate = 3000
-        dec = 5
-        self.sample_rate = 60000000 / (srate * dec)
-        self.send_cmd('srate ' + str(srate))
-        self.send_cmd('dec ' + str(dec))
+        self.srate = int(settings['srate'])
+        self.dec = int(settings['dec'])
+        self.sample_rate = 60000000 / (self.srate * self.dec)
+        if self.sample_rate * len(slist) > DI_4108_MAX_THROUGHPUT:
+            raise ValueError(f"Sample rate of {self.sample_rate:.0f} Hz on {len(slist)} channels exceeds the device "
+                             f"limit of {DI_4108_MAX_THROUGHPUT} Hz. Increase srate or dec, or scan fewer channels.")
+        configuration["srate"] = 'srate ' + str(self.srate)
+        configuration["dec"] = 'dec ' + str(self.dec)
 
         # Calculate number of bytes to read
         self.points_to_read = 64
         self.channels_to_read = len(slist)
         # 2 bytes per channel
         self.bytes_to_read = self.channels_to_read * 2 * self.points_to_read
+        return configuration
 
-    def send_cmd(self, command, check_echo=True):
+    def send_cmd(self, command, check_echo=True, priority=CommandScheduler.CONFIG):
         """
-        Sends a command to the USB device.
+        Sends a command to the USB device and waits until it has been written.
 
         :param command: The command to be sent.
         :param check_echo: Whether to compare the return of the device. Do not use while acquiring data.
+        :param priority: CommandScheduler priority. Commands with a lower value are written first.
+        :return: perf_counter() time at which the command was written.
+        """
+        return self.scheduler.submit(command, priority, check_echo).written
+
+    def send_batch(self, commands, check_echo=True, priority=CommandScheduler.CONFIG):
         """
+        Sends commands back to back and then checks their echoes, rather than waiting for each echo in turn.
+
+        :param commands: The commands to be sent, in order.
+        :param check_echo: Whether to compare the return of the device. Do not use while acquiring data.
+        :param priority: CommandScheduler priority. Commands with a lower value are written first.
+        :return: True if every echo matched its command or echoes were not checked.
+        """
+        if len(commands) == 0:
+            return True
+        scheduled = self.scheduler.submit(commands, priority, check_echo, write=self._write_batch)
+        return scheduled.result
+
+    # Writes a batch of commands sent with send_batch. Called by the scheduler.
+    # Echoes are read as they arrive. The device may return several in one read.
+    def _write_batch(self, commands, check_echo):
+        for command in commands:
+            self.device.write(self.endpoint_out, (command+'\r').encode('utf-8'))
+        if self.acquiring:
+            return True
+
+        received = ""
+        while received.count('\r') < len(commands):
+            response = self.read()
+            received += bytes(response).decode('utf-8', errors='ignore').replace('\0', '')
+        responses = received.split('\r')
+
+        matched = True
+        for command, response in zip(commands, responses):
+            if check_echo and response != command:
+                print(f"Error sending command: Response \"{command}\"" +
+                      f"expected but \"{response.strip()}\" received.")
+                matched = False
+        return matched
+
+    # Writes a command sent with send_cmd. Called by the scheduler.
+    def _write_cmd(self, command, check_echo):
         self.device.write(self.endpoint_out, (command+'\r').encode('utf-8'))
 
         # Expect a response unless the device is currently reading
@@ -136,9 +249,13 @@ class DataqInterface:
 
         :param value: States to set.
         :param check_echo: Whether to compare the return of the device. Do not use while acquiring data.
+        :return: perf_counter() time at which the new state was written.
         """
-        self.current_dio = int(value)
-        self.send_cmd("dout " + str(int(value)), check_echo=check_echo)
+        # Valve commands are written ahead of any queued configuration
+        with self.dio_lock:
+            self.current_dio = int(value)
+            scheduled = self.scheduler.submit("dout " + str(int(value)), CommandScheduler.VALVE, check_echo, wait=False)
+        return self.scheduler.wait(scheduled)
 
     def read(self, size=None, timeout=2000):
         if size is None:
@@ -152,14 +269,21 @@ class DataqInterface:
         # Start reading
         self.acquiring = True
 
-        self.send_cmd('start', check_echo=False)
+        self.send_cmd('start', check_echo=False, priority=CommandScheduler.CONTROL)
 
     def end_scan(self):
         if self.stop_lock.locked():
             self.stop_lock.release()
 
-    def read_data(self):
-        data = self.read(self.bytes_to_read)
+    # size is the number of bytes to read. Defaults to bytes_to_read.
+    # Reads need not end on a sample boundary, but should be a multiple of packet_bytes.
+    def read_data(self, size=None):
+        try:
+            data = self.read(self.bytes_to_read if size is None else size)
+        except usb.core.USBError as e:
+            # The device may have been unplugged, losing its configuration
+            self.forget_configuration()
+            raise e
         if data is None:
             return None
 
@@ -171,10 +295,16 @@ class DataqInterface:
 
         return data
 
+    # The next setup of this device sends every command, e.g. once it has been lost and may have been power-cycled
+    def forget_configuration(self):
+        if self.device is not None:
+            DataqInterface.configuration_cache.pop((self.device.bus, self.device.address), None)
+
     def close_device(self):
         """
-        Closes the USB device.
+        Closes the USB device. Commands sent after this are written from the calling thread.
         """
+        self.scheduler.stop()
         if self.device is not None:
             usb.util.dispose_resources(self.device)
 
@@ -185,9 +315,37 @@ class DataqInterface:
         """
         self.acquiring = False # Signals to stop acquiring
         with self.stop_lock:
-            self.send_cmd("stop", check_echo=False)
+            self.send_cmd("stop", check_echo=False, priority=CommandScheduler.CONTROL)
         # Turn all valves off
         self.set_dio(0b1111111, check_echo=False)
 
     def get_current_dio(self):
         return self.current_dio
+
+    # Duration of the last setup and the number of configuration commands sent and skipped
+    def get_setup_metrics(self):
+        return self.setup_metrics
+
+    # Queue length and latency from sending to writing commands, by priority
+    def get_command_metrics(self):
+        return self.scheduler.get_metrics()
+
+    # Settings needed to interpret the data. Written to the header of logs.
+    def get_device_settings(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "srate": self.srate,
+            "dec": self.dec,
+            "channels": self.channels_to_read,
+            "points": self.points_to_read,
+            "scan_list": self.scan_list,
+        }
+
+
+# The slist commands of a configuration
+def get_scan_commands(configuration):
+    scan_commands = {}
+    for key, command in configuration.items():
+        if key.startswith("slist"):
+            scan_commands[key] = command
+    return scan_commands
@@ -12,6 +12,10 @@ class DepressurizeHandler(EventHandler):
         self.event_type = Event.DEPRESSURIZE
 
 
+    def reset(self):
+        self.last_depressurize_bit = None
+
+
     # Data: one chunk from the reader
     # Returns whether an event occurs and the index of the event
     def detect_event(self, data):
@@ -0,0 +1,95 @@
+from threading import Event
+import usb.core
+from icarus_v2.backend.dataq_interface import DI_4108_VENDOR_ID, DI_4108_PRODUCT_ID
+
+# python-libusb1 is only needed for hot-plug notifications. Without it the bus is polled.
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+
+# Seconds between checks for the device when hot-plug notifications are not available
+POLL_INTERVAL = 0.25
+# Seconds between handling libusb events, so that stop() is noticed
+HOTPLUG_TIMEOUT = 0.25
+
+
+# Waits for a DI-4108 to be plugged in, without setting it up.
+# Uses libusb hot-plug notifications where python-libusb1 is installed and the platform supports them.
+# Otherwise, or when a pyusb backend is given, e.g. an emulator, the bus is enumerated every POLL_INTERVAL.
+class DeviceWatcher:
+    def __init__(self, backend=None) -> None:
+        self.backend = backend
+        self.stopped = Event()
+        self.context = None
+        self.arrived = False
+
+        if backend is None and usb1 is not None:
+            try:
+                context = usb1.USBContext()
+                if context.hasCapability(usb1.CAP_HAS_HOTPLUG):
+                    context.hotplugRegisterCallback(
+                        self.hotplug_callback,
+                        events=usb1.HOTPLUG_EVENT_DEVICE_ARRIVED,
+                        vendor_id=DI_4108_VENDOR_ID,
+                        product_id=DI_4108_PRODUCT_ID,
+                    )
+                    self.context = context
+                else:
+                    context.close()
+            except usb1.USBError:
+                self.context = None
+
+
+    def uses_hotplug(self):
+        return self.context is not None
+
+
+    def hotplug_callback(self, context, device, event):
+        self.arrived = True
+        # Keep the callback registered
+        return False
+
+
+    def is_present(self):
+        try:
+            return usb.core.find(idVendor=DI_4108_VENDOR_ID, idProduct=DI_4108_PRODUCT_ID, backend=self.backend) is not None
+        except (usb.core.USBError, usb.core.NoBackendError):
+            return False
+
+
+    # Blocks until the device is present. Returns False if stop() has been called.
+    def wait_for_device(self):
+        self.arrived = False
+        # The device may have been plugged in before the callback was registered or while it was not being handled
+        if self.is_present():
+            return True
+
+        while not self.stopped.is_set():
+            if self.context is not None:
+                self.context.handleEventsTimeout(tv=HOTPLUG_TIMEOUT)
+                if self.arrived:
+                    return True
+            elif self.stopped.wait(POLL_INTERVAL):
+                break
+            elif self.is_present():
+                return True
+        return False
+
+
+    # Wakes wait_for_device from another thread
+    def stop(self):
+        self.stopped.set()
+
+
+    # Allows waiting again after stop()
+    def reset(self):
+        self.stopped.clear()
+
+
+    def close(self):
+        self.stop()
+        if self.context is not None:
+            self.context.close()
+            self.context = None
@@ -61,15 +61,29 @@ class HistStat(Enum):
         return self.value
 
 
+# Analog channels sampled by the device, in scan order. Digital inputs are always sampled after them.
+FULL_SCAN_LIST = [0, 1, 2, 3, 4, 5, 6]
+# Scan lists selectable in settings. Leaving out channels allows a higher sample rate on the rest.
+SCAN_PROFILES = {
+    "All Channels": FULL_SCAN_LIST,
+    "Pressure Only": [Channel.TARGET.value, Channel.HI_PRE_ORIG.value, Channel.HI_PRE_SAMPLE.value],
+}
+
+
 # Returns a view of the selected channel
 # Can be used on data that has not been wrapped in an event
-def get_channel(data, channel):
+# scan_list is the analog channel of each column of data. None if data has all channels in order, as events do.
+def get_channel(data, channel, scan_list=None):
     if isinstance(data, Event):
         data = data.data
     if channel.value <= 6:
-        return data[:,channel.value]
+        if scan_list is None:
+            return data[:,channel.value]
+        if channel.value not in scan_list:
+            raise ValueError(f"{channel} is not in the scan list.")
+        return data[:,scan_list.index(channel.value)]
     else:
-        digital = 7
+        digital = -1 # Digital inputs are always the last column
         bit = 1 << (channel.value - 7)
         if data[:,digital].dtype != np.int16:
             data = data.astype(np.int16)
@@ -77,6 +91,17 @@ def get_channel(data, channel):
         return channel_data.astype(np.bool_)
 
 
+# Returns data sampled with scan_list with all channels in order.
+# Channels which were not sampled are 0.
+def expand_channels(data, scan_list):
+    if scan_list is None or list(scan_list) == FULL_SCAN_LIST:
+        return data
+    expanded = np.zeros((data.shape[0], len(FULL_SCAN_LIST) + 1), dtype=data.dtype)
+    expanded[:,scan_list] = data[:,:-1]
+    expanded[:,-1] = data[:,-1]
+    return expanded
+
+
 # Used for ramp detection
 def gaussian_filter(data, kernel_size, sigma=1):
     """Applies a 1D Gaussian filter to the data."""
@@ -99,18 +124,24 @@ class Event:
     PRESSURE = 3
     PUMP = 4
 
-    def __init__(self, event_type, data, event_index = None, event_time=None, step_time = None) -> None:
+    # clock is used to get the current time for new events. May be replaced by a simulated sample clock.
+    # sample_rate (Hz) of data is required for new events. Deserialized events already have event_time and step_time.
+    # scan_list is the analog channel of each column of data. Events always store all channels.
+    def __init__(self, event_type, data, event_index = None, event_time=None, step_time = None, clock=time, sample_rate=None, scan_list=None) -> None:
         if type(event_type) == int and 4 >= event_type >= 0:
             self.event_type = event_type
         else:
             raise RuntimeError(event_type + "event not supported.")
 
         if event_time is None:
-            self.event_time = time()
+            if sample_rate is None:
+                raise RuntimeError("sample_rate is required to create a new event.")
+            # clock is the time of the last sample of data
+            self.event_time = clock()
             if data is not None:
-                self.event_time -= data.shape[1] / 4000 # Assumes srate = 4000. 
+                self.event_time -= data.shape[0] / sample_rate
             if event_index is not None:
-                self.event_time += event_index / 4000
+                self.event_time += event_index / sample_rate
         # Case where this is a priorly generated event being deserialized
         else:
             self.event_time = event_time
@@ -118,10 +149,13 @@ class Event:
         # Required for some math
         self.event_index = event_index # index where the actual event occured uint8
         if step_time is None and event_index is not None:
-            self.step_time = 1 / 4 # Assumes srate = 4000. step_time is in ms.
+            self.step_time = 1000 / sample_rate # step_time is in ms.
         else:
             self.step_time = step_time
 
+        if scan_list is not None and data is not None:
+            data = expand_channels(data, scan_list)
+
         # Period events can be long. Therefore, only take 600 data points to log and plot. (same as pressurize and depressurize plots)
         # No statistical analysis of period events is necessary, so this loss of data is fine.
         # If initialized with a step time, this means the data has already been compressed.
@@ -130,6 +164,9 @@ class Event:
         else:
             self.data = data # np.ndarray (?,8) np.int16
 
+        # Trace of new events through the pipeline, set by the handler that detected it. Not logged.
+        self.trace = None
+
     # used to call all info functions
     def get_event_info(self, hist_stat):
         match hist_stat:
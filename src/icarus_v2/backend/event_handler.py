@@ -1,44 +1,134 @@
-from PySide6.QtCore import QThread
 import traceback
+from time import time, perf_counter
 from icarus_v2.backend.event import Event
+from icarus_v2.backend.worker import Worker
+from icarus_v2.backend.tracing import Trace
 
-class EventHandler(QThread):
+# Detects one type of event in the data of the loader, reading it from its own thread.
+# signal may be a Qt Signal or a Topic. It is emitted from the thread of the handler.
+class EventHandler(Worker):
+    # sample_rate may be None if the device is not known yet. set_sample_rate must then be called before running.
     def __init__(self, loader, signal, sample_rate, update_rate) -> None:
         super().__init__()
-        self.reader = loader.new_reader()
+        self.loader = loader
+        self.reader = None
         self.signal = signal
-        self.sample_rate = sample_rate
+        self.sample_rate = None
+        self.scan_list = None # Analog channels in the buffer. None if all channels are sampled.
         self.update_rate = update_rate
         self.running = False
+        # Source of the current time for new events. Replaced by a simulated sample clock when reprocessing raw logs.
+        self.clock = time
+        # Seconds to wait for data after an event to arrive
+        self.data_timeout = 2
+        # Metrics. Dropped events were detected but not emitted.
+        self.events_emitted = 0
+        self.events_dropped = 0
+        # Index after the last sample returned by get_event_data, used to trace events
+        self.event_end = None
+        # Set by request_reset. The state is reset by the thread of the handler before its next chunk.
+        self.reset_requested = False
+        if sample_rate is not None:
+            self.set_sample_rate(sample_rate)
+
+
+    # Called once the loader has a device. Starts reading from the newest data in the loader's buffer.
+    def set_sample_rate(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.reader = self.loader.new_reader()
+
+
+    # Analog channel of each column of the buffer, from the device
+    def set_scan_list(self, scan_list):
+        self.scan_list = scan_list
 
 
     # Loops to transmit data if an event occurs
+    # Keeps waiting while no data arrives, e.g. while the device is reconnected, until quit is called.
     def run(self):
         self.running = True
         while self.running:
-            data_to_get = int(self.sample_rate / self.update_rate)
             try:
-                data, buffer_index = self.reader.read(size=data_to_get, timeout=1)
+                data, buffer_index = self.reader.read(size=self.get_chunk_size(), timeout=1)
             except TimeoutError:
-                self.running = False
-                break
-            try:
-                event, chunk_index = self.detect_event(data)
-            except RuntimeWarning:
-                # Case where 2 events occur in same chunk
-                traceback.print_exc()
-                event, chunk_index = False, -1
+                continue
+            self.apply_reset()
+            self.process_chunk(data, buffer_index)
+
+
+    # Processes every chunk in the buffer that has enough data after it to handle an event, without waiting.
+    # Used to drive the handler synchronously rather than from run().
+    # If final, chunks are processed even if the data after them is not available.
+    def process_available(self, final=False):
+        size = self.get_chunk_size()
+        lookahead = 0 if final else self.get_lookahead()
+        while self.reader.read_index + size + lookahead <= self.reader.buffer.write_index:
+            data, buffer_index = self.reader.read(size=size, timeout=0)
+            self.apply_reset()
+            self.process_chunk(data, buffer_index)
+
+
+    # Asks the handler to forget the state carried between chunks, e.g. after a reconnect. May be called from any thread.
+    # The state is reset before the next chunk rather than while one is being processed.
+    def request_reset(self):
+        self.reset_requested = True
+
 
-            # buffer_index is the index that the chunk started in in the buffer
-            # chunk index is the index that the event started in in that chunk
-            event_index = buffer_index + chunk_index
+    def apply_reset(self):
+        if self.reset_requested:
+            self.reset_requested = False
+            self.reset()
 
-            # If an event occurs, transmit data to plot
-            if event:
-                event_data, event_start = self.handle_event(event_index)
-                if event_data is not None:
-                    new_event = Event(self.event_type, event_data, event_start)
-                    self.signal.emit(new_event)
+
+    # Placeholder. Clears the state carried between chunks. Called from the thread of the handler.
+    def reset(self):
+        return
+
+
+    # Number of samples read at once
+    def get_chunk_size(self):
+        return int(self.sample_rate / self.update_rate)
+
+
+    # Number of samples after a chunk that may be needed to handle an event in it
+    def get_lookahead(self):
+        if not hasattr(self, 'event_report_range'):
+            return 0
+        sample_rate_kHz = float(self.sample_rate) / 1000
+        return max(0, int(self.event_report_range[1] * sample_rate_kHz))
+
+
+    # Detects and transmits events in one chunk
+    # buffer_index is the index that the chunk started in in the buffer
+    def process_chunk(self, data, buffer_index):
+        try:
+            event, chunk_index = self.detect_event(data)
+        except RuntimeWarning:
+            # Case where 2 events occur in same chunk
+            traceback.print_exc()
+            event, chunk_index = False, -1
+            self.events_dropped += 1
+
+        # chunk index is the index that the event started in in that chunk
+        event_index = buffer_index + chunk_index
+
+        # If an event occurs, transmit data to plot
+        if event:
+            event_data, event_start = self.handle_event(event_index)
+            if event_data is not None:
+                new_event = Event(self.event_type, event_data, event_start, clock=self.clock, sample_rate=self.sample_rate,
+                                  scan_list=self.scan_list)
+                self.trace(new_event, self.event_end - 1)
+                self.events_emitted += 1
+                self.signal.emit(new_event)
+            else:
+                self.events_dropped += 1
+
+
+    # Tags a new event with the acquisition and read times of its last sample, at index in the buffer
+    def trace(self, event, index):
+        event.trace = Trace(event.event_type, index, self.loader.get_sample_time(index), self.loader.get_arrival(index),
+                            perf_counter())
 
 
     # Placeholder. 
@@ -72,10 +162,11 @@ class EventHandler(QThread):
 
         # Get data
         try:
-            data = self.reader.retrieve_range(start, end, timeout=2)
+            data = self.reader.retrieve_range(start, end, timeout=self.data_timeout)
         except TimeoutError:
             return None
 
+        self.event_end = end
         return data
 
 
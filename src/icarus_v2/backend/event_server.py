@@ -0,0 +1,431 @@
+import json
+import ipaddress
+import os
+import stat
+import socket
+import struct
+import threading
+from collections import deque
+from time import mktime
+import numpy as np
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.event import Event, Channel
+from icarus_v2.backend.worker import Worker
+
+
+# Address used by --stream without a value
+DEFAULT_ADDRESS = "127.0.0.1:8470"
+PROTOCOL_VERSION = 1
+
+# Topics which may be subscribed to, and the event type of those that carry events
+EVENT_TOPICS = {
+    "pressurize": Event.PRESSURIZE,
+    "depressurize": Event.DEPRESSURIZE,
+    "period": Event.PERIOD,
+    "pressure": Event.PRESSURE,
+    "pump": Event.PUMP,
+}
+ALERT_TOPICS = ["warning", "error"]
+TOPICS = list(EVENT_TOPICS) + ["log"] + ALERT_TOPICS
+
+# Policies for a subscriber whose queue is full
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+POLICIES = [DROP_OLDEST, DROP_NEWEST, DISCONNECT]
+
+# Frames are a header of the frame type and payload length, then the payload. All little-endian.
+FRAME_HEADER = struct.Struct("<BI")
+HELLO = 0       # json: protocol version and the accepted subscription
+EVENT = 1       # EVENT_HEADER, then rows x columns int16 samples if requested
+SUMMARY = 2     # SUMMARY_FORMAT of a pressure event sent without samples
+ALERT = 3       # json: topic, type, time and message of a sentry warning or error
+LOG = 4         # LOG_FORMAT: new state of the log bit
+DROPPED = 5     # DROPPED_FORMAT: frames dropped for this subscriber since the last DROPPED frame
+# event type, event time, event index (-1 if none), step time in ms (nan if none), rows, columns
+EVENT_HEADER = struct.Struct("<Bdqdii")
+# event time, target pressure, origin pressure. Pressures are scaled by plotting_coefficients.
+SUMMARY_FORMAT = struct.Struct("<ddd")
+LOG_FORMAT = struct.Struct("<?")
+DROPPED_FORMAT = struct.Struct("<I")
+
+# Seconds a client has to send its subscription, and between checks for close() while accepting
+HANDSHAKE_TIMEOUT = 5
+ACCEPT_TIMEOUT = 0.5
+
+
+# "host:port" or "port" is TCP. "unix:path" or a path containing "/" is a Unix socket.
+# Events are only served to this machine, so TCP hosts must be loopback addresses or localhost.
+def parse_address(address):
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if "/" in address:
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    host = host or "127.0.0.1"
+    if not is_loopback(host):
+        raise ValueError(f"{host} is not a loopback address. Events are only streamed to local clients.")
+    return socket.AF_INET, (host, int(port))
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def encode_frame(frame_type, payload):
+    return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+
+def encode_event(event, samples):
+    data = event.data
+    if samples and data is not None:
+        data = np.ascontiguousarray(data, dtype="<i2")
+        rows, columns = data.shape
+    else:
+        rows, columns = 0, 0
+    header = EVENT_HEADER.pack(
+        event.event_type,
+        event.event_time,
+        -1 if event.event_index is None else int(event.event_index),
+        float("nan") if event.step_time is None else event.step_time,
+        rows,
+        columns,
+    )
+    return encode_frame(EVENT, header + (data.tobytes() if rows > 0 else b""))
+
+
+def encode_summary(event, coefficients):
+    target = event.get_target_pressure() * coefficients[Channel.TARGET]
+    origin = event.get_origin_pressure() * coefficients[Channel.HI_PRE_ORIG]
+    return encode_frame(SUMMARY, SUMMARY_FORMAT.pack(event.event_time, target, origin))
+
+
+def encode_alert(topic, alert):
+    payload = {
+        "topic": topic,
+        "type": alert.error_type,
+        "time": mktime(alert.time),
+        "message": str(alert),
+    }
+    return encode_frame(ALERT, json.dumps(payload).encode("utf-8"))
+
+
+def encode_json(frame_type, value):
+    return encode_frame(frame_type, json.dumps(value).encode("utf-8"))
+
+
+# Reads one frame from a binary file, e.g. socket.makefile("rb"). Returns (frame type, payload), or None at the end.
+def read_frame(file):
+    header = file.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    frame_type, length = FRAME_HEADER.unpack(header)
+    payload = file.read(length)
+    if len(payload) < length:
+        return None
+    return frame_type, payload
+
+
+# Returns the Event, summary dict, alert dict, log bit, dropped count or hello dict in a frame payload
+def decode_frame(frame_type, payload):
+    if frame_type == HELLO or frame_type == ALERT:
+        return json.loads(payload)
+    if frame_type == EVENT:
+        event_type, event_time, event_index, step_time, rows, columns = EVENT_HEADER.unpack_from(payload)
+        data = None
+        if rows > 0:
+            data = np.frombuffer(payload, dtype="<i2", offset=EVENT_HEADER.size).reshape(rows, columns)
+        return Event(
+            event_type,
+            data,
+            event_index=None if event_index < 0 else event_index,
+            event_time=event_time,
+            step_time=None if np.isnan(step_time) else step_time,
+        )
+    if frame_type == SUMMARY:
+        event_time, target, origin = SUMMARY_FORMAT.unpack(payload)
+        return {"time": event_time, "target": target, "origin": origin}
+    if frame_type == LOG:
+        return LOG_FORMAT.unpack(payload)[0]
+    if frame_type == DROPPED:
+        return DROPPED_FORMAT.unpack(payload)[0]
+    raise ValueError(f"Unknown frame type {frame_type}.")
+
+
+# One client of an EventServer. The subscription is the first line the client sends, as json:
+#   topics      names from TOPICS. Default: all
+#   decimate    send every nth item of each topic, as an int or {topic: int}. Alerts and the log bit are never decimated.
+#   samples     include event samples. Without them, pressure events are sent as summaries. Default: false
+#   queue       frames waiting to be sent before the policy applies. Default: 256
+#   policy      drop_oldest (default), drop_newest or disconnect
+# Frames are queued by the publishing thread without blocking and sent from a thread of the subscriber,
+# so a slow client only ever delays itself.
+class Subscriber(Worker):
+    def __init__(self, server, connection, address) -> None:
+        super().__init__()
+        self.server = server
+        self.connection = connection
+        self.address = address
+        self.topics = set(TOPICS)
+        self.decimate = {}
+        self.counters = {}
+        self.samples = False
+        self.policy = DROP_OLDEST
+        self.frames = deque()
+        self.maxsize = 256
+        self.condition = threading.Condition()
+        self.closed = False
+
+        # Metrics
+        self.sent = 0
+        self.dropped = 0
+        self.unreported_drops = 0
+
+    def subscribe(self, request):
+        topics = request.get("topics", TOPICS)
+        unknown = [topic for topic in topics if topic not in TOPICS]
+        if len(unknown) > 0:
+            raise ValueError(f"Unknown topics {unknown}. Topics are {TOPICS}.")
+        policy = request.get("policy", DROP_OLDEST)
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy}. Policies are {POLICIES}.")
+
+        decimate = request.get("decimate", 1)
+        if isinstance(decimate, dict):
+            self.decimate = {topic: max(1, int(n)) for topic, n in decimate.items() if topic in EVENT_TOPICS}
+        else:
+            self.decimate = {topic: max(1, int(decimate)) for topic in EVENT_TOPICS}
+        self.topics = set(topics)
+        self.samples = bool(request.get("samples", False))
+        self.maxsize = max(1, int(request.get("queue", 256)))
+        self.policy = policy
+        return {
+            "version": PROTOCOL_VERSION,
+            "topics": sorted(self.topics),
+            "decimate": self.decimate,
+            "samples": self.samples,
+            "queue": self.maxsize,
+            "policy": self.policy,
+        }
+
+    # Whether this item of topic is sent after decimation
+    def wants(self, topic):
+        if topic not in self.topics:
+            return False
+        n = self.decimate.get(topic, 1)
+        if n == 1:
+            return True
+        self.counters[topic] = self.counters.get(topic, 0) + 1
+        return self.counters[topic] % n == 1
+
+    # Called from the publishing thread. Never blocks on the client.
+    def put(self, frame):
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.frames) >= self.maxsize:
+                if self.policy == DISCONNECT:
+                    self.close()
+                    return
+                self.dropped += 1
+                self.unreported_drops += 1
+                if self.policy == DROP_NEWEST:
+                    return
+                self.frames.popleft()
+            self.frames.append(frame)
+            self.condition.notify()
+
+    def run(self):
+        try:
+            self.connection.settimeout(HANDSHAKE_TIMEOUT)
+            request = self.connection.makefile("rb").readline()
+            try:
+                hello = self.subscribe(json.loads(request) if request.strip() else {})
+            except (ValueError, TypeError, AttributeError) as e:
+                self.connection.sendall(encode_json(HELLO, {"version": PROTOCOL_VERSION, "error": str(e)}))
+                return
+            self.connection.settimeout(None)
+            self.connection.sendall(encode_json(HELLO, hello))
+            self.server.add(self)
+
+            while True:
+                with self.condition:
+                    while len(self.frames) == 0 and not self.closed:
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                    frame = self.frames.popleft()
+                    dropped = self.unreported_drops
+                    self.unreported_drops = 0
+                if dropped > 0:
+                    self.connection.sendall(encode_frame(DROPPED, DROPPED_FORMAT.pack(dropped)))
+                self.connection.sendall(frame)
+                self.sent += 1
+        except OSError:
+            # Client went away
+            pass
+        finally:
+            self.close()
+            self.server.remove(self)
+            self.connection.close()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        # Wakes the thread if it is blocked sending
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def get_metrics(self):
+        return {
+            "address": str(self.address),
+            "topics": sorted(self.topics),
+            "queued": len(self.frames),
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+
+# Streams events, pressure summaries, the log bit and sentry alerts to any number of local clients,
+# on a Unix socket or a TCP port. See Subscriber for the subscription and the frames above for the format.
+# Sources are attached by topic name. Each is anything with connect(callback), e.g. a Qt Signal or a Topic.
+# Publishing only encodes each item once per format and queues it, so it is cheap in the thread of the source.
+class EventServer(Worker):
+    def __init__(self, address=DEFAULT_ADDRESS) -> None:
+        super().__init__()
+        self.address = address
+        self.family, self.bind_address = parse_address(address)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.running = False
+        self.config_manager = ConfigurationManager()
+        self.coefficients = self.config_manager.get_settings("plotting_coefficients")
+        self.config_manager.settings_updated.connect(self.update_settings)
+
+        if self.family == socket.AF_UNIX and os.path.lexists(self.bind_address):
+            # Only a socket left behind by a server that did not exit cleanly is replaced
+            if not stat.S_ISSOCK(os.lstat(self.bind_address).st_mode):
+                raise FileExistsError(f"{self.bind_address} exists and is not a socket.")
+            os.remove(self.bind_address)
+        self.socket = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.bind_address)
+        self.socket.listen()
+        self.socket.settimeout(ACCEPT_TIMEOUT)
+
+    # Address clients connect to. The port is filled in if 0 was given.
+    def get_address(self):
+        if self.family == socket.AF_UNIX:
+            return self.bind_address
+        host, port = self.socket.getsockname()[:2]
+        return f"{host}:{port}"
+
+    def attach(self, topic, signal):
+        if topic not in TOPICS:
+            raise ValueError(f"Unknown topic {topic}. Topics are {TOPICS}.")
+        signal.connect(lambda item: self.publish(topic, item))
+
+    # Signals of a DataHandler. Sentry alerts are taken from its sentry to keep their type and time.
+    def attach_data_handler(self, data_handler):
+        self.attach("pressurize", data_handler.pressurize_event_signal)
+        self.attach("depressurize", data_handler.depressurize_event_signal)
+        self.attach("period", data_handler.period_event_signal)
+        self.attach("pressure", data_handler.pressure_event_signal)
+        self.attach("pump", data_handler.pump_event_signal)
+        self.attach("log", data_handler.log_signal)
+        self.attach("warning", data_handler.sentry.warning_signal)
+        self.attach("error", data_handler.sentry.error_signal)
+
+    # Topics of a Pipeline
+    def attach_pipeline(self, pipeline):
+        for topic, event_type in EVENT_TOPICS.items():
+            self.attach(topic, pipeline.bus.topic(event_type))
+        for topic in ["log"] + ALERT_TOPICS:
+            self.attach(topic, pipeline.bus.topic(topic))
+
+    def publish(self, topic, item):
+        with self.lock:
+            subscribers = [subscriber for subscriber in self.subscribers if subscriber.wants(topic)]
+        if len(subscribers) == 0:
+            return
+
+        frames = {} # Encoded once per format
+        for subscriber in subscribers:
+            if topic in EVENT_TOPICS:
+                if subscriber.samples:
+                    key = "samples"
+                elif topic == "pressure":
+                    key = "summary"
+                else:
+                    key = "event"
+            else:
+                key = topic
+            if key not in frames:
+                frames[key] = self.encode(topic, item, key)
+            subscriber.put(frames[key])
+
+    def encode(self, topic, item, key):
+        if key == "samples" or key == "event":
+            return encode_event(item, key == "samples")
+        if key == "summary":
+            return encode_summary(item, self.coefficients)
+        if key == "log":
+            return encode_frame(LOG, LOG_FORMAT.pack(bool(item)))
+        return encode_alert(topic, item)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            try:
+                connection, address = self.socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            Subscriber(self, connection, address).start()
+
+    def add(self, subscriber):
+        with self.lock:
+            self.subscribers.append(subscriber)
+
+    def remove(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def update_settings(self, key):
+        if key == "plotting_coefficients":
+            self.coefficients = self.config_manager.get_settings(key)
+
+    def get_metrics(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        return {
+            "address": self.get_address(),
+            "subscribers": [subscriber.get_metrics() for subscriber in subscribers],
+        }
+
+    def quit(self):
+        self.running = False
+
+    def close(self):
+        self.quit()
+        self.wait()
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+        for subscriber in subscribers:
+            subscriber.wait()
+        self.socket.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.bind_address):
+            os.remove(self.bind_address)
@@ -0,0 +1,239 @@
+import sys
+from collections import deque
+from time import time, sleep
+import numpy as np
+from PySide6.QtCore import QObject, QTimer
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.event import Event, Channel
+from icarus_v2.backend.status_server import StatusServer
+from icarus_v2.backend.tracing import LatencyTracer, record_delivery
+from icarus_v2.backend.sampling_profiler import SamplingProfiler
+from icarus_v2.backend.runtime_profile import get_runtime_profile
+
+
+# Messages kept for the status
+MESSAGE_HISTORY = 50
+
+
+# Runs acquisition, event detection, logging, the sentry and pulsing without a GUI.
+# Takes the place of the GUI widgets that consume DataHandler signals: counts events into counter_settings,
+# keeps the last pressure, and follows the interlock when the sentry raises an error.
+# Status and pulse control are served on a local socket. Requests:
+#   status      device, buffer, pressure, counts, messages, timing metrics, interlock trips and event loop stalls
+#   pulse on    start pulsing, and resume after reconnecting
+#   pulse off   stop pulsing
+#   profile start       start sampling the stacks of every thread
+#   profile stop FILE   stop sampling and write the samples to FILE as collapsed stacks
+#   shutdown    stop pulsing and the pump and open the valves for a second, as the sentry does
+#   quit        stop the daemon
+class HeadlessDaemon(QObject):
+    # watchdog is an optional StallWatchdog of the event loop
+    def __init__(self, app, data_handler, socket_name, pulse=False, watchdog=None) -> None:
+        super().__init__()
+        self.app = app
+        self.data_handler = data_handler
+        self.watchdog = watchdog
+        self.profiler = SamplingProfiler()
+        self.pulse_generator = data_handler.pulse_generator
+        self.config_manager = ConfigurationManager()
+
+        self.connected = False
+        self.pulse_requested = pulse
+        self.counts = self.config_manager.get_settings("counter_settings")
+        self.pump_times = deque(maxlen=5)
+        self.pressure = None
+        self.event_times = {} # Time of the last event of each type
+        self.messages = deque(maxlen=MESSAGE_HISTORY)
+
+        data_handler.acquiring_signal.connect(self.set_connected)
+        data_handler.pressure_event_signal.connect(self.update_pressure)
+        data_handler.pressurize_event_signal.connect(self.increment_count)
+        data_handler.depressurize_event_signal.connect(self.increment_count)
+        data_handler.pump_event_signal.connect(self.increment_count)
+        data_handler.period_event_signal.connect(self.record_event)
+        for signal in [data_handler.pressurize_event_signal, data_handler.depressurize_event_signal,
+                       data_handler.period_event_signal, data_handler.pressure_event_signal,
+                       data_handler.pump_event_signal]:
+            signal.connect(record_delivery)
+        data_handler.toolbar_warning.connect(lambda message, color: self.add_message(message, color == "red"))
+        data_handler.display_error.connect(lambda message: self.add_message(message, True))
+        data_handler.shutdown_signal.connect(self.shutdown_valves)
+        self.config_manager.settings_updated.connect(self.update_settings)
+
+        self.server = StatusServer(socket_name, self.handle_request)
+        print(f"Serving status on {self.server.get_name()}", flush=True)
+
+    def set_connected(self, connected):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        print("Device connected" if connected else "Device disconnected", flush=True)
+        if connected and self.pulse_requested:
+            self.start_pulsing()
+
+    def record_event(self, event):
+        self.event_times[event.event_type] = event.event_time
+
+    def update_pressure(self, event):
+        self.record_event(event)
+        coefficients = self.config_manager.get_settings("plotting_coefficients")
+        self.pressure = {
+            "target": float(event.get_target_pressure() * coefficients[Channel.TARGET]),
+            "origin": float(event.get_origin_pressure() * coefficients[Channel.HI_PRE_ORIG]),
+        }
+
+    # Same counts as the counter display of the GUI
+    def increment_count(self, event):
+        self.record_event(event)
+        if event.event_type == Event.PUMP:
+            self.counts["pump_count"] += 1
+            self.pump_times.append(event.event_time)
+        elif event.event_type == Event.PRESSURIZE:
+            self.counts["pressurize_count"] += 1
+        elif event.event_type == Event.DEPRESSURIZE:
+            self.counts["depressurize_count"] += 1
+
+        # Save counts to json every 10 updates
+        if sum(self.counts.values()) % 10 == 0:
+            self.save_counts()
+
+    def save_counts(self):
+        # Do not emit so that this does not call self.update_settings
+        self.config_manager.save_settings("counter_settings", self.counts, emit=False)
+
+    def update_settings(self, key):
+        if key == "counter_settings":
+            self.counts = self.config_manager.get_settings(key)
+
+    def add_message(self, message, error):
+        # Sentry errors are reported as both a warning and an error dialog
+        if len(self.messages) > 0 and self.messages[-1]["message"] == message:
+            return
+        self.messages.append({"time": time(), "level": "error" if error else "warning", "message": message})
+        print(("Error: " if error else "Warning: ") + message, file=sys.stderr, flush=True)
+
+    def start_pulsing(self):
+        if not self.connected or self.pulse_generator.isRunning():
+            return
+        # Close valves before pulsing, as the device control panel does
+        for set_high in (self.pulse_generator.set_pressurize_high, self.pulse_generator.set_depressurize_high):
+            try:
+                set_high()
+            except RuntimeError:
+                pass
+        # Prevents 2 depressurize events in the same chunk
+        sleep(0.05)
+        self.pulse_generator.start()
+
+    def stop_pulsing(self):
+        self.pulse_generator.quit()
+        self.pulse_generator.wait()
+
+    # Same as the shutdown button: stop the pump and pulsing, open the valves, then close them.
+    # After a sentry error the interlock has already done all but closing the valves, so only that remains.
+    def shutdown_valves(self):
+        self.pulse_requested = False
+        self.stop_pulsing()
+        for action in (
+                self.pulse_generator.set_pump_high,
+                self.pulse_generator.set_pressurize_low,
+                self.pulse_generator.set_depressurize_low
+        ):
+            try:
+                action()
+            except RuntimeError:
+                pass
+        QTimer.singleShot(1000, self.close_valves)
+
+    def close_valves(self):
+        for action in (self.pulse_generator.set_pressurize_high, self.pulse_generator.set_depressurize_high):
+            try:
+                action()
+            except RuntimeError:
+                pass
+
+    def handle_request(self, request):
+        match request.split():
+            case ["status"]:
+                return self.get_status()
+            case ["pulse", "on"]:
+                self.pulse_requested = True
+                self.start_pulsing()
+                return {"pulsing": self.pulse_generator.isRunning()}
+            case ["pulse", "off"]:
+                self.pulse_requested = False
+                self.stop_pulsing()
+                return {"pulsing": False}
+            case ["profile", "start"]:
+                self.profiler.start()
+                return self.profiler.get_metrics()
+            case ["profile", "stop", path]:
+                self.profiler.stop()
+                try:
+                    self.profiler.export(path)
+                except OSError as e:
+                    return {"error": str(e)}
+                return self.profiler.get_metrics()
+            case ["shutdown"]:
+                self.shutdown_valves()
+                return {"pulsing": False}
+            case ["quit"]:
+                QTimer.singleShot(0, self.app.quit)
+                return {"quitting": True}
+            case _:
+                return {"error": f"Unknown request \"{request}\"."}
+
+    def get_status(self):
+        device = self.data_handler.device
+        loader = self.data_handler.loader
+        status = {
+            "time": time(),
+            "connected": self.connected,
+            "pulsing": self.pulse_generator.isRunning(),
+            "pressure": self.pressure,
+            "counts": self.counts,
+            "pump_strokes_per_hour": None,
+            "event_times": {
+                name: self.event_times.get(event_type)
+                for name, event_type in (
+                    ("pressurize", Event.PRESSURIZE),
+                    ("depressurize", Event.DEPRESSURIZE),
+                    ("period", Event.PERIOD),
+                    ("pressure", Event.PRESSURE),
+                    ("pump", Event.PUMP),
+                )
+            },
+            "messages": list(self.messages),
+            "pulse_timing": self.pulse_generator.get_timing_metrics(),
+            "valve_calibration": self.data_handler.valve_calibrator.get_metrics(),
+            "latency": LatencyTracer().get_metrics(),
+            "interlock": self.data_handler.interlock.get_metrics(),
+            "runtime_profile": get_runtime_profile(),
+        }
+        if self.watchdog is not None:
+            status["stalls"] = self.watchdog.get_metrics()
+        if self.profiler.isRunning():
+            status["profile"] = self.profiler.get_metrics()
+        if len(self.pump_times) == self.pump_times.maxlen:
+            status["pump_strokes_per_hour"] = 3600 / np.diff(self.pump_times).mean()
+
+        if device is not None:
+            status["dio"] = device.get_current_dio()
+            status["device_settings"] = device.get_device_settings()
+            if hasattr(device, "get_command_metrics"):
+                status["commands"] = device.get_command_metrics()
+            if hasattr(device, "get_setup_metrics"):
+                status["setup"] = device.get_setup_metrics()
+        if loader.buffer is not None:
+            # With --shared-buffer, other processes may attach to the buffer by name to read the data
+            status["buffer"] = {
+                "name": loader.buffer.get_name() if hasattr(loader.buffer, "get_name") else None,
+                "shape": loader.buffer.buffer.shape,
+                "write_index": loader.buffer.write_index,
+            }
+            status["loader"] = loader.get_metrics()
+        return status
+
+    def close(self):
+        self.save_counts()
+        self.server.close()
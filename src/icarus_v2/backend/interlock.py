@@ -0,0 +1,87 @@
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.metrics import MetricsRegistry
+from icarus_v2.backend.pubsub import Topic
+
+
+# Trips kept for reporting
+TRIP_HISTORY = 100
+
+
+# Puts the device in its safe state as soon as the sentry raises an error, in the handler thread which raised it.
+# Pulsing and the pump are stopped and both valves are opened by a single DIO write, without going through the
+# event loop, so shutting down does not wait for the GUI. tripped is emitted afterwards for the GUI or daemon to follow.
+# Every trip is timed from the error to the write being sent and compared with deadline_ms of interlock_settings.
+class Interlock:
+    def __init__(self, pulse_generator) -> None:
+        self.pulse_generator = pulse_generator
+        # Emitted with the SentryError once the interlock has acted, whether or not the write succeeded
+        self.tripped = Topic("tripped")
+
+        self.config_manager = ConfigurationManager()
+        self.deadline = None
+        self.update_settings()
+        self.config_manager.settings_updated.connect(self.update_settings)
+
+        self.lock = threading.Lock()
+        self.trips = deque(maxlen=TRIP_HISTORY) # dicts of time, reason, latency_ms, deadline_missed and error
+
+        registry = MetricsRegistry()
+        self.trip_count = registry.counter("interlock_trips_total", "Sentry errors acted on by the interlock.")
+        self.miss_count = registry.counter("interlock_deadline_misses_total",
+                                           "Interlock trips which did not write the safe state within the deadline.")
+        self.latency = registry.summary("interlock_latency_seconds", "Time from a sentry error to the safe state.")
+
+    def update_settings(self, key="interlock_settings"):
+        if key == "interlock_settings":
+            self.deadline = self.config_manager.get_settings(key)["deadline_ms"] / 1000
+
+    # Connected to the error signal of the sentry, before anything else
+    def trip(self, error):
+        start = perf_counter()
+        failure = None
+        try:
+            written = self.pulse_generator.set_safe_state()
+        except Exception as e:
+            # e.g. no device or a lost one. The GUI or daemon then drives the device itself.
+            written = None
+            failure = str(e)
+
+        latency = None if written is None else written - start
+        missed = latency is None or latency > self.deadline
+        trip = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "reason": getattr(error, "error_type", str(error)),
+            "latency_ms": None if latency is None else 1000 * latency,
+            "deadline_missed": missed,
+            "error": failure,
+        }
+        with self.lock:
+            self.trips.append(trip)
+        self.trip_count.inc()
+        if latency is not None:
+            self.latency.observe(latency)
+        if missed:
+            self.miss_count.inc()
+            cause = failure if failure is not None else f"took {trip['latency_ms']:.1f} ms"
+            print(f"{trip['time']} Interlock missed its deadline of {1000 * self.deadline:.0f} ms: {cause}",
+                  file=sys.stderr, flush=True)
+
+        self.tripped.emit(error)
+
+    # Trip count, deadline misses and the most recent trips
+    def get_metrics(self):
+        with self.lock:
+            trips = list(self.trips)
+        latencies = [trip["latency_ms"] for trip in trips if trip["latency_ms"] is not None]
+        return {
+            "deadline_ms": 1000 * self.deadline,
+            "count": self.trip_count.value,
+            "missed": self.miss_count.value,
+            "max_latency_ms": max(latencies) if len(latencies) > 0 else None,
+            "recent": trips,
+        }
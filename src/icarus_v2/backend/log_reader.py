@@ -11,27 +11,38 @@ class LogReader:
         self.filename = None
         self.logger = None
         self.log_coefficients = None
+        self.device_settings = None
         self.tool_bar=tool_bar
 
     def set_logger(self, logger):
         self.logger = logger
 
     def read_events(self, filename):
+        self.events = list(self.iter_events(filename))
+
+    # Yields events one at a time without loading the whole file into memory.
+    # log_coefficients is set once the end of the file is reached.
+    def iter_events(self, filename):
         self.log_coefficients = None
-        self.events = []
+        self.device_settings = None
         self.filename = filename
 
         # If reading current log file, write to disk first
         if self.logger is not None and self.logger.filename is not None and self.filename == self.logger.filename:
             self.logger.flush()
 
-        file = lzma.open(filename, "rb")  # Open file in read binary mode
-        try:
+        with lzma.open(filename, "rb") as file:  # Open file in read binary mode
             while True:
-                # Deserialize event data using pickle
-                event_dict = pickle.load(file)
+                try:
+                    # Deserialize event data using pickle
+                    event_dict = pickle.load(file)
+                except EOFError:
+                    break  # End of file reached
+
                 if "plotting_coefficients" in event_dict.keys():
                     self.log_coefficients = event_dict["plotting_coefficients"]
+                elif "device_settings" in event_dict.keys():
+                    self.device_settings = event_dict["device_settings"]
                 elif "error_type" in event_dict.keys():
                     event = event_dict['class_type'](event_dict['error_type'],event_dict['event_time'],event_dict['data'])
                     color="orange"
@@ -40,14 +51,10 @@ class LogReader:
 
                     self.tool_bar.display_warning("LOG: "+str(event),color)
                 else:
-                    event = Event(
+                    yield Event(
                         event_dict['event_type'],
                         event_dict['data'],
                         event_dict['event_index'],
                         event_dict['event_time'],
                         event_dict['step_time']
                     )
-                    self.events.append(event)
-        except EOFError:
-            pass  # End of file reached
-        file.close()
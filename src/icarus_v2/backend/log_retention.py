@@ -0,0 +1,181 @@
+import json
+import os
+from time import time
+
+
+# Logs whose segments are linked by a manifest use this extension for the manifest file.
+MANIFEST_EXTENSION = ".json"
+LOG_EXTENSION = ".xz"
+
+
+# Keeps the temporary log directory within a disk budget and decides when the current log should be split.
+# Settings are a dictionary of temp_max_size_mb, temp_max_age_days, segment_max_size_mb, segment_max_minutes.
+# A limit of 0 disables that check.
+class LogRetentionManager:
+    def __init__(self, settings) -> None:
+        self.settings = settings
+
+    def update_settings(self, settings):
+        self.settings = settings
+
+    # Returns whether a segment of size_bytes started at start_time should be closed and a new one started
+    def should_roll(self, size_bytes, start_time):
+        max_size = self.settings["segment_max_size_mb"] * 1e6
+        max_seconds = self.settings["segment_max_minutes"] * 60
+        if max_size > 0 and size_bytes >= max_size:
+            return True
+        if max_seconds > 0 and time() - start_time >= max_seconds:
+            return True
+        return False
+
+    # Deletes logs in log_path older than temp_max_age_days, then the oldest logs until the directory is under temp_max_size_mb.
+    # Files in exclude (e.g. the log currently being written) are never deleted.
+    # Returns list of deleted files
+    def prune(self, log_path, exclude=()):
+        if not os.path.isdir(log_path):
+            return []
+
+        exclude = {os.path.abspath(f) for f in exclude if f is not None}
+        logs = []
+        for name in os.listdir(log_path):
+            if not name.endswith(LOG_EXTENSION):
+                continue
+            filename = os.path.abspath(os.path.join(log_path, name))
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            logs.append((stat.st_mtime, stat.st_size, filename))
+
+        # Oldest first
+        logs.sort()
+        total_size = sum(size for _, size, _ in logs)
+        max_age = self.settings["temp_max_age_days"] * 86400
+        max_size = self.settings["temp_max_size_mb"] * 1e6
+        now = time()
+
+        deleted = []
+        for mtime, size, filename in logs:
+            if filename in exclude:
+                continue
+            too_old = max_age > 0 and now - mtime > max_age
+            too_large = max_size > 0 and total_size > max_size
+            if not too_old and not too_large:
+                continue
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            deleted.append(filename)
+
+        if len(deleted) > 0:
+            SegmentManifest.remove_missing_segments(log_path)
+
+        return deleted
+
+
+# Links the segments of one logical experiment together.
+# Stored as json next to the segments, named after the first segment, e.g. log_2024-07-19_18-19-00.json
+class SegmentManifest:
+    def __init__(self, first_segment) -> None:
+        self.directory = os.path.dirname(first_segment)
+        self.name = os.path.splitext(os.path.basename(first_segment))[0]
+        self.filename = os.path.join(self.directory, self.name + MANIFEST_EXTENSION)
+        self.segments = []
+        # Copy of the coefficients stored in each segment, keyed by channel number
+        self.plotting_coefficients = None
+
+    # Name for the index-th segment of this experiment. Segment 0 is the first segment itself.
+    def segment_filename(self, index):
+        return os.path.join(self.directory, f"{self.name}_{index:03d}{LOG_EXTENSION}")
+
+    def add_segment(self, filename, start_time):
+        self.segments.append({
+            "filename": os.path.basename(filename),
+            "start_time": start_time,
+            "end_time": None,
+            "event_count": 0,
+        })
+
+    # Record final state of the most recent segment
+    def close_segment(self, end_time, event_count):
+        if len(self.segments) == 0:
+            return
+        self.segments[-1]["end_time"] = end_time
+        self.segments[-1]["event_count"] = event_count
+
+    # Drop a segment, e.g. if it was deleted for having no events
+    def remove_segment(self, filename):
+        basename = os.path.basename(filename)
+        self.segments = [s for s in self.segments if s["filename"] != basename]
+
+    def rename_segment(self, filename, new_filename):
+        basename = os.path.basename(filename)
+        for segment in self.segments:
+            if segment["filename"] == basename:
+                segment["filename"] = os.path.basename(new_filename)
+
+    # Absolute paths of all segments in order
+    def get_segment_files(self):
+        return [os.path.join(self.directory, s["filename"]) for s in self.segments]
+
+    def save(self):
+        # Manifest is only needed when there are multiple segments
+        if len(self.segments) <= 1:
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            return
+
+        content = {
+            "experiment": self.name,
+            "plotting_coefficients": self.plotting_coefficients,
+            "segments": self.segments
+        }
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "w") as file:
+            json.dump(content, file, indent=4)
+        os.replace(temp_filename, self.filename)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "r") as file:
+            content = json.load(file)
+        manifest = cls.__new__(cls)
+        manifest.directory = os.path.dirname(filename)
+        manifest.name = content["experiment"]
+        manifest.filename = filename
+        manifest.segments = content["segments"]
+        manifest.plotting_coefficients = content.get("plotting_coefficients")
+        return manifest
+
+    # Returns the manifest that lists filename as a segment, or None if filename is a standalone log
+    @classmethod
+    def find(cls, filename):
+        directory = os.path.dirname(filename)
+        basename = os.path.basename(filename)
+        if not os.path.isdir(directory):
+            return None
+        for name in os.listdir(directory):
+            if not name.endswith(MANIFEST_EXTENSION):
+                continue
+            try:
+                manifest = cls.load(os.path.join(directory, name))
+            except (OSError, ValueError, KeyError):
+                continue
+            if any(s["filename"] == basename for s in manifest.segments):
+                return manifest
+        return None
+
+    # Update all manifests in log_path after segments were deleted
+    @classmethod
+    def remove_missing_segments(cls, log_path):
+        for name in os.listdir(log_path):
+            if not name.endswith(MANIFEST_EXTENSION):
+                continue
+            try:
+                manifest = cls.load(os.path.join(log_path, name))
+            except (OSError, ValueError, KeyError):
+                continue
+            manifest.segments = [s for s in manifest.segments if os.path.exists(os.path.join(log_path, s["filename"]))]
+            manifest.save()
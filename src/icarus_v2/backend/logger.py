@@ -2,43 +2,114 @@ import lzma
 import pickle
 import os
 from datetime import datetime
-from PySide6.QtCore import QStandardPaths
+from time import time, perf_counter
+from threading import RLock, Lock
 from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.app_paths import get_data_dir
+from icarus_v2.backend.log_retention import LogRetentionManager, SegmentManifest
 
 
 MAX_PRESSURE_INTERVAL = 5
+# Seconds between xz streams. Each stream can be copied on its own by the log tool without re-compressing.
+MAX_STREAM_INTERVAL = 60
 
 
 # Logs files to logs/temp or logs/experiment depending on bit 4.
 # Files are deleted if no events are logged.
+# Long logs are split into segments once they reach the size or time limit in log_settings.
+# Segments of the same log are linked by a SegmentManifest.
+# Temporary logs are pruned to stay within the disk budget in log_settings.
 class Logger:
     def __init__(self, is_raw=False) -> None:
         self.file = None
+        self.raw_file = None # Underlying compressed file. Used to track the size of the current segment.
         self.filename = None
         self.current_path = None
         self.event_count = None
         self.last_pressure_update = None
         self.is_raw = is_raw
 
-    def new_log_file(self, temporary=True):
-        self.close()
-
-        self.current_path = temporary
-        base_dir = os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), 'logs')
+        self.segment_start = None
+        self.stream_start = None
+        self.segmented = True # Whether the current log is split into segments
+        self.manifest = None
+        # Written at the start of every segment so data can be interpreted, e.g. the sample rate
+        self.device_settings = None
+        # Events are logged from multiple handler threads
+        self.lock = RLock()
+
+        # Metrics. queued is the number of events waiting for the lock.
+        self.events_written = 0
+        self.queued = 0
+        self.queue_lock = Lock()
+        self.write_seconds = 0
+        self.flush_seconds = 0
+
+        self.config_manager = ConfigurationManager()
+        self.retention = LogRetentionManager(self.config_manager.get_settings('log_settings'))
+        self.config_manager.settings_updated.connect(self.update_settings)
+
+    # filename overrides the default location in logs/temp or logs/experiment.
+    # A file given by name is overwritten and written as a single segment.
+    def new_log_file(self, temporary=True, filename=None):
+        with self.lock:
+            self.close()
+
+            self.current_path = temporary
+            # Only the default temporary directory is pruned
+            prune = temporary and filename is None
+            self.segmented = filename is None
+            if filename is None:
+                log_path = self.get_log_path(temporary)
+                current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                name = f"{'raw_' if self.is_raw else ''}log_{current_datetime}.xz"
+                filename = os.path.join(log_path, name)
+            else:
+                log_path = os.path.dirname(os.path.abspath(filename))
+
+            if not os.path.exists(log_path):
+                os.makedirs(log_path)
+            if not self.segmented:
+                open(filename, "wb").close()
+
+            self.filename = filename
+            self.manifest = SegmentManifest(self.filename)
+            self.last_pressure_update = None
+            self.open_segment()
+
+            if prune:
+                self.retention.prune(log_path, exclude=[self.filename])
+
+    # Dictionary from get_device_settings of the device being logged. Applies from the next segment.
+    def set_device_settings(self, device_settings):
+        with self.lock:
+            self.device_settings = device_settings
+
+    @staticmethod
+    def get_log_path(temporary=True):
+        base_dir = os.path.join(get_data_dir(), 'logs')
         if temporary:
-            log_path = os.path.join(base_dir, 'temp')
+            return os.path.join(base_dir, 'temp')
         else:
-            log_path = os.path.join(base_dir, "experiment")
-
-        if not os.path.exists(log_path):
-            os.makedirs(log_path)
+            return os.path.join(base_dir, "experiment")
 
-        current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        name = f"{'raw_' if self.is_raw else ''}log_{current_datetime}.xz"
-        self.filename = os.path.join(log_path, name)
-        self.file = lzma.open(self.filename, "ab")  # Opening file in append binary mode with LZMA compression
+    # Open self.filename as a new segment of the current manifest
+    def open_segment(self):
+        self.raw_file = open(self.filename, "ab")
+        self.file = lzma.open(self.raw_file, "ab")  # Opening file in append binary mode with LZMA compression
         self.event_count = 0
-        self.last_pressure_update = None
+        self.segment_start = time()
+        self.stream_start = self.segment_start
+        self.manifest.add_segment(self.filename, self.segment_start)
+        if self.device_settings is not None:
+            pickle.dump({"device_settings": self.device_settings}, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Close the current segment and continue logging to the next one
+    def roll_segment(self):
+        self.close_file()
+        self.filename = self.manifest.segment_filename(len(self.manifest.segments))
+        self.open_segment()
+        self.manifest.save()
 
     def log_event(self, event):
         if self.is_raw:
@@ -77,29 +148,83 @@ class Logger:
         self.log_raw(event_dict)
 
     def log_raw(self, data):
-        self.event_count += 1
-        pickle.dump(data, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.queue_lock:
+            self.queued += 1
+        with self.lock:
+            with self.queue_lock:
+                self.queued -= 1
+            # Events before a log is started, e.g. pulsing before the log channel is set, are not logged
+            if self.file is None:
+                return
+            if self.segmented and self.event_count > 0 and self.retention.should_roll(self.raw_file.tell(), self.segment_start):
+                self.roll_segment()
+
+            self.event_count += 1
+            start = perf_counter()
+            pickle.dump(data, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.write_seconds += perf_counter() - start
+            self.events_written += 1
+
+            if time() - self.stream_start > MAX_STREAM_INTERVAL:
+                self.flush()
 
+    # Writes the current xz stream to disk and starts a new one
     def flush(self):
-        self.file.close()
-        self.file = lzma.open(self.filename, "ab")
+        with self.lock:
+            start = perf_counter()
+            self.file.close()
+            self.raw_file.close()
+            self.flush_seconds += perf_counter() - start
+            self.raw_file = open(self.filename, "ab")
+            self.file = lzma.open(self.raw_file, "ab")
+            self.stream_start = time()
+
+    # Rename the current segment, keeping the manifest up to date
+    def rename(self, new_filename):
+        with self.lock:
+            self.file.close()
+            self.raw_file.close()
+            try:
+                os.rename(self.filename, new_filename)
+                self.manifest.rename_segment(self.filename, new_filename)
+                self.manifest.save()
+                self.filename = new_filename
+            finally:
+                self.raw_file = open(self.filename, "ab")
+                self.file = lzma.open(self.raw_file, "ab")
 
     def close(self):
-        if self.file is None:
-            return
+        with self.lock:
+            if self.file is None:
+                return
 
+            self.close_file()
+            self.manifest.save()
+            self.manifest = None
+            self.filename = None
+
+    # Close the current segment, deleting it if no events were logged
+    def close_file(self):
         if not self.is_raw:
-            config_manager = ConfigurationManager()
-            settings = {"plotting_coefficients": config_manager.get_settings("plotting_coefficients")}
+            coefficients = self.config_manager.get_settings("plotting_coefficients")
+            settings = {"plotting_coefficients": coefficients}
             pickle.dump(settings, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.manifest.plotting_coefficients = {k.value: v for k, v in coefficients.items()}
 
         self.file.close()
+        self.raw_file.close()
         self.file = None
+        self.raw_file = None
 
         if self.event_count == 0:
+            self.manifest.remove_segment(self.filename)
             try:
                 os.remove(self.filename)
             except FileNotFoundError:
                 pass
+        else:
+            self.manifest.close_segment(time(), self.event_count)
 
-        self.filename = None
+    def update_settings(self, key='log_settings'):
+        if key == 'log_settings':
+            self.retention.update_settings(self.config_manager.get_settings(key))
@@ -0,0 +1,268 @@
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+
+# Kinds of metric, as named in the Prometheus text format
+COUNTER = "counter"
+GAUGE = "gauge"
+SUMMARY = "summary"
+# Prefix of every metric name
+NAMESPACE = "icarus"
+
+
+# A value written by the code it measures. Metrics such as the interlock counters are written from several handler
+# threads, so updates are locked.
+class Metric:
+    def __init__(self, kind, name, description, labels) -> None:
+        self.kind = kind
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.value = 0
+        self.count = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    # Adds one observation to a summary
+    def observe(self, value):
+        with self.lock:
+            self.value += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    # Observes the seconds taken by the block
+    @contextmanager
+    def time(self):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    # (kind, name, description, labels, value) of this metric. A summary gives its count, sum and max.
+    def samples(self):
+        if self.kind != SUMMARY:
+            return [(self.kind, self.name, self.description, self.labels, self.value)]
+        with self.lock:
+            count, total, largest = self.count, self.value, self.max
+        return [
+            (SUMMARY, self.name + "_count", self.description, self.labels, count),
+            (SUMMARY, self.name + "_sum", self.description, self.labels, total),
+            (GAUGE, self.name + "_max", self.description + " Largest observation.", self.labels, largest),
+        ]
+
+
+# Thread-safe singleton holding the metrics of the application.
+# Values kept by the code they describe, e.g. the read count of BufferLoader, are read when metrics are collected
+# by collectors: functions returning a list of (kind, name, description, labels, value), e.g. from collect_loader.
+# Nothing is computed on the data path except for metrics written directly, e.g. the frame time of plots.
+class MetricsRegistry:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance.metrics = {}
+                cls._instance.collectors = []
+        return cls._instance
+
+    # Returns the metric with this name and labels, creating it if needed
+    def metric(self, kind, name, description, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.metrics:
+                self.metrics[key] = Metric(kind, name, description, labels)
+            return self.metrics[key]
+
+    def counter(self, name, description, **labels):
+        return self.metric(COUNTER, name, description, **labels)
+
+    def gauge(self, name, description, **labels):
+        return self.metric(GAUGE, name, description, **labels)
+
+    def summary(self, name, description, **labels):
+        return self.metric(SUMMARY, name, description, **labels)
+
+    # Returns a function which removes the collector again
+    def add_collector(self, collector):
+        with self._lock:
+            self.collectors.append(collector)
+
+        def remove():
+            with self._lock:
+                if collector in self.collectors:
+                    self.collectors.remove(collector)
+        return remove
+
+    # Every sample as (kind, name, description, labels, value)
+    def collect(self):
+        with self._lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        samples = []
+        for metric in metrics:
+            samples.extend(metric.samples())
+        errors = 0
+        for collector in collectors:
+            try:
+                samples.extend(collector())
+            except Exception:
+                # A component being torn down must not stop the others from being reported
+                errors += 1
+        if errors > 0:
+            samples.append((GAUGE, "collector_errors", "Collectors which failed in this collection.", {}, errors))
+        return samples
+
+    # All samples in the Prometheus text exposition format. Samples of one metric are grouped under one description.
+    def expose(self):
+        families = {} # name: (kind, description, lines)
+        for kind, name, description, labels, value in self.collect():
+            family = name.rsplit("_", 1)[0] if kind == SUMMARY else name
+            if family not in families:
+                families[family] = (kind, description, [])
+            label_text = ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+            if label_text:
+                label_text = "{" + label_text + "}"
+            families[family][2].append(f"{NAMESPACE}_{name}{label_text} {float(value)!r}")
+
+        lines = []
+        for family, (kind, description, samples) in families.items():
+            lines.append(f"# HELP {NAMESPACE}_{family} {description}")
+            lines.append(f"# TYPE {NAMESPACE}_{family} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Collectors of the components of the pipeline. Each returns a list of samples.
+
+def collect_loader(loader):
+    samples = [
+        (COUNTER, "usb_reads_total", "Reads from the device.", {}, loader.reads),
+        (COUNTER, "usb_bytes_total", "Bytes read from the device.", {}, loader.bytes_read),
+        (COUNTER, "loader_resyncs_total", "Times framing was lost and recovered.", {}, loader.resyncs),
+        (COUNTER, "loader_dropped_bytes_total", "Bytes discarded while resyncing.", {}, loader.dropped_bytes),
+        (COUNTER, "loader_framing_errors_total", "Frames with an invalid digital word.", {}, loader.framing_errors),
+        (COUNTER, "device_overflows_total", "Times the buffer of the device overflowed.", {}, loader.overflows),
+    ]
+    if loader.device is not None and loader.block_bytes is not None:
+        samples.append((GAUGE, "loader_block_bytes", "Bytes requested per read.", {}, loader.block_bytes))
+        samples.append((GAUGE, "loader_load_seconds", "Time taken to process the last read.", {}, loader.load_time))
+    buffer = loader.buffer
+    if buffer is not None:
+        capacity = buffer.capacity
+        samples.append((COUNTER, "buffer_samples_total", "Samples written to the ring buffer.", {}, buffer.write_index))
+        samples.append((GAUGE, "buffer_fill_ratio", "Fraction of the ring buffer holding data.", {},
+                        min(buffer.write_index, capacity) / capacity))
+    return samples
+
+
+# Events and reader lag of EventHandlers
+def collect_handlers(handlers):
+    samples = []
+    for handler in handlers:
+        labels = {"handler": type(handler).__name__}
+        samples.append((COUNTER, "handler_events_total", "Events emitted.", labels, handler.events_emitted))
+        samples.append((COUNTER, "handler_events_dropped_total",
+                        "Events detected but not emitted, because their data was not available in time or two "
+                        "occurred in one chunk.", labels, handler.events_dropped))
+        reader = handler.reader
+        if reader is not None:
+            samples.append((GAUGE, "reader_lag_samples", "Samples written to the buffer but not yet read.", labels,
+                            reader.buffer.write_index - reader.read_index))
+    return samples
+
+
+def collect_logger(logger, name):
+    labels = {"logger": name}
+    samples = [
+        (COUNTER, "logger_events_total", "Events written to the log.", labels, logger.events_written),
+        (GAUGE, "logger_queue_depth", "Events waiting for the logger to be free.", labels, logger.queued),
+        (COUNTER, "logger_write_seconds_total", "Time spent pickling and compressing events.", labels,
+         logger.write_seconds),
+        (COUNTER, "logger_flush_seconds_total", "Time spent finishing compressed streams.", labels,
+         logger.flush_seconds),
+    ]
+    raw_file = logger.raw_file
+    if raw_file is not None and not raw_file.closed:
+        samples.append((GAUGE, "logger_segment_bytes", "Compressed size of the current log segment.", labels,
+                        raw_file.tell()))
+    return samples
+
+
+# Command queue and setup of a DataqInterface
+def collect_device(device):
+    samples = []
+    if hasattr(device, "get_command_metrics"):
+        metrics = device.get_command_metrics()
+        samples.append((GAUGE, "device_commands_queued", "Commands waiting to be written.", {}, metrics["queued"]))
+        for priority in ["valve", "control", "config"]:
+            labels = {"priority": priority}
+            if f"{priority}_latency_mean_ms" in metrics:
+                samples.append((GAUGE, "device_command_latency_mean_ms",
+                                "Mean time from submitting to writing recent commands.", labels,
+                                metrics[f"{priority}_latency_mean_ms"]))
+                samples.append((GAUGE, "device_command_latency_max_ms",
+                                "Largest time from submitting to writing recent commands.", labels,
+                                metrics[f"{priority}_latency_max_ms"]))
+    if hasattr(device, "get_setup_metrics"):
+        metrics = device.get_setup_metrics()
+        if "setup_ms" in metrics:
+            samples.append((GAUGE, "device_setup_ms", "Time taken to set up the device.", {}, metrics["setup_ms"]))
+    return samples
+
+
+# Lateness of pulse edges
+def collect_pulse_generator(pulse_generator):
+    samples = []
+    for edge, metrics in pulse_generator.get_timing_metrics().items():
+        if not isinstance(metrics, dict):
+            continue
+        labels = {"edge": edge}
+        samples.append((COUNTER, "pulse_edges_total", "Valve edges commanded.", labels, metrics["count"]))
+        samples.append((GAUGE, "pulse_lateness_mean_ms", "Mean time from planned edges to commands.", labels,
+                        metrics["mean_ms"]))
+        samples.append((GAUGE, "pulse_lateness_p99_ms", "99th percentile time from planned edges to commands.",
+                        labels, metrics["p99_ms"]))
+    return samples
+
+
+def collect_valve_calibrator(calibrator):
+    samples = []
+    for valve, metrics in calibrator.get_metrics().items():
+        labels = {"valve": valve}
+        samples.append((GAUGE, "valve_low_latency_ms", "Time from a low command to its edge in the data.", labels,
+                        metrics["low_latency_ms"]))
+        samples.append((GAUGE, "valve_high_latency_ms", "Time from a high command to its edge in the data.", labels,
+                        metrics["high_latency_ms"]))
+        samples.append((GAUGE, "valve_width_error_ms", "How much longer pulses are at the valve than commanded.",
+                        labels, metrics["width_error_ms"]))
+    return samples
+
+
+def collect_event_server(server):
+    samples = []
+    metrics = server.get_metrics()
+    samples.append((GAUGE, "stream_subscribers", "Clients of the event stream.", {}, len(metrics["subscribers"])))
+    for subscriber in metrics["subscribers"]:
+        labels = {"client": subscriber["address"]}
+        samples.append((COUNTER, "stream_frames_total", "Frames sent to a client.", labels, subscriber["sent"]))
+        samples.append((COUNTER, "stream_frames_dropped_total", "Frames dropped because a client fell behind.",
+                        labels, subscriber["dropped"]))
+        samples.append((GAUGE, "stream_queue_depth", "Frames waiting to be sent to a client.", labels,
+                        subscriber["queued"]))
+    return samples
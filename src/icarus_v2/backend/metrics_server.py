@@ -0,0 +1,48 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from icarus_v2.backend.metrics import MetricsRegistry
+from icarus_v2.backend.worker import Worker
+
+
+DEFAULT_ADDRESS = "127.0.0.1:9470"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+        body = MetricsRegistry().expose().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Requests are not printed, as a scraper makes one every few seconds
+    def log_message(self, format, *args):
+        pass
+
+
+# Serves the metrics registry over HTTP at /metrics in the Prometheus text format.
+# Scrapes only read values already kept by the pipeline, so they do not slow acquisition down.
+class MetricsServer(Worker):
+    def __init__(self, address=DEFAULT_ADDRESS) -> None:
+        super().__init__()
+        host, _, port = address.rpartition(":")
+        self.server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), MetricsRequestHandler)
+        self.server.daemon_threads = True
+
+    # Address scrapers connect to. The port is filled in if 0 was given.
+    def get_address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def run(self):
+        self.server.serve_forever(poll_interval=0.5)
+
+    def close(self):
+        if self.isRunning():
+            self.server.shutdown()
+            self.wait()
+        self.server.server_close()
@@ -0,0 +1,75 @@
+import heapq
+import os
+from icarus_v2.backend.event import Channel
+from icarus_v2.backend.log_reader import LogReader
+
+
+# Seconds by which events within one file may be out of order. Each handler logs its events from its own thread as
+# it detects them, and some wait for data after the event first, so events of different types are interleaved late.
+REORDER_WINDOW = 5.0
+
+
+# Reads several log files as one timeline, e.g. the segments of a rotated log or logs split by a reconnect.
+# Events are merged by event_time as a stream. Each file is decoded lazily and sorted within REORDER_WINDOW,
+# so only that window of events of every file is held in memory at a time.
+class MultiLogReader:
+    def __init__(self, filenames, tool_bar=None) -> None:
+        self.filenames = list(filenames)
+        self.tool_bar = tool_bar
+        self.log_coefficients = None
+
+    # Reader for every segment of a SegmentManifest that still exists on disk
+    @classmethod
+    def from_manifest(cls, manifest, tool_bar=None):
+        filenames = [f for f in manifest.get_segment_files() if os.path.exists(f)]
+        reader = cls(filenames, tool_bar)
+        # Coefficients are stored at the end of each segment, so the manifest copy lets them be known before reading
+        if manifest.plotting_coefficients is not None:
+            reader.log_coefficients = {Channel(int(k)): v for k, v in manifest.plotting_coefficients.items()}
+        return reader
+
+    # Yields events from all files in order of event_time
+    def iter_events(self, logger=None):
+        readers = []
+        streams = []
+        for filename in self.filenames:
+            reader = LogReader(tool_bar=self.tool_bar)
+            reader.set_logger(logger)
+            readers.append(reader)
+            streams.append(reorder(reader.iter_events(filename)))
+
+        yield from heapq.merge(*streams, key=lambda event: event.event_time)
+
+        # Fall back to the coefficients of the most recent file
+        if self.log_coefficients is None:
+            for reader in readers[::-1]:
+                if reader.log_coefficients is not None:
+                    self.log_coefficients = reader.log_coefficients
+                    break
+
+    # Yields lists of up to batch_size events in order of event_time.
+    # Used to feed plots incrementally.
+    def iter_batches(self, batch_size=500, logger=None):
+        batch = []
+        for event in self.iter_events(logger):
+            batch.append(event)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+
+# Yields events in order of event_time, given events which are out of order by at most window seconds.
+# Events are held until one window after them has been read. Events of equal time keep their order.
+def reorder(events, window=REORDER_WINDOW):
+    heap = []
+    latest = None
+    for count, event in enumerate(events):
+        heapq.heappush(heap, (event.event_time, count, event))
+        if latest is None or event.event_time > latest:
+            latest = event.event_time
+        while heap[0][0] < latest - window:
+            yield heapq.heappop(heap)[2]
+    while len(heap) > 0:
+        yield heapq.heappop(heap)[2]
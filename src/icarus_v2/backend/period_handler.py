@@ -13,6 +13,19 @@ class PeriodHandler(EventHandler):
         self.event_type = Event.PERIOD
 
 
+    # event_report_range is stretched to the length of each period, but the data after the current event is always
+    # the distance before the previous one
+    def get_lookahead(self):
+        before, after = self.event_report_range
+        sample_rate_kHz = float(self.sample_rate) / 1000
+        return max(0, int(-before * sample_rate_kHz))
+
+
+    def reset(self):
+        self.last_depressurize_bit = None
+        self.last_depressurize_event = None
+
+
     # Data: one chunk from the reader
     # Returns whether a depressurize event occurs and the index of the event
     # This logic is the same as for DepressurizeHandler
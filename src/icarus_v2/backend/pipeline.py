@@ -0,0 +1,176 @@
+from contextlib import nullcontext
+from icarus_v2.backend.async_adapter import EventStream
+from icarus_v2.backend.buffer_loader import BufferLoader
+from icarus_v2.backend.event import Event
+from icarus_v2.backend.metrics import collect_loader, collect_handlers, collect_logger
+from icarus_v2.backend.pubsub import EventBus
+from icarus_v2.backend.sentry import Sentry
+from icarus_v2.backend.worker import Worker
+from icarus_v2.backend.pressurize_handler import PressurizeHandler
+from icarus_v2.backend.depressurize_handler import DepressurizeHandler
+from icarus_v2.backend.period_handler import PeriodHandler
+from icarus_v2.backend.pressure_handler import PressureHandler
+from icarus_v2.backend.pump_handler import PumpHandler
+from icarus_v2.backend.log_handler import LogHandler
+
+
+# Topics of a Pipeline besides the event types of Event, and what they carry
+LOG = "log"                     # bool: new state of the log bit. False while an experiment is running.
+WARNING = "warning"             # SentryWarning
+ERROR = "error"                 # SentryError
+DISCONNECTED = "disconnected"   # Nothing. The device was lost or a raw log ended.
+STOPPED = "stopped"             # Nothing. The pipeline has finished. Ends every EventStream.
+
+
+# Acquisition, event detection, logging and the sentry, without Qt or an event loop.
+# Every event is published on self.bus under its event type, e.g. Event.DEPRESSURIZE, and everything else under
+# the topics above. Subscribers are called in the thread that detected the event:
+#   subscribe(topic, callback)      plain callbacks
+#   events(topic)                   an asyncio EventStream, for `async for event in pipeline.events(Event.PUMP)`
+#   QtPipelineAdapter(pipeline)     Qt signals like those of DataHandler
+# Runs either live, with the loader and handlers in their own threads (start, stop), or synchronously
+# as fast as the device can be read until it ends (run_to_end), e.g. to reprocess a raw log.
+# device may be any device with the interface of DataqInterface, e.g. a RawLogReader or SyntheticPressureDevice.
+# clock replaces time() for event timestamps. Events are logged to logger if given, whose file must be opened by the caller.
+class Pipeline(Worker):
+    def __init__(self, device, logger=None, clock=None, buffer_seconds=120, shared_memory=False) -> None:
+        super().__init__()
+        self.bus = EventBus()
+        self.device = device
+        self.loader = BufferLoader(buffer_seconds, shared_memory)
+        self.loader.set_device(device)
+        self.loader.device_disconnected.connect(self.bus.topic(DISCONNECTED).emit)
+
+        # Same handler configuration as DataHandler
+        sample_rate = device.sample_rate
+        event_update_hz = 30
+        pressure_update_hz = 5
+        event_display_bounds = (-10, 140)
+        self.handlers = [
+            PressurizeHandler(self.loader, self.bus.topic(Event.PRESSURIZE), sample_rate, event_update_hz, event_display_bounds),
+            DepressurizeHandler(self.loader, self.bus.topic(Event.DEPRESSURIZE), sample_rate, event_update_hz, event_display_bounds),
+            PeriodHandler(self.loader, self.bus.topic(Event.PERIOD), sample_rate, event_update_hz, event_display_bounds),
+            PressureHandler(self.loader, self.bus.topic(Event.PRESSURE), sample_rate, pressure_update_hz),
+            PumpHandler(self.loader, self.bus.topic(Event.PUMP), sample_rate),
+            LogHandler(self.loader, self.bus.topic(LOG), sample_rate, pressure_update_hz),
+        ]
+        for handler in self.handlers:
+            handler.set_scan_list(device.scan_list)
+            if clock is not None:
+                handler.clock = clock
+
+        self.sentry = Sentry()
+        self.subscribe(LOG, self.sentry.handle_experiment)
+        self.subscribe(Event.PUMP, self.sentry.handle_pump)
+        self.subscribe(Event.DEPRESSURIZE, self.sentry.handle_depressurize)
+        self.sentry.warning_signal.connect(self.bus.topic(WARNING).emit)
+        self.sentry.error_signal.connect(self.bus.topic(ERROR).emit)
+
+        self.logger = logger
+        if logger is not None:
+            logger.set_device_settings(device.get_device_settings())
+            for event_type in [Event.PRESSURIZE, Event.DEPRESSURIZE, Event.PERIOD, Event.PRESSURE]:
+                self.subscribe(event_type, self.log_event)
+            self.subscribe(WARNING, logger.log_error)
+            self.subscribe(ERROR, logger.log_error)
+
+        # Optional object with a measure(stage) context manager, used to time each stage of run_to_end()
+        self.profiler = None
+        self.stopping = False
+
+    # Returns a function which unsubscribes the callback again
+    def subscribe(self, topic, callback):
+        return self.bus.subscribe(topic, callback)
+
+    # Must be called from a running asyncio event loop, or given one
+    def events(self, topic, maxsize=1000, loop=None):
+        return EventStream(self.bus, topic, maxsize=maxsize, loop=loop, end=STOPPED)
+
+    # Samples for MetricsRegistry().add_collector(pipeline.collect_metrics)
+    def collect_metrics(self):
+        samples = collect_loader(self.loader) + collect_handlers(self.handlers)
+        if self.logger is not None:
+            samples += collect_logger(self.logger, "pipeline")
+        return samples
+
+    def measure(self, stage):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.measure(stage)
+
+    def log_event(self, event):
+        with self.measure("logger"):
+            self.logger.log_event(event)
+
+    # Starts acquiring and detecting in the background until stop() is called or the device is lost
+    def start(self):
+        self.stopping = False
+        for handler in self.handlers:
+            handler.start()
+        self.loader.start()
+        super().start()
+
+    # Waits for the loader to finish, then for the handlers.
+    # Runs in its own thread so that STOPPED is published after every event, however acquisition ended.
+    def run(self):
+        self.loader.wait()
+        for handler in self.handlers:
+            handler.quit()
+        for handler in self.handlers:
+            handler.wait()
+
+        # A device which was lost or reached the end of its data is not closed by the loader
+        if not self.stopping:
+            try:
+                self.device.close_device()
+            except Exception:
+                pass
+        if self.logger is not None:
+            self.logger.close()
+        self.bus.publish(STOPPED)
+
+    # Stops and closes the device. Events already being detected are still published.
+    def quit(self):
+        self.stopping = True
+        self.loader.quit()
+
+    def stop(self):
+        self.quit()
+        self.wait()
+
+    # Reads and processes the device as fast as possible until it reports "End of file reached."
+    # Handlers are driven synchronously after every block instead of from their threads.
+    # Returns the number of samples processed.
+    def run_to_end(self):
+        self.device.start_scan()
+
+        while True:
+            try:
+                with self.measure("read"):
+                    data = self.device.read_data(self.loader.block_bytes)
+            except RuntimeError as e:
+                if "End of file reached." in str(e):
+                    break
+                raise e
+
+            with self.measure("load"):
+                self.loader.load(data)
+            for handler in self.handlers:
+                with self.measure(type(handler).__name__):
+                    handler.process_available()
+
+        # Handle remaining data without waiting for data that will never arrive
+        for handler in self.handlers:
+            handler.data_timeout = 0
+            with self.measure(type(handler).__name__):
+                handler.process_available(final=True)
+
+        self.device.end_scan()
+        self.device.stop()
+        self.device.close_device()
+        if self.logger is not None:
+            with self.measure("logger"):
+                self.logger.close()
+        self.bus.publish(STOPPED)
+
+        return self.loader.buffer.write_index
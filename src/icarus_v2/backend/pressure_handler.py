@@ -9,18 +9,10 @@ class PressureHandler(EventHandler):
         self.event_type = Event.PRESSURE
 
 
-    # Loops to transmit data if an event occurs
     # Overridden because events always occur for this handler and all data is used
-    def run(self):
-        self.running = True
-        while(self.running):
-            data_to_get = int(self.sample_rate / self.update_rate)
-            try:
-                data, buffer_index = self.reader.read(size=data_to_get, timeout=1)
-            except TimeoutError:
-                self.running = False
-                break
-
-            # Transmit data to plot
-            new_event = Event(self.event_type, data)
-            self.signal.emit(new_event)
+    def process_chunk(self, data, buffer_index):
+        # Transmit data to plot
+        new_event = Event(self.event_type, data, clock=self.clock, sample_rate=self.sample_rate, scan_list=self.scan_list)
+        self.trace(new_event, buffer_index + len(data) - 1)
+        self.events_emitted += 1
+        self.signal.emit(new_event)
@@ -12,6 +12,10 @@ class PressurizeHandler(EventHandler):
         self.event_type = Event.PRESSURIZE
 
 
+    def reset(self):
+        self.last_pressurize_bit = None
+
+
     # Data: one chunk from the reader
     # Returns whether an event occurs and the index of the event
     def detect_event(self, data):
@@ -0,0 +1,54 @@
+import threading
+import traceback
+
+
+# Qt-free replacement for a Signal. Callbacks are called in the thread that emits, in the order they were connected.
+# Has the connect(), disconnect() and emit() of a Signal, so objects taking a signal may be given a Topic instead.
+# To deliver to another thread, connect the emit of a Qt Signal (see qt_adapter) or use an asyncio EventStream.
+class Topic:
+    def __init__(self, name=None) -> None:
+        self.name = name
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def connect(self, callback):
+        with self.lock:
+            self.callbacks = self.callbacks + [callback]
+
+    # Disconnects every callback if none is given
+    def disconnect(self, callback=None):
+        with self.lock:
+            if callback is None:
+                self.callbacks = []
+            else:
+                self.callbacks = [c for c in self.callbacks if c != callback]
+
+    # A failing subscriber does not stop the others or the thread that emits
+    def emit(self, *args):
+        for callback in self.callbacks:
+            try:
+                callback(*args)
+            except Exception:
+                traceback.print_exc()
+
+
+# Topics by name, e.g. Event.DEPRESSURIZE or "error". Topics are created when first used.
+class EventBus:
+    def __init__(self) -> None:
+        self.topics = {}
+        self.lock = threading.Lock()
+
+    def topic(self, name):
+        with self.lock:
+            if name not in self.topics:
+                self.topics[name] = Topic(name)
+            return self.topics[name]
+
+    # Returns a function which unsubscribes the callback again
+    def subscribe(self, name, callback):
+        topic = self.topic(name)
+        topic.connect(callback)
+        return lambda: topic.disconnect(callback)
+
+    def publish(self, name, *args):
+        self.topic(name).emit(*args)
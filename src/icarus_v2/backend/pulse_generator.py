@@ -1,6 +1,9 @@
-from PySide6.QtCore import QThread
-from time import sleep, time
+import threading
+from collections import deque
+from time import sleep, perf_counter
+import numpy as np
 from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.worker import Worker
 
 
 # DIGITAL
@@ -12,7 +15,56 @@ from icarus_v2.backend.configuration_manager import ConfigurationManager
 # CH5: spare
 # CH6: spare
 
-class PulseGenerator(QThread):
+# Seconds before a deadline at which sleeping stops and spinning starts. Covers the usual oversleep of sleep().
+SPIN_TIME = 0.002
+# Upper edges (ms) of the bins of the edge lateness histograms. The last bin holds everything later.
+LATENESS_BINS_MS = [0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10]
+
+
+# Planned and actual times of the valve edges of PulseGenerator, in perf_counter() seconds.
+# Lateness is the time from the planned edge to the dout command being written.
+class EdgeTiming:
+    def __init__(self, history_size=10000) -> None:
+        self.edges = {} # name: deque of (planned, actual)
+        self.history_size = history_size
+
+    def record(self, name, planned, actual):
+        if name not in self.edges:
+            self.edges[name] = deque(maxlen=self.history_size)
+        self.edges[name].append((planned, actual))
+
+    def clear(self):
+        self.edges = {}
+
+    # Lateness of every edge with this name, in ms
+    def get_lateness(self, name):
+        edges = np.array(list(self.edges.get(name, [])), dtype=np.float64).reshape(-1, 2)
+        return 1000 * (edges[:, 1] - edges[:, 0])
+
+    # Counts of edges in each bin of LATENESS_BINS_MS, then of edges later than the last bin
+    def get_histogram(self, name):
+        lateness = self.get_lateness(name)
+        bins = np.searchsorted(LATENESS_BINS_MS, lateness)
+        return np.bincount(bins, minlength=len(LATENESS_BINS_MS) + 1).tolist()
+
+    # Count, mean, max and 99th percentile lateness (ms) and histogram of every edge
+    def get_metrics(self):
+        metrics = {"bins_ms": LATENESS_BINS_MS}
+        for name in list(self.edges):
+            lateness = self.get_lateness(name)
+            if len(lateness) == 0:
+                continue
+            metrics[name] = {
+                "count": len(lateness),
+                "mean_ms": float(np.mean(lateness)),
+                "max_ms": float(np.max(lateness)),
+                "p99_ms": float(np.percentile(lateness, 99)),
+                "histogram": self.get_histogram(name),
+            }
+        return metrics
+
+
+class PulseGenerator(Worker):
     PUMP = 0
     DEPRESSURIZE = 1
     PRESSURIZE = 2
@@ -30,13 +82,28 @@ class PulseGenerator(QThread):
 
         # Whether the device should be currently generating pulses
         self.pulsing = False
+        # Set once the interlock has put the device in its safe state. Pulses in progress then write nothing more,
+        # so they cannot close the valves it opened. Cleared when pulsing starts again.
+        self.interlocked = False
+        # Held for every read-modify-write of DIO, as the interlock writes from the thread of the sentry
+        self.dio_lock = threading.Lock()
+        self.timing = EdgeTiming()
+        # ValveCalibrator measuring the edges in self.timing. Used to correct pulse widths if compensate_latency is set.
+        self.calibrator = None
 
     def set_device(self, device):
         self.device = device
 
-    # Pressurizes and depressurizes at regular intervals
+    def set_calibrator(self, calibrator):
+        self.calibrator = calibrator
+
+    # Pressurizes and depressurizes at regular intervals.
+    # Every edge has an absolute deadline, so periods do not drift by the time taken to sleep and write commands.
     def run(self):
         self.pulsing = True
+        self.interlocked = False
+        self.timing.clear()
+        begin_time = perf_counter()
         while self.pulsing:
             # Make sure widths are not edited in the middle of a period.
             # Otherwise, this could cause sleeping for negative times.
@@ -44,29 +111,33 @@ class PulseGenerator(QThread):
             depressurize_width = self.settings["depressurize_width"]
             period_width = self.settings["period_width"]
             delay_width = self.settings["delay_width"]
-            # Get time before setting DIO for more precise timing
-            begin_time = time()
 
-            self._pulse_low(self.DEPRESSURIZE, depressurize_width)
-            if not self.no_hang_sleep(begin_time + delay_width):
+            if not self._pulse_low(self.DEPRESSURIZE, depressurize_width, begin_time, "depressurize"):
+                break
+            if not self._pulse_low(self.PRESSURIZE, pressurize_width, begin_time + delay_width, "pressurize"):
                 break
 
-            self._pulse_low(self.PRESSURIZE, pressurize_width)
-            if not self.no_hang_sleep(begin_time + period_width):
+            begin_time += period_width
+            # Start again from now rather than pulsing in quick succession if more than a period behind
+            if perf_counter() > begin_time + period_width:
+                begin_time = perf_counter()
+            if not self.sleep_until(begin_time):
                 break
 
-    # Sleep until end_time, checking for self.pulsing frequently
-    # Returns False if self.pulsing becomes false, true otherwise
-    def no_hang_sleep(self, end_time, running_check_hz=10):
-        remaining_time = end_time - time()
-        while remaining_time >= 0:
-            sleep_time = min(1 / running_check_hz, remaining_time)
-            sleep(sleep_time)
-            remaining_time = end_time - time()
+    # Sleep until end_time (perf_counter() seconds), checking for self.pulsing frequently.
+    # The last SPIN_TIME is spent spinning, since sleep() can wake late.
+    # Returns False if self.pulsing becomes false and interruptible, true otherwise
+    def sleep_until(self, end_time, interruptible=True, running_check_hz=10):
+        remaining_time = end_time - perf_counter()
+        while remaining_time > SPIN_TIME:
+            sleep(min(1 / running_check_hz, remaining_time - SPIN_TIME))
+            remaining_time = end_time - perf_counter()
 
-            if not self.pulsing:
+            if interruptible and not self.pulsing:
                 return False
-        return True
+        while perf_counter() < end_time:
+            pass
+        return self.pulsing or not interruptible
 
     def set_pressurize_low(self):
         self._set_low(self.PRESSURIZE)
@@ -90,68 +161,115 @@ class PulseGenerator(QThread):
         if key == 'timing_settings':
             self.settings = self.config_manager.get_settings(key)
 
-    # Sets channel low for duration milliseconds
+    # Sets channel low at start_time (perf_counter() seconds) for duration milliseconds.
+    # Edges are recorded in self.timing as name_low and name_high.
+    # Returns False if pulsing stopped before the pulse started.
     # Raises RuntimeError if channel is already low
-    def _pulse_low(self, channel, duration):
+    def _pulse_low(self, channel, duration, start_time, name):
         if self.device is None:
             raise RuntimeError("Running PulseGenerator when device is not initialized")
-        # int representing the current state of dio
-        current_dio = self.device.get_current_dio()
+        if not self.sleep_until(start_time):
+            return False
         # binary representation of channel to pulse
         channel_bit = 2 ** channel
 
-        # Make sure the channel we are pulsing starts high.
-        if not current_dio & channel_bit: # bitwise AND
-            raise RuntimeError(f"Error: pulsing low digital channel {channel} which is already low.")
-
-        # Get time before setting DIO for more precise timing
-        current_time = time()
-
         # Set specified channel low
-        self.device.set_dio(current_dio ^ channel_bit) # bitwise XOR
-
-        # Sleep for remaining time
+        with self.dio_lock:
+            if self.interlocked:
+                return False
+            # int representing the current state of dio
+            current_dio = self.device.get_current_dio()
+            # Make sure the channel we are pulsing starts high.
+            if not current_dio & channel_bit: # bitwise AND
+                raise RuntimeError(f"Error: pulsing low digital channel {channel} which is already low.")
+            low_time = self._set_dio(current_dio ^ channel_bit) # bitwise XOR
+        self.timing.record(name + "_low", start_time, low_time)
+
+        # Time the width from when the channel actually went low.
+        # The pulse is never cut short, even if pulsing stops during it.
         duration_sec = float(duration) / 1000
-        time_elapsed = time() - current_time
-        remaining_time = max(0, duration_sec - time_elapsed)
-        sleep(remaining_time)
+        end_time = low_time + duration_sec - self.get_width_correction(name, duration_sec)
+        self.sleep_until(end_time, interruptible=False)
 
-        # Reset to original DIO
-        self.device.set_dio(current_dio)
+        # Set channel high again, keeping any other channel changed during the pulse
+        with self.dio_lock:
+            if self.interlocked:
+                return False
+            high_time = self._set_dio(self.device.get_current_dio() | channel_bit) # bitwise OR
+        self.timing.record(name + "_high", end_time, high_time)
+        return True
+
+    # Seconds by which the valve stays low longer than the commands for it, if compensating for it.
+    # Limited to half of the pulse.
+    def get_width_correction(self, name, duration_sec):
+        if self.calibrator is None or not self.settings.get("compensate_latency", False):
+            return 0
+        estimate = self.calibrator.get_estimate(name)
+        if estimate is None:
+            return 0
+        _, _, width_error = estimate
+        return min(max(width_error, -duration_sec / 2), duration_sec / 2)
+
+    # Devices which write DIO asynchronously return the time the command was written. Others are written on return.
+    def _set_dio(self, value):
+        written = self.device.set_dio(value)
+        return perf_counter() if written is None else written
+
+    # Stops pulsing and writes the pump high and both valves low in one command.
+    # Called by the interlock from the thread of the sentry.
+    # Pulsing is not waited for, as its thread stops by itself once it sees self.interlocked.
+    # Returns the time the safe state was written.
+    def set_safe_state(self):
+        self.pulsing = False
+        if self.device is None:
+            raise RuntimeError("Running PulseGenerator when device is not initialized")
+        with self.dio_lock:
+            self.interlocked = False
+            valve_bits = 2 ** self.PRESSURIZE | 2 ** self.DEPRESSURIZE
+            safe_dio = (self.device.get_current_dio() | 2 ** self.PUMP) & ~valve_bits
+            written = self._set_dio(safe_dio)
+            self.interlocked = True
+        return written
+
+    # Edge lateness statistics of the current or last run
+    def get_timing_metrics(self):
+        return self.timing.get_metrics()
 
     # Sets channel low
     # Raises RuntimeError if channel is already low
     def _set_low(self, channel):
         if self.device is None:
             raise RuntimeError("Running PulseGenerator when device is not initialized")
-        # int representing the current state of dio
-        current_dio = self.device.get_current_dio()
         # binary representation of channel to pulse
         channel_bit = 2 ** channel
 
-        # Make sure the channel we are setting starts high.
-        if not current_dio & channel_bit:  # bitwise AND
-            raise RuntimeError(f"Error: setting low digital channel {channel} which is already low.")
+        with self.dio_lock:
+            # int representing the current state of dio
+            current_dio = self.device.get_current_dio()
+            # Make sure the channel we are setting starts high.
+            if not current_dio & channel_bit:  # bitwise AND
+                raise RuntimeError(f"Error: setting low digital channel {channel} which is already low.")
 
-        # set low
-        self.device.set_dio(current_dio ^ channel_bit)  # bitwise XOR
+            # set low
+            self.device.set_dio(current_dio ^ channel_bit)  # bitwise XOR
 
     # Sets channel high
     # Raises RuntimeError if channel is already high
     def _set_high(self, channel):
         if self.device is None:
             raise RuntimeError("Running PulseGenerator when device is not initialized")
-        # int representing the current state of dio
-        current_dio = self.device.get_current_dio()
         # binary representation of channel to pulse
         channel_bit = 2 ** channel
 
-        # Make sure the channel we are setting starts low.
-        if current_dio & channel_bit:  # bitwise AND
-            raise RuntimeError(f"Error: setting high digital channel {channel} which is already high.")
+        with self.dio_lock:
+            # int representing the current state of dio
+            current_dio = self.device.get_current_dio()
+            # Make sure the channel we are setting starts low.
+            if current_dio & channel_bit:  # bitwise AND
+                raise RuntimeError(f"Error: setting high digital channel {channel} which is already high.")
 
-        # set high
-        self.device.set_dio(current_dio | channel_bit)  # bitwise OR
+            # set high
+            self.device.set_dio(current_dio | channel_bit)  # bitwise OR
 
     def quit(self):
         self.pulsing = False
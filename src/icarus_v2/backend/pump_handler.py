@@ -9,10 +9,13 @@ from icarus_v2.backend.event import Channel, get_channel, Event
 # Only the points which initially exceed the thresholds are considered.
 class PumpHandler(EventHandler):
     def __init__(self, loader, signal, sample_rate) -> None:
-        self.sigma = 5
+        # Widths in ms. Converted to samples by set_sample_rate.
+        self.sigma_ms = 1.25
+        self.kernel_ms = 6.25 # half width of the gaussian kernel
+        self.peak_ms = 8.75 # distance on each side of a stroke which must be lower
+        self.overlap_ms = 500 # data to add before each chunk
         self.threshold = 0.01
 
-        self.overlap = 2000 # number of points to add before each chunk
         self.overlap_data = None
 
         self.event_report_range = (-50, 1500)
@@ -22,51 +25,56 @@ class PumpHandler(EventHandler):
         super().__init__(loader, signal, sample_rate, update_rate)
 
 
+    def set_sample_rate(self, sample_rate):
+        super().set_sample_rate(sample_rate)
+        sample_rate_kHz = float(sample_rate) / 1000
+        self.sigma = self.sigma_ms * sample_rate_kHz
+        self.kernel_width = int(round(self.kernel_ms * sample_rate_kHz))
+        self.peak_width = int(round(self.peak_ms * sample_rate_kHz))
+        self.overlap = int(round(self.overlap_ms * sample_rate_kHz)) # number of points to add before each chunk
+        self.overlap_data = None
+
+
     # Override
-    # Loops to transmit data if an event occurs
-    def run(self):
-        self.running = True
-        while self.running:
-            # Make sure to fetch a multiple of the average_every points
-            data_to_get = int(self.sample_rate / self.update_rate)
-            try:
-                data, buffer_index = self.reader.read(size=data_to_get, timeout=1)
-            except TimeoutError:
-                self.running = False
-                break
-
-            target_pressure = get_channel(data, Channel.TARGET)
-
-            if self.overlap_data is not None:
-                target_pressure = np.concatenate((self.overlap_data, target_pressure))
-
-            x = np.arange(-25, 26)
-            y = np.exp(-0.5 * (x / self.sigma) ** 2)
-            dy2 = np.roll(y, -1) + np.roll(y, 1) - 2 * y
-            dy2 /= dy2.min()
-            corr = np.correlate(target_pressure, dy2, mode='same') / np.correlate(target_pressure, y, mode='same')
-            stroke = (np.roll(corr, -1) < corr) & (np.roll(corr, 1) < corr) & (corr > self.threshold) & (
-                    np.roll(target_pressure, -35) < target_pressure) & (
-                             np.roll(target_pressure, 35) < target_pressure) & (target_pressure > 2000)
-
-            # Remove detections near the edges
-            if self.overlap_data is not None:
-                stroke[:int(self.overlap / 2)] = False
-            stroke[-int(self.overlap / 2):] = False
-
-            indices = np.where(stroke)[0]
-
-            # Emit for every dip
-            for i in indices:
-                event_index = buffer_index + i - self.overlap
-                event_data = self.get_event_data(event_index)
-                if event_data is not None:
-                    sample_rate_kHz = float(self.sample_rate) / 1000
-                    chunk_event_index = int( - self.event_report_range[0] * sample_rate_kHz)
-                    new_event = Event(self.event_type, event_data, chunk_event_index)
-                    self.signal.emit(new_event)
-
-            self.overlap_data = target_pressure[-self.overlap:]
+    # Transmits an event for every pump stroke in the chunk
+    def process_chunk(self, data, buffer_index):
+        target_pressure = get_channel(data, Channel.TARGET, self.scan_list)
+
+        if self.overlap_data is not None:
+            target_pressure = np.concatenate((self.overlap_data, target_pressure))
+
+        x = np.arange(-self.kernel_width, self.kernel_width + 1)
+        y = np.exp(-0.5 * (x / self.sigma) ** 2)
+        dy2 = np.roll(y, -1) + np.roll(y, 1) - 2 * y
+        dy2 /= dy2.min()
+        corr = np.correlate(target_pressure, dy2, mode='same') / np.correlate(target_pressure, y, mode='same')
+        stroke = (np.roll(corr, -1) < corr) & (np.roll(corr, 1) < corr) & (corr > self.threshold) & (
+                np.roll(target_pressure, -self.peak_width) < target_pressure) & (
+                         np.roll(target_pressure, self.peak_width) < target_pressure) & (target_pressure > 2000)
+
+        # Remove detections near the edges
+        if self.overlap_data is not None:
+            stroke[:int(self.overlap / 2)] = False
+        stroke[-int(self.overlap / 2):] = False
+
+        indices = np.where(stroke)[0]
+
+        # Emit for every dip
+        for i in indices:
+            event_index = buffer_index + i - self.overlap
+            event_data = self.get_event_data(event_index)
+            if event_data is not None:
+                sample_rate_kHz = float(self.sample_rate) / 1000
+                chunk_event_index = int( - self.event_report_range[0] * sample_rate_kHz)
+                new_event = Event(self.event_type, event_data, chunk_event_index, clock=self.clock,
+                                  sample_rate=self.sample_rate, scan_list=self.scan_list)
+                self.trace(new_event, self.event_end - 1)
+                self.events_emitted += 1
+                self.signal.emit(new_event)
+            else:
+                self.events_dropped += 1
+
+        self.overlap_data = target_pressure[-self.overlap:]
 
     def reset(self):
         self.overlap_data = None
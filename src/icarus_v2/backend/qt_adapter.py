@@ -0,0 +1,43 @@
+from PySide6.QtCore import QObject, Signal
+from icarus_v2.backend.event import Event
+from icarus_v2.backend.pipeline import LOG, WARNING, ERROR, DISCONNECTED, STOPPED
+
+
+# Emits signal whenever topic is. Slots run in the thread of the object they belong to, as for any Qt signal,
+# so this is how a Topic emitted by a worker thread reaches an object owned by an event loop.
+def forward(topic, signal):
+    topic.connect(signal.emit)
+
+
+# Qt adapter of a Pipeline. Has the event, log and sentry signals of DataHandler, so widgets may show a Pipeline.
+class QtPipelineAdapter(QObject):
+    pressurize_event_signal = Signal(Event)
+    depressurize_event_signal = Signal(Event)
+    period_event_signal = Signal(Event)
+    pressure_event_signal = Signal(Event)
+    pump_event_signal = Signal(Event)
+    log_signal = Signal(bool)
+    # Show warning or error in toolbar
+    toolbar_warning = Signal(str, str)
+    # display error dialog
+    display_error = Signal(str)
+    # The device was lost or a raw log ended
+    disconnected_signal = Signal()
+    # The pipeline has finished
+    stopped_signal = Signal()
+
+    def __init__(self, pipeline) -> None:
+        super().__init__()
+        self.pipeline = pipeline
+        bus = pipeline.bus
+        forward(bus.topic(Event.PRESSURIZE), self.pressurize_event_signal)
+        forward(bus.topic(Event.DEPRESSURIZE), self.depressurize_event_signal)
+        forward(bus.topic(Event.PERIOD), self.period_event_signal)
+        forward(bus.topic(Event.PRESSURE), self.pressure_event_signal)
+        forward(bus.topic(Event.PUMP), self.pump_event_signal)
+        forward(bus.topic(LOG), self.log_signal)
+        forward(bus.topic(DISCONNECTED), self.disconnected_signal)
+        forward(bus.topic(STOPPED), self.stopped_signal)
+        bus.subscribe(WARNING, lambda x: self.toolbar_warning.emit(str(x), "orange"))
+        bus.subscribe(ERROR, lambda x: self.toolbar_warning.emit(str(x), "red"))
+        bus.subscribe(ERROR, lambda x: self.display_error.emit(str(x)))
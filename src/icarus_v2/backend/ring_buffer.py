@@ -1,4 +1,8 @@
-from threading import Event
+import os
+from threading import Condition
+from time import sleep, monotonic
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
 import numpy as np
 
 # One producer, N consumer, which each read sequentially from the start without skipping any data.
@@ -12,7 +16,7 @@ class RingBuffer:
         self.capacity = shape[0]
         self.buffer = np.empty(shape, dtype=dtype)
         self.write_index = 0
-        self.new_data = Event() # Notifies waiting threads when new data has been enqueued
+        self.condition = Condition() # Notifies waiting threads when new data has been enqueued
 
 
     # Data is copied by reference. Be careful about changing data.
@@ -26,21 +30,164 @@ class RingBuffer:
         else:
             self.buffer[start:] = data[:self.capacity - start]
             self.buffer[:end - self.capacity] = data[self.capacity - start:]
-        self.write_index += len(data)
-
         # Notify readers that new data is available
-        self.new_data.set()
+        with self.condition:
+            self.write_index += len(data)
+            self.condition.notify_all()
+
+
+    # Blocks until index has been written. Returns False if it was not within timeout seconds.
+    def wait_for(self, index, timeout):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.write_index >= index, timeout)
+
+
+# RingBuffer in shared memory, so that processes other than the writer can read it.
+# The write index is stored at the start of the shared memory, followed by the shape and dtype of the buffer.
+# Readers in processes started with the buffer as an argument are notified of new data through a shared Condition.
+# Readers which attach by name poll the write index instead.
+# Only the process which created the buffer writes to it, including after a fork, when children inherit the object.
+# The creator must call release() to free the shared memory, and other processes should call release() when done.
+class SharedRingBuffer(RingBuffer):
+    HEADER_BYTES = 64
+    # Seconds between checks of the write index by readers without the Condition
+    POLL_INTERVAL = 0.001
+    # Names of the buffers created by this process, whose memory the resource tracker of this process already tracks
+    created = set()
+
+    # name is the name of the shared memory. A unique name is chosen if None.
+    # context is the multiprocessing context of the processes which will be given the buffer, e.g. "spawn".
+    # None uses the default start method.
+    def __init__(self, shape, dtype=int, name=None, context=None):
+        if isinstance(shape, int):
+            shape = (shape,)
+        if len(shape) > 2:
+            raise ValueError("SharedRingBuffer supports at most 2 dimensions.")
+        dtype = np.dtype(dtype)
+        size = self.HEADER_BYTES + int(np.prod(shape)) * dtype.itemsize
+        self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.owner = True
+        self.creator_pid = os.getpid()
+        SharedRingBuffer.created.add(self.memory.name)
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+        self.condition = context.Condition()
+        self.map(shape, dtype)
+        self.header[0] = 0
+        self.header[1:1 + len(shape)] = shape
+        self.header[3] = len(shape)
+        self.memory.buf[32:48] = dtype.str.encode("ascii").ljust(16, b"\0")
+
+
+    # Attaches to the shared memory of a SharedRingBuffer created by another process.
+    # tracked is True where the memory is tracked by the resource tracker of this process, which is shared with its
+    # parent. None works this out, but not while a child is unpickling its arguments, before it knows its parent.
+    @classmethod
+    def attach(cls, name, tracked=None):
+        if tracked is None:
+            tracked = multiprocessing.parent_process() is not None or name in cls.created
+        buffer = cls.__new__(cls)
+        buffer.memory = cls.open_memory(name, tracked)
+        buffer.owner = False
+        buffer.creator_pid = None
+        buffer.condition = None
+        header = np.ndarray((4,), dtype=np.int64, buffer=buffer.memory.buf)
+        shape = tuple(int(dimension) for dimension in header[1:1 + header[3]])
+        dtype = np.dtype(bytes(buffer.memory.buf[32:48]).rstrip(b"\0").decode("ascii"))
+        del header
+        buffer.map(shape, dtype)
+        return buffer
+
+
+    # Opens existing shared memory without the resource tracker freeing it when this process exits.
+    # If tracked, the tracker is shared with the creator, which already tracks it, so it is left registered.
+    @staticmethod
+    def open_memory(name, tracked):
+        memory = shared_memory.SharedMemory(name=name)
+        if not tracked:
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+    def map(self, shape, dtype):
+        self.capacity = shape[0]
+        # write index, shape (up to 2 dimensions), number of dimensions
+        self.header = np.ndarray((4,), dtype=np.int64, buffer=self.memory.buf)
+        self.buffer = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf, offset=self.HEADER_BYTES)
+
+
+    def get_name(self):
+        return self.memory.name
+
+
+    # Whether this process created the buffer. Forked children inherit the object, but not the role of writer.
+    def is_creator(self):
+        return self.owner and self.creator_pid == os.getpid()
+
+
+    # Data must be written before the index is advanced, so it is complete when readers see the new index
+    @property
+    def write_index(self):
+        return int(self.header[0])
+
+    @write_index.setter
+    def write_index(self, value):
+        self.header[0] = value
+
+
+    def enqueue(self, data):
+        if not self.is_creator():
+            raise RuntimeError("Only the process which created a SharedRingBuffer can write to it.")
+        super().enqueue(data)
+
+
+    def wait_for(self, index, timeout):
+        if self.condition is not None:
+            return super().wait_for(index, timeout)
+        deadline = monotonic() + timeout
+        while self.write_index < index:
+            if monotonic() >= deadline:
+                return False
+            sleep(self.POLL_INTERVAL)
+        return True
+
+
+    # Passed to child processes by name. The Condition is inherited when the process is started.
+    # Children of the creator share its resource tracker.
+    def __getstate__(self):
+        return {"name": self.memory.name, "condition": self.condition}
+
+    def __setstate__(self, state):
+        attached = SharedRingBuffer.attach(state["name"], tracked=True)
+        self.__dict__.update(attached.__dict__)
+        self.condition = state["condition"]
+
+
+    # Unmaps the shared memory, and frees it if this process created it. Views of the buffer must not be used after.
+    def release(self):
+        if self.memory is None:
+            return
+        self.header = None
+        self.buffer = None
+        self.memory.close()
+        if self.is_creator():
+            self.memory.unlink()
+            SharedRingBuffer.created.discard(self.memory.name)
+        self.memory = None
 
 
 # All readers should be terminated before the writer
+# Data from a SharedRingBuffer is copied, since views of it would point into memory unmapped by release(),
+# while events made from the data may still be in use, e.g. queued to the GUI.
 class SPMCRingBufferReader:
     def __init__(self, buffer):
         self.buffer = buffer
+        self.copy = isinstance(buffer, SharedRingBuffer)
         # Start with nothing to read
         self.read_index = buffer.write_index # Next index of the buffer for this reader to read
 
 
-    # Returns view of range of data without advancing read_index
+    # Returns view of range of data without advancing read_index, or a copy for a SharedRingBuffer
     def retrieve_range(self, start, end, timeout=2):
         cap = self.buffer.capacity
         start = max(0, start)
@@ -53,11 +200,8 @@ class SPMCRingBufferReader:
             raise RuntimeError(f"Reader was lapped. Reading at {self.read_index} when head is at {self.buffer.write_index}.")
 
         # Wait for data to be available up till end
-        while end > self.buffer.write_index:
-            if self.buffer.new_data.wait(timeout):
-                self.buffer.new_data.clear()
-            else:
-                raise TimeoutError
+        if not self.buffer.wait_for(end, timeout):
+            raise TimeoutError
 
         # Case where range goes through end of buffer
         if end % cap < start % cap:
@@ -65,7 +209,8 @@ class SPMCRingBufferReader:
             a2 = self.buffer.buffer[:end % cap]
             return np.concatenate((a1,a2))
         else:
-            return self.buffer.buffer[start % cap:end % cap]
+            data = self.buffer.buffer[start % cap:end % cap]
+            return data.copy() if self.copy else data
 
 
     # Read block of size size starting at the last index read by this reader
@@ -0,0 +1,164 @@
+import gc
+import os
+import sys
+import threading
+from time import perf_counter
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.metrics import MetricsRegistry, GAUGE
+
+
+# Niceness of the acquisition thread when its priority is raised. Lower runs first. Needs CAP_SYS_NICE on Linux.
+ACQUISITION_NICE = -10
+# Threshold of the oldest generation while collections of it are deferred. Young collections still run.
+DEFERRED_GEN2_THRESHOLD = 1000000
+
+# What the runtime profile changed, for status and metrics
+state = {
+    "reserved_cpu": None,
+    "pinned_cpu": None,
+    "nice": None,
+    "gc_deferred": False,
+}
+state_lock = threading.Lock()
+
+
+# Keeps acquisition_cpu of runtime_settings for the acquisition thread, by removing it from the CPUs of the calling
+# thread. Threads inherit the CPUs of the thread that creates them, so this must be called from the main thread before
+# the other threads are started. Nothing is changed if that would leave no CPU, or on systems without affinity.
+def reserve_acquisition_cpu():
+    cpu = ConfigurationManager().get_settings("runtime_settings")["acquisition_cpu"]
+    if cpu is None or not hasattr(os, "sched_setaffinity"):
+        return
+    cpus = os.sched_getaffinity(0)
+    if cpu not in cpus or len(cpus) == 1:
+        print(f"CPU {cpu} cannot be reserved for acquisition. Available CPUs: {sorted(cpus)}", file=sys.stderr)
+        return
+    os.sched_setaffinity(0, cpus - {cpu})
+    with state_lock:
+        state["reserved_cpu"] = cpu
+
+
+# Pins the calling thread to acquisition_cpu and raises its priority if raise_priority is set.
+# Called by the acquisition thread. Failures, e.g. from missing permissions, are printed and otherwise ignored.
+def apply_acquisition_profile():
+    settings = ConfigurationManager().get_settings("runtime_settings")
+    cpu = settings["acquisition_cpu"]
+    pinned = None
+    nice = None
+
+    # On Linux, both calls apply only to the calling thread when given 0
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+            pinned = cpu
+        except OSError as e:
+            print(f"Could not pin acquisition to CPU {cpu}: {e}", file=sys.stderr)
+    if settings["raise_priority"] and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, ACQUISITION_NICE)
+            nice = ACQUISITION_NICE
+        except OSError as e:
+            print(f"Could not raise the priority of acquisition: {e}", file=sys.stderr)
+
+    with state_lock:
+        state["pinned_cpu"] = pinned
+        state["nice"] = nice
+
+
+# Times every garbage collection. Collections stop every thread holding the GIL, including acquisition.
+class GCTimer:
+    def __init__(self) -> None:
+        self.start = None
+        registry = MetricsRegistry()
+        self.pauses = [
+            registry.summary("gc_pause_seconds", "Time taken by garbage collections.", generation=str(generation))
+            for generation in range(3)
+        ]
+
+    # Called by the collector in whichever thread triggered it. Collections never overlap.
+    def __call__(self, phase, info):
+        if phase == "start":
+            self.start = perf_counter()
+        elif self.start is not None:
+            self.pauses[info["generation"]].observe(perf_counter() - self.start)
+            self.start = None
+
+    def install(self):
+        if self not in gc.callbacks:
+            gc.callbacks.append(self)
+
+    def remove(self):
+        if self in gc.callbacks:
+            gc.callbacks.remove(self)
+
+
+# Defers collections of the oldest generation while an experiment runs, if defer_gc is set in runtime_settings.
+# Objects existing when the experiment starts are frozen, so the collections which still run do not traverse them.
+# Everything is collected normally again once the experiment ends.
+class GCController:
+    def __init__(self) -> None:
+        self.config_manager = ConfigurationManager()
+        self.defer = self.config_manager.get_settings("runtime_settings")["defer_gc"]
+        self.config_manager.settings_updated.connect(self.update_settings)
+        self.experiment_running = False
+        self.saved_threshold = None
+        self.timer = GCTimer()
+        self.timer.install()
+
+    # Connected to the log bit, which is False while an experiment runs
+    def set_log_bit(self, log_bit):
+        self.set_experiment(not log_bit)
+
+    def set_experiment(self, running):
+        self.experiment_running = running
+        if running and self.defer:
+            self.defer_collections()
+        else:
+            self.restore_collections()
+
+    def defer_collections(self):
+        if self.saved_threshold is not None:
+            return
+        self.saved_threshold = gc.get_threshold()
+        gc.freeze()
+        gc.set_threshold(self.saved_threshold[0], self.saved_threshold[1], DEFERRED_GEN2_THRESHOLD)
+        with state_lock:
+            state["gc_deferred"] = True
+
+    def restore_collections(self):
+        if self.saved_threshold is None:
+            return
+        gc.set_threshold(*self.saved_threshold)
+        gc.unfreeze()
+        self.saved_threshold = None
+        with state_lock:
+            state["gc_deferred"] = False
+
+    def update_settings(self, key):
+        if key == "runtime_settings":
+            self.defer = self.config_manager.get_settings(key)["defer_gc"]
+            self.set_experiment(self.experiment_running)
+
+    def close(self):
+        self.restore_collections()
+        self.timer.remove()
+
+
+def get_runtime_profile():
+    with state_lock:
+        return dict(state)
+
+
+# Samples of the metrics registry
+def collect_runtime_profile():
+    current = get_runtime_profile()
+    samples = [
+        (GAUGE, "gc_deferred", "Whether collections of the oldest generation are deferred.", {},
+         int(current["gc_deferred"])),
+        (GAUGE, "gc_frozen_objects", "Objects frozen out of garbage collection.", {}, gc.get_freeze_count()),
+    ]
+    if current["pinned_cpu"] is not None:
+        samples.append((GAUGE, "acquisition_cpu", "CPU the acquisition thread is pinned to.", {}, current["pinned_cpu"]))
+    if current["nice"] is not None:
+        samples.append((GAUGE, "acquisition_nice", "Niceness of the acquisition thread.", {}, current["nice"]))
+    return samples
@@ -1,23 +1,30 @@
 from icarus_v2.backend.event import Channel, get_channel, Event
-from PySide6.QtCore import QObject
 from icarus_v2.backend.configuration_manager import ConfigurationManager
 
 
 # Detects whether the sample sensor is connected to the sample tube by receiving depressurize events
-class SampleSensorDetector(QObject):
+class SampleSensorDetector:
     low_threshold = 0.998
     high_threshold = 1.05
 
     def __init__(self, signal=None):
-        super().__init__()
         self.config_manager = ConfigurationManager()
         self.config_manager.settings_updated.connect(self.update_settings)
         self.coefficients = self.config_manager.get_settings("plotting_coefficients")
         self.last_result = None
+        # Set by request_reset. Applied by the thread emitting events, before the next one.
+        self.reset_requested = False
 
         self.sample_sensor_connected = signal
 
+    # Forgets the last result, e.g. after a reconnect. May be called from any thread.
+    def request_reset(self):
+        self.reset_requested = True
+
     def detect(self, event):
+        if self.reset_requested:
+            self.reset_requested = False
+            self.last_result = True
         if event.event_type == Event.DEPRESSURIZE:
             if not self.detect_sensor(event):
                 # require 2 differences in a row to decrease likelihood of false positives
@@ -0,0 +1,105 @@
+import os
+import sys
+import threading
+from collections import Counter
+from time import sleep
+from icarus_v2.backend.worker import Worker
+
+
+# Seconds between samples
+SAMPLE_INTERVAL = 0.01
+# Stacks running code of this file are also aggregated under this name, as the sentry runs in the threads calling it
+SENTRY_FILE = "sentry.py"
+SENTRY = "Sentry"
+
+
+# Wall-clock sampling profiler of every thread of the process, started and stopped on demand while acquiring.
+# Every SAMPLE_INTERVAL the stacks of all threads are taken from sys._current_frames() and counted per thread,
+# so time spent waiting, e.g. for data in a handler, is included. Threads are named after the class running in
+# them, e.g. BufferLoader or PressurizeHandler, and the GUI runs in MainThread.
+# Results are in the collapsed stack format read by flamegraph.pl and https://www.speedscope.app:
+#   thread;outer function (file.py);inner function (file.py) count
+class SamplingProfiler(Worker):
+    def __init__(self, interval=SAMPLE_INTERVAL) -> None:
+        super().__init__()
+        self.interval = interval
+        self.running = False
+        self.lock = threading.Lock()
+        self.stacks = Counter() # (thread, frame, frame, ...): samples
+        self.samples = 0
+        self.labels = {} # code object: frame label
+
+    # Clears the samples of the last run
+    def start(self):
+        if self.isRunning():
+            return
+        with self.lock:
+            self.stacks = Counter()
+            self.samples = 0
+        self.running = True
+        super().start()
+
+    def run(self):
+        own_thread = threading.get_ident()
+        while self.running:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            stacks = []
+            for ident, frame in frames.items():
+                if ident == own_thread:
+                    continue
+                stack = self.get_stack(frame)
+                stacks.append((names.get(ident, f"Thread-{ident}"),) + stack)
+                for index, label in enumerate(stack):
+                    if label.endswith(f"({SENTRY_FILE})"):
+                        stacks.append((SENTRY,) + stack[index:])
+                        break
+            # Frames must not be kept alive between samples
+            frames = frame = None
+
+            with self.lock:
+                self.stacks.update(stacks)
+                self.samples += 1
+            sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+    # Collapsed stacks of every thread, or only of thread if given
+    def get_collapsed(self, thread=None):
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+        lines = [f"{';'.join(stack)} {count}" for stack, count in stacks if thread is None or stack[0] == thread]
+        return "\n".join(lines) + "\n"
+
+    # Number of samples taken and of samples of each thread
+    def get_metrics(self):
+        with self.lock:
+            threads = Counter()
+            for stack, count in self.stacks.items():
+                threads[stack[0]] += count
+            return {
+                "running": self.running,
+                "samples": self.samples,
+                "interval_ms": 1000 * self.interval,
+                "threads": dict(threads),
+            }
+
+    def export(self, path):
+        with open(path, "w") as file:
+            file.write(self.get_collapsed())
+
+    # Labels of the frames of a stack, outermost first
+    def get_stack(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                label = f"{code.co_name} ({os.path.basename(code.co_filename)})"
+                self.labels[code] = label
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
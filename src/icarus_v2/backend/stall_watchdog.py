@@ -0,0 +1,180 @@
+import os
+import sys
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+from PySide6.QtCore import QTimer, QStandardPaths
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.metrics import MetricsRegistry
+from icarus_v2.backend.worker import Worker
+
+
+# Milliseconds between heartbeats of the event loop
+HEARTBEAT_INTERVAL = 20
+# Stalls kept for reporting
+STALL_HISTORY = 100
+STALL_LOG = "stalls.log"
+# Size above which stalls.log is moved to stalls.log.1, replacing the previous one
+STALL_LOG_MAX_BYTES = 1000000
+
+
+# Detects stalls of the Qt event loop of the main thread, e.g. slow work in a slot, and what caused them.
+# A timer in the event loop beats every HEARTBEAT_INTERVAL ms. Once no beat has come for stall_threshold_ms,
+# the thread of the watchdog captures the Python stack of the main thread, which is then in the slow code, and
+# prints it, appends it to stalls.log and counts it in metrics straight away, so a loop which never recovers, e.g.
+# from a deadlock, is still reported. When the loop beats again, the full duration of the stall is reported.
+# Must be created and started in the main thread, after the QCoreApplication.
+class StallWatchdog(Worker):
+    def __init__(self) -> None:
+        super().__init__()
+        self.config_manager = ConfigurationManager()
+        self.threshold = None
+        self.update_settings()
+        self.config_manager.settings_updated.connect(self.update_settings)
+
+        self.main_thread = threading.main_thread().ident
+        self.heartbeat = perf_counter()
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.beat)
+        self.stopped = threading.Event()
+
+        # Stack of the main thread captured during the current stall
+        self.stall_stack = None
+        # perf_counter() times at which stalls ended, waiting to be reported by the watchdog thread
+        self.ended = deque()
+        # Stall being reported by the watchdog thread until the loop recovers, and the last beat before it
+        self.current_stall = None
+        self.stall_start = None
+        self.stalls = deque(maxlen=STALL_HISTORY) # dicts of time, duration_ms, location, stack and ongoing
+        self.locations = {} # location: [count, total seconds]
+        self.log_path = os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), STALL_LOG)
+
+        registry = MetricsRegistry()
+        self.stall_count = registry.counter("event_loop_stalls_total", "Stalls of the event loop of the main thread.")
+        self.stall_time = registry.summary("event_loop_stall_seconds", "Time between heartbeats of stalled event loops.")
+
+    def update_settings(self, key="watchdog_settings"):
+        if key == "watchdog_settings":
+            self.threshold = self.config_manager.get_settings(key)["stall_threshold_ms"] / 1000
+
+    def start(self):
+        self.heartbeat = perf_counter()
+        self.stopped.clear()
+        self.timer.start(HEARTBEAT_INTERVAL)
+        super().start()
+
+    # Runs in the event loop. Reporting is left to the watchdog thread to keep this cheap.
+    def beat(self):
+        now = perf_counter()
+        self.heartbeat = now
+        if self.stall_stack is not None:
+            self.stall_stack = None
+            self.ended.append(now)
+
+    def run(self):
+        while not self.stopped.wait(self.threshold / 4):
+            # A stall which ends is always reported as ended before the next one begins
+            while len(self.ended) > 0:
+                self.report_end(self.ended.popleft())
+            heartbeat = self.heartbeat
+            if self.stall_stack is None and perf_counter() - heartbeat > self.threshold:
+                stack = self.capture_stack()
+                # The loop may have beat while the stack was captured
+                if self.heartbeat == heartbeat:
+                    self.stall_stack = stack
+                    self.report_start(heartbeat, stack)
+
+    # FrameSummary list of the main thread
+    def capture_stack(self):
+        frame = sys._current_frames().get(self.main_thread)
+        if frame is None:
+            return []
+        return traceback.extract_stack(frame)
+
+    # Called once the loop has not beat for the threshold
+    def report_start(self, heartbeat, stack):
+        location = get_location(stack)
+        stall = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "duration_ms": 1000 * (perf_counter() - heartbeat),
+            "location": location,
+            "stack": traceback.format_list(stack),
+            "ongoing": True,
+        }
+        self.stall_start = heartbeat
+        self.current_stall = stall
+        self.stalls.append(stall)
+        if location not in self.locations:
+            self.locations[location] = [0, 0]
+        self.locations[location][0] += 1
+        self.stall_count.inc()
+
+        message = (f"{stall['time']} Event loop stalled for over {stall['duration_ms']:.0f} ms in {location} "
+                   f"({self.locations[location][0]} stalls there, {self.stall_count.value} in total)\n")
+        self.write(message, "".join(stall["stack"]))
+
+    # Called once the loop beats again after a stall
+    def report_end(self, end):
+        stall = self.current_stall
+        self.current_stall = None
+        if stall is None:
+            return
+        duration = end - self.stall_start
+        stall["duration_ms"] = 1000 * duration
+        stall["ongoing"] = False
+        self.locations[stall["location"]][1] += duration
+        self.stall_time.observe(duration)
+        message = (f"{datetime.now().isoformat(timespec='seconds')} Event loop recovered after "
+                   f"{stall['duration_ms']:.0f} ms in {stall['location']}\n")
+        self.write(message)
+
+    # Prints message and appends it and details to stalls.log, which is rotated once it reaches STALL_LOG_MAX_BYTES
+    def write(self, message, details=""):
+        print(message, end="", file=sys.stderr, flush=True)
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > STALL_LOG_MAX_BYTES:
+                os.replace(self.log_path, self.log_path + ".1")
+            with open(self.log_path, "a") as file:
+                file.write(message + details + ("\n" if details else ""))
+        except OSError:
+            pass
+
+    # Stall count and time of each location, and the most recent stalls. A stall still going on is included
+    # with its duration so far.
+    def get_metrics(self):
+        stall = self.current_stall
+        start = self.stall_start
+        if stall is not None and stall["ongoing"]:
+            stall["duration_ms"] = 1000 * (perf_counter() - start)
+        return {
+            "threshold_ms": 1000 * self.threshold,
+            "count": self.stall_count.value,
+            "locations": {
+                location: {"count": count, "total_ms": 1000 * total}
+                for location, (count, total) in list(self.locations.items())
+            },
+            "recent": [
+                {key: stall[key] for key in ["time", "duration_ms", "location", "ongoing"]} for stall in list(self.stalls)
+            ],
+        }
+
+    # Must be called in the main thread
+    def close(self):
+        self.timer.stop()
+        self.stopped.set()
+        self.wait()
+
+
+# Innermost frame of icarus code in stack, e.g. "data_handler.py:305 quit", which is the likely cause of a stall.
+# Frames of libraries called from it, e.g. time.sleep or json, are skipped.
+def get_location(stack):
+    for frame in reversed(stack):
+        if f"{os.sep}icarus_v2{os.sep}" in frame.filename:
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    if len(stack) > 0:
+        frame = stack[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "unknown"
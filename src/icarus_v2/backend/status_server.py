@@ -0,0 +1,72 @@
+import json
+from PySide6.QtCore import QObject
+from PySide6.QtNetwork import QLocalServer, QLocalSocket
+
+
+# Name of the local socket of the headless daemon. A path in /tmp on Unix and a named pipe on Windows.
+DEFAULT_SOCKET = "icarus"
+# Milliseconds to wait for a daemon already on the socket to accept a connection
+PROBE_TIMEOUT = 1000
+
+
+# Converts numpy scalars and other values json can not encode
+def to_json(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+# Answers requests on a local socket. Each request is one line of text, e.g. "status" or "pulse on".
+# handler(request) returns a dict, which is sent back as one line of json.
+# Runs in the thread of the Qt event loop, so handler may use objects owned by it without locking.
+class StatusServer(QObject):
+    def __init__(self, name, handler) -> None:
+        super().__init__()
+        self.handler = handler
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.accept)
+        self.buffers = {} # socket: bytes received without a newline yet
+
+        # Remove a socket left behind by a daemon that did not exit cleanly, but never that of one still running
+        probe = QLocalSocket()
+        probe.connectToServer(name)
+        if probe.waitForConnected(PROBE_TIMEOUT):
+            probe.disconnectFromServer()
+            raise RuntimeError(f"Local socket {name} is in use by another running instance.")
+        if probe.error() == QLocalSocket.ConnectionRefusedError:
+            QLocalServer.removeServer(name)
+        elif probe.error() != QLocalSocket.ServerNotFoundError:
+            raise RuntimeError(f"Could not check local socket {name}: {probe.errorString()}")
+        if not self.server.listen(name):
+            raise RuntimeError(f"Could not listen on local socket {name}: {self.server.errorString()}")
+
+    def get_name(self):
+        return self.server.fullServerName()
+
+    def accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.buffers[socket] = b""
+            socket.readyRead.connect(lambda socket=socket: self.read(socket))
+            socket.disconnected.connect(lambda socket=socket: self.remove(socket))
+
+    def read(self, socket):
+        self.buffers[socket] += bytes(socket.readAll())
+        *requests, self.buffers[socket] = self.buffers[socket].split(b"\n")
+        for request in requests:
+            request = request.decode("utf-8", errors="ignore").strip()
+            if request == "":
+                continue
+            try:
+                response = self.handler(request)
+            except Exception as e:
+                response = {"error": str(e)}
+            socket.write((json.dumps(response, default=to_json) + "\n").encode("utf-8"))
+            socket.flush()
+
+    def remove(self, socket):
+        self.buffers.pop(socket, None)
+        socket.deleteLater()
+
+    def close(self):
+        self.server.close()
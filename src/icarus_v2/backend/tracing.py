@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+from collections import deque
+from time import perf_counter
+import numpy as np
+from icarus_v2.backend.event import Event
+from icarus_v2.backend.metrics import MetricsRegistry
+
+
+# Stages of the path of an event, as (stage, Trace attribute it starts at, Trace attribute it ends at)
+#   acquire: the last sample of the event being acquired to its USB block being read
+#   detect: the block being read to the handler having all the data of the event
+#   emit: the event being emitted to a consumer receiving it, i.e. time in the Qt signal queue
+#   render: the consumer receiving the event to the plot showing it being painted
+STAGES = [
+    ("acquire", "acquired", "received"),
+    ("detect", "received", "detected"),
+    ("emit", "detected", "delivered"),
+    ("render", "delivered", "rendered"),
+]
+# Upper edges (ms) of the bins of the stage latency histograms. The last bin holds everything later.
+LATENCY_BINS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000]
+# Completed traces kept for export
+TRACE_HISTORY = 5000
+EVENT_NAMES = {
+    Event.PRESSURIZE: "pressurize",
+    Event.DEPRESSURIZE: "depressurize",
+    Event.PERIOD: "period",
+    Event.PRESSURE: "pressure",
+    Event.PUMP: "pump",
+}
+
+
+# Times an event passed each point of the pipeline, in perf_counter() seconds. None where unknown, e.g. the
+# acquisition and read times of events from raw logs, or the render time of events with no plot.
+# buffer_index is the index of the last sample of the event in the ring buffer.
+class Trace:
+    def __init__(self, event_type, buffer_index, acquired, received, detected) -> None:
+        self.event_type = event_type
+        self.buffer_index = int(buffer_index)
+        self.acquired = acquired
+        self.received = received
+        self.detected = detected
+        self.delivered = None
+        self.rendered = None
+
+    # Called by the first consumer of the event
+    def deliver(self):
+        if self.delivered is None:
+            self.delivered = perf_counter()
+
+    # (stage, start, end) of every stage with known start and end
+    def get_stages(self):
+        stages = []
+        for stage, start_name, end_name in STAGES:
+            start = getattr(self, start_name)
+            end = getattr(self, end_name)
+            if start is not None and end is not None:
+                stages.append((stage, start, end))
+        return stages
+
+
+# Thread-safe singleton collecting completed traces. Stage latencies are kept as histograms, as summaries in the
+# metrics registry, and as Chrome trace events for chrome://tracing or https://ui.perfetto.dev.
+class LatencyTracer:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance.traces = deque(maxlen=TRACE_HISTORY)
+                cls._instance.latencies = {stage: deque(maxlen=TRACE_HISTORY) for stage, _, _ in STAGES}
+        return cls._instance
+
+    # Called once nothing more will be recorded in trace
+    def record(self, trace):
+        registry = MetricsRegistry()
+        name = EVENT_NAMES[trace.event_type]
+        with self._lock:
+            self.traces.append(trace)
+            for stage, start, end in trace.get_stages():
+                self.latencies[stage].append(end - start)
+        for stage, start, end in trace.get_stages():
+            registry.summary("latency_seconds", "Time taken by one stage of the path of events from USB to screen.",
+                             stage=stage, event=name).observe(end - start)
+
+    def clear(self):
+        with self._lock:
+            self.traces.clear()
+            for latencies in self.latencies.values():
+                latencies.clear()
+
+    # Count, mean, max and 99th percentile latency (ms) and histogram of every stage with traces
+    def get_metrics(self):
+        metrics = {"bins_ms": LATENCY_BINS_MS}
+        with self._lock:
+            latencies = {stage: np.array(values) * 1000 for stage, values in self.latencies.items()}
+        for stage, latency in latencies.items():
+            if len(latency) == 0:
+                continue
+            bins = np.searchsorted(LATENCY_BINS_MS, latency)
+            metrics[stage] = {
+                "count": len(latency),
+                "mean_ms": float(np.mean(latency)),
+                "max_ms": float(np.max(latency)),
+                "p99_ms": float(np.percentile(latency, 99)),
+                "histogram": np.bincount(bins, minlength=len(LATENCY_BINS_MS) + 1).tolist(),
+            }
+        return metrics
+
+    # Traces in the Chrome trace event format. Each type of event is one row, with a slice for each stage.
+    def get_chrome_trace(self):
+        pid = os.getpid()
+        events = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "Icarus"}}
+        ]
+        for event_type, name in EVENT_NAMES.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": event_type, "args": {"name": name}})
+
+        with self._lock:
+            traces = list(self.traces)
+        for trace in traces:
+            for stage, start, end in trace.get_stages():
+                events.append({
+                    "name": stage,
+                    "cat": EVENT_NAMES[trace.event_type],
+                    "ph": "X",
+                    "ts": start * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": pid,
+                    "tid": trace.event_type,
+                    "args": {"buffer_index": trace.buffer_index},
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        with open(path, "w") as file:
+            json.dump(self.get_chrome_trace(), file)
+
+
+# Completes the trace of an event at its consumer, for events which are not plotted
+def record_delivery(event):
+    if event.trace is None:
+        return
+    event.trace.deliver()
+    LatencyTracer().record(event.trace)
@@ -0,0 +1,140 @@
+import threading
+from collections import deque
+import numpy as np
+from icarus_v2.backend.event_handler import EventHandler
+from icarus_v2.backend.event import Channel, get_channel
+
+
+# Longest time (s) from a command being written to its edge appearing in the data
+MAX_EDGE_LATENCY = 0.1
+# Pulses used for each estimate, and the fewest needed before estimates are given
+CALIBRATION_PULSES = 50
+MIN_CALIBRATION_PULSES = 5
+
+
+# Measures how long valve commands take to appear as DIO edges in the acquired data.
+# Each edge in the data is matched with the PulseGenerator command that caused it, from the EdgeTiming of the generator.
+# Per valve, estimates the latency from a command being written to the edge being sampled and the width error:
+# how much longer pulses are at the valve than the time between their commands.
+# Latencies include the shortest transfer delay of the device, so only their differences are exact.
+# Emits a dict of estimates (see get_metrics) after every matched pulse.
+# Pulses are only touched by the thread of the handler, which publishes the estimates for other threads under a lock.
+class ValveCalibrator(EventHandler):
+    # Valve channel and the prefix of the names of its edges in EdgeTiming
+    VALVES = {
+        "pressurize": Channel.PRE_VALVE,
+        "depressurize": Channel.DEPRE_VALVE,
+    }
+
+    def __init__(self, loader, signal, sample_rate, update_rate, timing) -> None:
+        super().__init__(loader, signal, sample_rate, update_rate)
+        self.timing = timing
+        self.lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        self.last_bits = {name: None for name in self.VALVES}
+        self.last_matched = {name: None for name in self.VALVES} # Last command matched to an edge, per edge name
+        self.pending_low = {name: None for name in self.VALVES} # (edge time, command time) of an unfinished pulse
+        self.low_latency = {name: deque(maxlen=CALIBRATION_PULSES) for name in self.VALVES}
+        self.high_latency = {name: deque(maxlen=CALIBRATION_PULSES) for name in self.VALVES}
+        self.width_error = {name: deque(maxlen=CALIBRATION_PULSES) for name in self.VALVES}
+        self.publish()
+
+
+    # Overridden because every edge is handled, rather than one event per chunk
+    def process_chunk(self, data, buffer_index):
+        matched = False
+        for name, channel in self.VALVES.items():
+            bits = get_channel(data, channel)
+            if self.last_bits[name] is None:
+                self.last_bits[name] = bits[0]
+            previous = np.insert(bits, 0, self.last_bits[name])[:-1]
+            self.last_bits[name] = bits[-1]
+
+            for index in np.flatnonzero(previous != bits):
+                edge_time = self.loader.get_sample_time(buffer_index + index)
+                if edge_time is None:
+                    continue
+                matched |= self.handle_edge(name, not bits[index], edge_time)
+
+        if matched:
+            self.events_emitted += 1
+            self.signal.emit(self.publish())
+
+
+    # Returns True if a pulse was completed
+    def handle_edge(self, name, low, edge_time):
+        edge_name = name + ("_low" if low else "_high")
+        command_time = self.match_command(edge_name, edge_time)
+        if command_time is None:
+            # Not caused by PulseGenerator, e.g. a manual valve change
+            self.pending_low[name] = None
+            return False
+
+        if low:
+            self.low_latency[name].append(edge_time - command_time)
+            self.pending_low[name] = (edge_time, command_time)
+            return False
+
+        self.high_latency[name].append(edge_time - command_time)
+        if self.pending_low[name] is None:
+            return False
+        low_edge_time, low_command_time = self.pending_low[name]
+        self.pending_low[name] = None
+        self.width_error[name].append((edge_time - low_edge_time) - (command_time - low_command_time))
+        return True
+
+
+    # Time the latest unmatched command for this edge was written, if it could have caused an edge at edge_time
+    def match_command(self, edge_name, edge_time):
+        # Edges are sampled up to one sample after the command
+        tolerance = 1 / self.sample_rate
+        match = None
+        for _, written in reversed(list(self.timing.edges.get(edge_name, []))):
+            if written > edge_time + tolerance:
+                continue
+            if edge_time - written <= MAX_EDGE_LATENCY:
+                match = written
+            break
+        if match is None or match == self.last_matched.get(edge_name):
+            return None
+        self.last_matched[edge_name] = match
+        return match
+
+
+    # Computes the estimates from the pulses and publishes them for get_estimate and get_metrics.
+    # Called from the thread of the handler. Returns the metrics.
+    def publish(self):
+        estimates = {}
+        metrics = {}
+        for name in self.VALVES:
+            if len(self.width_error[name]) < MIN_CALIBRATION_PULSES:
+                continue
+            low_latency = float(np.median(self.low_latency[name]))
+            high_latency = float(np.median(self.high_latency[name]))
+            width_error = float(np.median(self.width_error[name]))
+            estimates[name] = (low_latency, high_latency, width_error)
+            metrics[name] = {
+                "pulses": len(self.width_error[name]),
+                "low_latency_ms": 1000 * low_latency,
+                "high_latency_ms": 1000 * high_latency,
+                "width_error_ms": 1000 * width_error,
+            }
+        with self.lock:
+            self.estimates = estimates
+            self.metrics = metrics
+        return metrics
+
+
+    # Median latency of the low and high edges and width error (s) of a valve, or None until there are enough pulses
+    def get_estimate(self, name):
+        with self.lock:
+            return self.estimates.get(name)
+
+
+    # Estimates in ms for every valve with enough pulses
+    def get_metrics(self):
+        with self.lock:
+            return self.metrics
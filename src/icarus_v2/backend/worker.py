@@ -0,0 +1,35 @@
+import threading
+
+
+# Base for the classes of the acquisition and detection core which run in their own thread.
+# Has the start(), run(), wait(), isRunning() and quit() of QThread, so it may be used in place of one,
+# but is a plain Python thread that needs neither PySide6 nor an event loop.
+# Unlike threading.Thread, it may be started again after finishing.
+class Worker:
+    def __init__(self) -> None:
+        self.thread = None
+
+    # Calls run() in a new thread. Does nothing if already running.
+    def start(self):
+        if self.isRunning():
+            return
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    # Placeholder. Runs in the thread.
+    def run(self):
+        return
+
+    # Blocks until run() returns, or for timeout seconds. Returns whether it has finished.
+    def wait(self, timeout=None):
+        if self.thread is None or self.thread is threading.current_thread():
+            return True
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def isRunning(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # Placeholder. Asks run() to return.
+    def quit(self):
+        return
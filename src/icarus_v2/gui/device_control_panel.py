@@ -164,6 +164,19 @@ class DeviceControlPanel(QGroupBox):
         # revert to manual mode
         self.mode_button.setChecked(False)
 
+    # The interlock has already stopped pulsing and the pump and opened the valves, so the buttons are brought in line
+    # without sending their commands again. Shuts down from here instead if the interlock could not write to the device.
+    def on_interlock(self):
+        if self.pulse_generator is None or not self.pulse_generator.interlocked:
+            self.on_shutdown()
+            return
+        buttons = [self.pump_button, self.pressurize_button, self.depressurize_button, self.pulse_button]
+        for button in buttons:
+            button.blockSignals(True)
+        self.on_shutdown()
+        for button in buttons:
+            button.blockSignals(False)
+
     def reset_valves(self):
         self.pressurize_button.setEnabled(True)
         self.depressurize_button.setEnabled(True)
@@ -0,0 +1,112 @@
+import os
+from time import perf_counter
+from PySide6.QtWidgets import (
+    QDialog,
+    QDialogButtonBox,
+    QVBoxLayout,
+    QTableWidget,
+    QTableWidgetItem,
+    QHeaderView,
+    QAbstractItemView,
+    QPushButton,
+    QFileDialog
+)
+from PySide6.QtCore import QTimer, QStandardPaths
+from icarus_v2.backend.metrics import MetricsRegistry, COUNTER
+from icarus_v2.backend.tracing import LatencyTracer
+from icarus_v2.gui.error_dialog import open_error_dialog
+
+
+# Milliseconds between refreshes of the table
+REFRESH_INTERVAL = 1000
+
+
+# Table of every metric in the registry, refreshed while open. Counters also show their rate since the last refresh.
+class DiagnosticsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+
+        self.setWindowTitle("Diagnostics")
+        self.resize(720, 600)
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Metric", "Labels", "Value", "Rate /s"])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(1, QHeaderView.Stretch)
+        header.setSectionResizeMode(2, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(3, QHeaderView.ResizeToContents)
+
+        self.buttonBox = QDialogButtonBox(QDialogButtonBox.Close)
+        self.buttonBox.rejected.connect(self.reject)
+        # Latency of recent events at each stage, for chrome://tracing or https://ui.perfetto.dev
+        trace_button = QPushButton("Export Trace")
+        trace_button.clicked.connect(self.export_trace)
+        self.buttonBox.addButton(trace_button, QDialogButtonBox.ActionRole)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addWidget(self.buttonBox)
+        self.setLayout(layout)
+
+        # Counter values of the last refresh, used for rates
+        self.last_values = {}
+        self.last_time = None
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(REFRESH_INTERVAL)
+        self.refresh()
+
+    def refresh(self):
+        samples = MetricsRegistry().collect()
+        now = perf_counter()
+        elapsed = None if self.last_time is None else now - self.last_time
+        values = {}
+
+        self.table.setRowCount(len(samples))
+        for row, (kind, name, description, labels, value) in enumerate(samples):
+            label_text = ", ".join(f"{key}={label}" for key, label in labels.items())
+            rate = ""
+            if kind == COUNTER:
+                key = (name, label_text)
+                values[key] = value
+                if elapsed and key in self.last_values:
+                    rate = format_value((value - self.last_values[key]) / elapsed)
+
+            name_item = QTableWidgetItem(name)
+            name_item.setToolTip(description)
+            self.table.setItem(row, 0, name_item)
+            self.table.setItem(row, 1, QTableWidgetItem(label_text))
+            self.table.setItem(row, 2, QTableWidgetItem(format_value(value)))
+            self.table.setItem(row, 3, QTableWidgetItem(rate))
+
+        self.last_values = values
+        self.last_time = now
+
+    def export_trace(self):
+        default_dir = QStandardPaths.writableLocation(QStandardPaths.DownloadLocation)
+        filename, _ = QFileDialog.getSaveFileName(
+            self,
+            "Export Trace",
+            os.path.join(default_dir, "icarus_trace.json"),
+            "Chrome Trace Files (*.json)"
+        )
+        if not filename:
+            return
+        try:
+            LatencyTracer().export(filename)
+        except OSError as e:
+            self.error_dialog = open_error_dialog(e, parent=self)
+
+    def done(self, result):
+        self.timer.stop()
+        super().done(result)
+
+
+def format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:.6g}"
+    return str(int(value))
@@ -110,6 +110,8 @@ class EventPlot(QWidget):
         if event is None:
             self.plot.reset()
             return
+        if event.trace is not None:
+            self.plot.add_trace(event.trace)
 
         data = event.data
         # Calculate times based on event.step_time and event_index
@@ -140,13 +140,13 @@ class HistoryPlot(QWidget):
 
         if event.event_type == Event.PRESSURIZE:
             self.slope_plot.append_points({
-                HistStat.PO_SLOPE: event.get_event_info(HistStat.PO_SLOPE) * coefficients[HistStat.PO_SLOPE],
-                HistStat.PS_SLOPE: event.get_event_info(HistStat.PS_SLOPE) * coefficients[HistStat.PS_SLOPE]
+                HistStat.PO_SLOPE: event.get_event_info(HistStat.PO_SLOPE) * coefficients[HistStat.PO_SLOPE] / event.step_time,
+                HistStat.PS_SLOPE: event.get_event_info(HistStat.PS_SLOPE) * coefficients[HistStat.PS_SLOPE] / event.step_time
             }, time)
 
             self.switch_time_plot.append_points({
-                HistStat.PO_SWITCH: event.get_event_info(HistStat.PO_SWITCH) * coefficients[HistStat.PO_SWITCH],
-                HistStat.PS_SWITCH: event.get_event_info(HistStat.PS_SWITCH) * coefficients[HistStat.PS_SWITCH]
+                HistStat.PO_SWITCH: event.get_event_info(HistStat.PO_SWITCH) * coefficients[HistStat.PO_SWITCH] * event.step_time,
+                HistStat.PS_SWITCH: event.get_event_info(HistStat.PS_SWITCH) * coefficients[HistStat.PS_SWITCH] * event.step_time
             }, time)
 
         if event.event_type == Event.DEPRESSURIZE or event.event_type == Event.PRESSURE:
@@ -159,13 +159,13 @@ class HistoryPlot(QWidget):
 
         if event.event_type == Event.DEPRESSURIZE:
             self.slope_plot.append_points({
-                HistStat.DO_SLOPE: event.get_event_info(HistStat.DO_SLOPE) * coefficients[HistStat.DO_SLOPE],
-                HistStat.DS_SLOPE: event.get_event_info(HistStat.DS_SLOPE) * coefficients[HistStat.DS_SLOPE]
+                HistStat.DO_SLOPE: event.get_event_info(HistStat.DO_SLOPE) * coefficients[HistStat.DO_SLOPE] / event.step_time,
+                HistStat.DS_SLOPE: event.get_event_info(HistStat.DS_SLOPE) * coefficients[HistStat.DS_SLOPE] / event.step_time
             }, time)
 
             self.switch_time_plot.append_points({
-                HistStat.DO_SWITCH: event.get_event_info(HistStat.DO_SWITCH) * coefficients[HistStat.DO_SWITCH],
-                HistStat.DS_SWITCH: event.get_event_info(HistStat.DS_SWITCH) * coefficients[HistStat.DS_SWITCH]
+                HistStat.DO_SWITCH: event.get_event_info(HistStat.DO_SWITCH) * coefficients[HistStat.DO_SWITCH] * event.step_time,
+                HistStat.DS_SWITCH: event.get_event_info(HistStat.DS_SWITCH) * coefficients[HistStat.DS_SWITCH] * event.step_time
             }, time)
 
         # Update limits to fit new point
@@ -183,6 +183,7 @@ class HistoryPlot(QWidget):
         self.switch_time_plot.setLimits(xMin=self.limits[0], xMax=self.limits[1], minXRange=10)
 
     # Assumes list is sorted by time
+    # May be called repeatedly with consecutive batches of events
     def load_event_list(self, event_list):
         for event in event_list:
             self.add_event(event)
@@ -220,13 +221,14 @@ class HistoryPlot(QWidget):
         coefficients = {
             HistStat.O_PRESS: plotting_coefficients[Channel.HI_PRE_ORIG],
             HistStat.S_PRESS: plotting_coefficients[Channel.HI_PRE_SAMPLE],
-            HistStat.DO_SLOPE: plotting_coefficients[Channel.HI_PRE_ORIG] * 4,
-            HistStat.DS_SLOPE: plotting_coefficients[Channel.HI_PRE_SAMPLE] * 4,
-            HistStat.PO_SLOPE: plotting_coefficients[Channel.HI_PRE_ORIG] * 4,
-            HistStat.PS_SLOPE: plotting_coefficients[Channel.HI_PRE_SAMPLE] * 4,
-            HistStat.DO_SWITCH: 0.25,
-            HistStat.DS_SWITCH: 0.25,
-            HistStat.PO_SWITCH: 0.25,  # ms per index
-            HistStat.PS_SWITCH: 0.25,  # ms per index
+            # Slopes and switch times are per index. add_event converts them to ms using the step time of the event.
+            HistStat.DO_SLOPE: plotting_coefficients[Channel.HI_PRE_ORIG],
+            HistStat.DS_SLOPE: plotting_coefficients[Channel.HI_PRE_SAMPLE],
+            HistStat.PO_SLOPE: plotting_coefficients[Channel.HI_PRE_ORIG],
+            HistStat.PS_SLOPE: plotting_coefficients[Channel.HI_PRE_SAMPLE],
+            HistStat.DO_SWITCH: 1,
+            HistStat.DS_SWITCH: 1,
+            HistStat.PO_SWITCH: 1,
+            HistStat.PS_SWITCH: 1,
         }
         return coefficients
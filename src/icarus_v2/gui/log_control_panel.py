@@ -13,15 +13,21 @@ from PySide6.QtWidgets import (
 )
 import os
 from PySide6.QtGui import QDoubleValidator, QFontMetrics
-from PySide6.QtCore import Qt, Signal, QStandardPaths
+from PySide6.QtCore import Qt, Signal, QStandardPaths, QTimer
 from icarus_v2.gui.error_dialog import open_error_dialog
 from bisect import bisect_right
 from icarus_v2.backend.event import Event
 from icarus_v2.backend.log_reader import LogReader
+from icarus_v2.backend.multi_log_reader import MultiLogReader
+from icarus_v2.backend.log_retention import SegmentManifest
 from math import ceil
 from icarus_v2.backend.sample_sensor_detector import SampleSensorDetector
 
 
+# Events stepped through with Previous and Next. Only these are kept once a segmented log has been plotted.
+NAVIGABLE_EVENTS = (Event.PRESSURIZE, Event.DEPRESSURIZE, Event.PERIOD)
+
+
 # Control panel for logs
 class LogControlPanel(QGroupBox):
     pressurize_event_signal = Signal(Event)
@@ -44,6 +50,14 @@ class LogControlPanel(QGroupBox):
         self.name_edit = None
         self.currently_logging = None
         self.sample_sensor_detector = SampleSensorDetector(self.sample_sensor_connected)
+        # Time of the first event of the open log, which times in the time edit are relative to
+        self.start_time = None
+
+        # Segments of a log are read one batch per pass of the event loop, so plots are painted while reading
+        self.segment_reader = None
+        self.batches = None
+        self.read_timer = QTimer(self)
+        self.read_timer.timeout.connect(self.read_next_batch)
 
         # Title
         title = QLabel("Viewing Log")
@@ -115,7 +129,8 @@ class LogControlPanel(QGroupBox):
         if not self.currently_logging:
             return
         filename = self.log_reader.logger.filename
-        self.open_log(filename)
+        # Only the segment currently being written
+        self.open_log(filename, whole_log=False)
 
     def choose_log(self):
         log_path = os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), 'logs')
@@ -129,13 +144,20 @@ class LogControlPanel(QGroupBox):
             return
         self.open_log(file)
 
-    def open_log(self, file):
+    # If whole_log, every segment of a rotated log is opened as one timeline
+    def open_log(self, file, whole_log=True):
+        self.stop_reading()
         self.reset_history_signal.emit()
-        try:
-            self.log_reader.read_events(file)
-        except Exception as e:
-            self.dialog = open_error_dialog("Incorrect format for log file.")
-            return
+        manifest = SegmentManifest.find(file) if whole_log else None
+        if manifest is None:
+            try:
+                self.log_reader.read_events(file)
+            except Exception as e:
+                self.dialog = open_error_dialog("Incorrect format for log file.")
+                return
+            self.start_time = self.log_reader.events[0].event_time if len(self.log_reader.events) > 0 else None
+        else:
+            self.read_segments(manifest)
 
         self.time_edit.setText("")
         self.next_button.setEnabled(True)
@@ -147,7 +169,7 @@ class LogControlPanel(QGroupBox):
         self.depress_index = -1
         self.period_index = -1
 
-        self.filename = self.log_reader.filename
+        self.filename = file
         self.filename_label.setText(os.path.basename(self.filename))
         # Adjust font size to fit in the view
         for i in range(17, 8, -1):
@@ -156,9 +178,17 @@ class LogControlPanel(QGroupBox):
                     < self.width() - 25):
                 break
 
+        # Segments are still being read otherwise
+        if manifest is None:
+            self.log_coefficients_signal.emit(self.log_reader.log_coefficients)
+            self.event_list_signal.emit(self.log_reader.events)
+            self.finish_reading()
+
+    # Called once every event of the log has been read
+    def finish_reading(self):
         # Set limit on time line_edit
         if len(self.log_reader.events) > 0:
-            upper_bound = self.log_reader.events[-1].event_time - self.log_reader.events[0].event_time
+            upper_bound = self.log_reader.events[-1].event_time - self.start_time
         else:
             upper_bound = 0
         self.time_edit.setValidator(QDoubleValidator(0, upper_bound, 2))
@@ -167,8 +197,44 @@ class LogControlPanel(QGroupBox):
             self.log_reader.events,
             self.log_reader.log_coefficients
         )
-        self.log_coefficients_signal.emit(self.log_reader.log_coefficients)
-        self.event_list_signal.emit(self.log_reader.events)
+
+    # Starts reading all segments of a log. Events are sent to the history plot in batches as they are decoded,
+    # and only the events stepped through by the controls are kept.
+    def read_segments(self, manifest):
+        self.segment_reader = MultiLogReader.from_manifest(manifest, self.log_reader.tool_bar)
+        self.log_coefficients_signal.emit(self.segment_reader.log_coefficients)
+
+        self.log_reader.events = []
+        self.start_time = None
+        self.time_edit.setValidator(QDoubleValidator(0, 0, 2))
+        self.batches = self.segment_reader.iter_batches(logger=self.log_reader.logger)
+        self.read_timer.start(0)
+
+    def read_next_batch(self):
+        try:
+            batch = next(self.batches)
+        except StopIteration:
+            self.stop_reading()
+            self.log_reader.log_coefficients = self.segment_reader.log_coefficients
+            self.log_coefficients_signal.emit(self.segment_reader.log_coefficients)
+            self.finish_reading()
+            return
+        except Exception as e:
+            self.stop_reading()
+            self.reset()
+            self.dialog = open_error_dialog("Incorrect format for log file.")
+            return
+
+        if self.start_time is None:
+            self.start_time = batch[0].event_time
+        self.log_reader.events.extend(event for event in batch if event.event_type in NAVIGABLE_EVENTS)
+        self.event_list_signal.emit(batch)
+
+    def stop_reading(self):
+        self.read_timer.stop()
+        if self.batches is not None:
+            self.batches.close()
+        self.batches = None
 
     def edit_file(self):
         self.edit_dialog = QDialog(self)
@@ -199,12 +265,11 @@ class LogControlPanel(QGroupBox):
         if new_name:
             new_filename = os.path.join(os.path.dirname(self.filename), new_name)
             try:
-                os.rename(self.filename, new_filename)  
-
-                # Update logger filename if this is the currently written log
-                if self.currently_logging:
-                    if self.filename == self.log_reader.logger.filename:
-                        self.log_reader.logger.filename = new_filename 
+                # Let the logger rename the currently written log so it can keep writing to it
+                if self.currently_logging and self.filename == self.log_reader.logger.filename:
+                    self.log_reader.logger.rename(new_filename)
+                else:
+                    os.rename(self.filename, new_filename)
                 self.filename_label.setText(os.path.basename(new_filename))  # Update the label
                 self.filename = new_filename
             except OSError as e:
@@ -238,8 +303,7 @@ class LogControlPanel(QGroupBox):
         if len(self.log_reader.events) == 0:
             return
 
-        initial_time = self.log_reader.events[0].event_time
-        index = max(0, bisect_right(self.log_reader.events, time, key=lambda x: x.event_time - initial_time) - 1)
+        index = max(0, bisect_right(self.log_reader.events, time, key=lambda x: x.event_time - self.start_time) - 1)
 
         press = None
         depress = None
@@ -302,7 +366,7 @@ class LogControlPanel(QGroupBox):
                     self.depressurize_event_signal.emit(n_event)
 
         max_time = self.log_reader.events[max(self.press_index, self.depress_index, self.period_index)].event_time
-        time = max_time - self.log_reader.events[0].event_time
+        time = max_time - self.start_time
         self.time_edit.setText(str(ceil(time)))
 
     def emit_last_event(self):
@@ -344,10 +408,11 @@ class LogControlPanel(QGroupBox):
                     self.depressurize_event_signal.emit(n_event)
 
         max_time = self.log_reader.events[max(self.press_index, self.depress_index, self.period_index)].event_time
-        time = max_time - self.log_reader.events[0].event_time
+        time = max_time - self.start_time
         self.time_edit.setText(str(ceil(time)))
 
     def reset(self):
+        self.stop_reading()
         self.filename_label.setText("")
         self.time_edit.setText("")
         self.log_coefficients_signal.emit(None)
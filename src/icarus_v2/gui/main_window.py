@@ -18,6 +18,7 @@ from icarus_v2.gui.device_control_panel import DeviceControlPanel
 from icarus_v2.gui.log_control_panel import LogControlPanel
 from icarus_v2.gui.counter_display import CounterDisplay
 from icarus_v2.gui.pressure_display import PressureDisplay
+from icarus_v2.backend.tracing import record_delivery
 from icarus_v2.gui.tool_bar import ToolBar
 from icarus_v2.gui.error_dialog import open_error_dialog
 from icarus_v2.backend.log_reader import LogReader
@@ -157,10 +158,14 @@ class MainWindow(QMainWindow):
         data_handler.pressurize_event_signal.connect(self.counter_display.increment_count)
         data_handler.depressurize_event_signal.connect(self.counter_display.increment_count)
         data_handler.pump_event_signal.connect(self.counter_display.increment_count)
+        # Pressure and pump events are not plotted, so their traces end once they arrive
+        data_handler.pressure_event_signal.connect(record_delivery)
+        data_handler.pump_event_signal.connect(record_delivery)
         data_handler.acquiring_signal.connect(lambda x: self.set_connected(x))
         data_handler.toolbar_warning.connect(self.toolbar.display_warning)
-        # Ideally this is unnecessary as the signal should be directly sent to the pulse_generator. This is a workaround
-        data_handler.shutdown_signal.connect(self.device_control_panel.on_shutdown)
+        data_handler.calibration_signal.connect(self.toolbar.set_calibration)
+        # The interlock has already shut the device down. The control panel only follows it.
+        data_handler.shutdown_signal.connect(self.device_control_panel.on_interlock)
 
         def error_dialog(err):
             self.dialog = open_error_dialog(err)
@@ -216,7 +221,7 @@ class MainWindow(QMainWindow):
             self.log_control_panel.reset()
 
             # restore history
-            if self.connected:
+            if self.connected and self.data_handler.logger is not None:
                 current_log_file = self.data_handler.logger.filename
                 self.data_handler.logger.flush()
                 reader = LogReader()
@@ -17,19 +17,21 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtGui import QDoubleValidator, QIntValidator, QAction
 from icarus_v2.gui.error_dialog import open_error_dialog
-from icarus_v2.backend.event import Channel, get_channel
+from icarus_v2.backend.event import Channel, get_channel, FULL_SCAN_LIST, SCAN_PROFILES
+from icarus_v2.backend.dataq_interface import DI_4108_MAX_THROUGHPUT
 import numpy as np
 from PySide6.QtCore import Qt
 from icarus_v2.backend.configuration_manager import ConfigurationManager
 
 
 class SettingsDialog(QDialog):
-    def __init__(self, connected, pressure_signal, sentry, parent=None):
+    def __init__(self, connected, pressure_signal, sentry, calibration, parent=None):
         super().__init__(parent=parent)
 
         self.config_manager = ConfigurationManager()
         self.pressure_signal = pressure_signal
         self.sentry = sentry
+        self.calibration = calibration
 
         # Create the toolbar
         toolbar = QToolBar(parent)
@@ -116,6 +118,13 @@ class SettingsDialog(QDialog):
         self.depressurize_width_edit.textChanged.connect(self.set_depressurize_width)
         self.period_width_edit.textChanged.connect(self.set_period_width)
         self.delay_width_edit.textChanged.connect(self.set_delay_width)
+        self.compensate_latency_checkbox = QCheckBox()
+        compensate_latency = self.timing_settings.get('compensate_latency', False)
+        self.compensate_latency_checkbox.setCheckState(Qt.Checked if compensate_latency else Qt.Unchecked)
+        self.compensate_latency_checkbox.stateChanged.connect(self.set_compensate_latency)
+        # Latest estimates of the valve calibrator, which compensation uses
+        self.calibration_label = QLabel()
+        self.set_calibration(self.calibration)
 
         timings_layout = QGridLayout()
         timings_layout.addWidget(QLabel("Pressurize Width (ms):"), 0, 0)
@@ -126,6 +135,9 @@ class SettingsDialog(QDialog):
         timings_layout.addWidget(self.depressurize_width_edit, 1, 1)
         timings_layout.addWidget(self.period_width_edit, 2, 1)
         timings_layout.addWidget(self.delay_width_edit, 3, 1)
+        timings_layout.addWidget(QLabel("Compensate Valve Latency:"), 4, 0)
+        timings_layout.addWidget(self.compensate_latency_checkbox, 4, 1, alignment=Qt.AlignRight)
+        timings_layout.addWidget(self.calibration_label, 5, 0, 1, 2)
         timings_group = QGroupBox("Pulse Timings")
         timings_group.setLayout(timings_layout)
 
@@ -252,11 +264,73 @@ class SettingsDialog(QDialog):
         misc_group = QGroupBox("Sentry")
         misc_group.setLayout(misc_layout)
 
+        # Log retention section
+        self.temp_size_edit = QLineEdit()
+        self.temp_age_edit = QLineEdit()
+        self.segment_size_edit = QLineEdit()
+        self.segment_time_edit = QLineEdit()
+        self.temp_size_edit.setFixedWidth(edit_width)
+        self.temp_age_edit.setFixedWidth(edit_width)
+        self.segment_size_edit.setFixedWidth(edit_width)
+        self.segment_time_edit.setFixedWidth(edit_width)
+        self.temp_size_edit.setValidator(positive_float)
+        self.temp_age_edit.setValidator(positive_float)
+        self.segment_size_edit.setValidator(positive_float)
+        self.segment_time_edit.setValidator(positive_float)
+
+        self.log_settings = self.config_manager.get_settings('log_settings')
+
+        self.temp_size_edit.setText(str(self.log_settings['temp_max_size_mb']))
+        self.temp_age_edit.setText(str(self.log_settings['temp_max_age_days']))
+        self.segment_size_edit.setText(str(self.log_settings['segment_max_size_mb']))
+        self.segment_time_edit.setText(str(self.log_settings['segment_max_minutes']))
+
+        self.temp_size_edit.textChanged.connect(self.set_temp_max_size)
+        self.temp_age_edit.textChanged.connect(self.set_temp_max_age)
+        self.segment_size_edit.textChanged.connect(self.set_segment_max_size)
+        self.segment_time_edit.textChanged.connect(self.set_segment_max_minutes)
+
+        log_layout = QGridLayout()
+        log_layout.addWidget(QLabel("Max Temporary Log Size (MB):"), 0, 0)
+        log_layout.addWidget(QLabel("Max Temporary Log Age (days):"), 1, 0)
+        log_layout.addWidget(QLabel("Max Segment Size (MB):"), 2, 0)
+        log_layout.addWidget(QLabel("Max Segment Length (min):"), 3, 0)
+        log_layout.addWidget(self.temp_size_edit, 0, 1)
+        log_layout.addWidget(self.temp_age_edit, 1, 1)
+        log_layout.addWidget(self.segment_size_edit, 2, 1)
+        log_layout.addWidget(self.segment_time_edit, 3, 1)
+        log_group = QGroupBox("Logs (0 for no limit)")
+        log_group.setLayout(log_layout)
+
+        # Acquisition section
+        self.acquisition_settings = self.config_manager.get_settings('acquisition_settings')
+        self.acquisition_settings.setdefault('scan_list', FULL_SCAN_LIST)
+        self.scan_profile_combo_box = QComboBox()
+        self.scan_profile_combo_box.addItems(SCAN_PROFILES.keys())
+        self.scan_profile_combo_box.setFixedWidth(edit_width)
+        for name, scan_list in SCAN_PROFILES.items():
+            if scan_list == self.acquisition_settings['scan_list']:
+                self.scan_profile_combo_box.setCurrentText(name)
+                break
+        else:
+            # Scan list was edited in the settings file
+            self.scan_profile_combo_box.addItem("Custom")
+            self.scan_profile_combo_box.setCurrentText("Custom")
+        self.scan_profile_combo_box.currentTextChanged.connect(self.set_scan_profile)
+
+        acquisition_layout = QGridLayout()
+        acquisition_layout.addWidget(QLabel("Scan Profile:"), 0, 0)
+        acquisition_layout.addWidget(self.scan_profile_combo_box, 0, 1)
+        acquisition_group = QGroupBox("Acquisition (applies on reconnect)")
+        acquisition_group.setLayout(acquisition_layout)
+
         widget = QWidget()
         layout = QVBoxLayout(widget)
         layout.addWidget(error_group)
         layout.addWidget(warning_group)
         layout.addWidget(misc_group)
+        layout.addWidget(log_group)
+        layout.addWidget(acquisition_group)
         layout.addItem(QSpacerItem(0, 0, QSizePolicy.Minimum, QSizePolicy.Expanding))
 
         return widget
@@ -289,6 +363,12 @@ class SettingsDialog(QDialog):
             error = "Example events should be greater than 1."
         elif self.sentry_settings['decrease_count_to_error'] <= 0:
             error = "Difference to error count should be greater than 0."
+        else:
+            # Analog channels and digital
+            channels = len(self.acquisition_settings['scan_list']) + 1
+            sample_rate = 60000000 / (self.acquisition_settings['srate'] * self.acquisition_settings['dec'])
+            if sample_rate * channels > DI_4108_MAX_THROUGHPUT:
+                error = f"Sample rate of {sample_rate:.0f} Hz is too high to scan {channels} channels."
 
         if error is not None:
             self.dialog = open_error_dialog(error, QDialogButtonBox.Ok, self)
@@ -298,6 +378,8 @@ class SettingsDialog(QDialog):
         self.config_manager.save_settings("timing_settings", self.timing_settings)
         self.config_manager.save_settings("counter_settings", self.counter_settings)
         self.config_manager.save_settings("sentry_settings", self.sentry_settings)
+        self.config_manager.save_settings("log_settings", self.log_settings)
+        self.config_manager.save_settings("acquisition_settings", self.acquisition_settings)
         self.close()
 
     def set_pressurize_width(self, pressurize_width):
@@ -328,6 +410,9 @@ class SettingsDialog(QDialog):
             return
         self.timing_settings['delay_width'] = delay_width
 
+    def set_compensate_latency(self, state):
+        self.timing_settings['compensate_latency'] = bool(state)
+
     def set_pressurize_count(self, pressurize_count):
         try:
             pressurize_count = int(pressurize_count)
@@ -378,6 +463,17 @@ class SettingsDialog(QDialog):
         self.recalibrate_button.setEnabled(connected)
         self.enable_sentry_button.setEnabled(connected)
 
+    def set_calibration(self, calibration):
+        self.calibration = calibration
+        if len(calibration) == 0:
+            self.calibration_label.setText("Valve latency: not measured yet")
+            return
+        lines = []
+        for name, estimate in calibration.items():
+            lines.append(f"{name.capitalize()}: latency {estimate['low_latency_ms']:.1f}/{estimate['high_latency_ms']:.1f} ms, "
+                         f"width error {estimate['width_error_ms']:+.1f} ms")
+        self.calibration_label.setText("\n".join(lines))
+
     def set_pressure_signal(self, pressure_signal):
         self.pressure_signal = pressure_signal
 
@@ -433,5 +529,37 @@ class SettingsDialog(QDialog):
             return
         self.sentry_settings['max_pumps_in_window'] = max_pumps
 
+    def set_temp_max_size(self, size):
+        try:
+            size = float(size)
+        except:
+            return
+        self.log_settings['temp_max_size_mb'] = size
+
+    def set_temp_max_age(self, age):
+        try:
+            age = float(age)
+        except:
+            return
+        self.log_settings['temp_max_age_days'] = age
+
+    def set_segment_max_size(self, size):
+        try:
+            size = float(size)
+        except:
+            return
+        self.log_settings['segment_max_size_mb'] = size
+
+    def set_segment_max_minutes(self, minutes):
+        try:
+            minutes = float(minutes)
+        except:
+            return
+        self.log_settings['segment_max_minutes'] = minutes
+
+    def set_scan_profile(self, name):
+        if name in SCAN_PROFILES:
+            self.acquisition_settings['scan_list'] = list(SCAN_PROFILES[name])
+
     def enable_sentry(self):
         self.sentry.handle_experiment(False)
@@ -9,6 +9,9 @@ from PySide6.QtCore import QEvent, QStandardPaths
 from PySide6.QtGui import Qt
 from PySide6.QtWidgets import QDialog, QPushButton, QVBoxLayout, QFileDialog, QLabel, QSizePolicy
 from icarus_v2.backend.csv_exporter import CSVExporter
+from icarus_v2.backend.metrics import MetricsRegistry
+from icarus_v2.backend.tracing import LatencyTracer
+from time import perf_counter
 import numpy as np
 from bisect import bisect_left, bisect_right
 
@@ -20,6 +23,11 @@ class StyledPlotWidget(PlotWidget):
         self.config_manager = ConfigurationManager()
         self.config_manager.settings_updated.connect(self.update_theme)
 
+        # Time taken to draw each frame, labelled with the title, or the class until a title is set
+        self.frame_time = None
+        # Traces of events shown since the last frame, completed once it is painted
+        self.pending_traces = []
+
         background = self.get_background_color()
         PlotWidget.__init__(self, background=background)
 
@@ -101,6 +109,32 @@ class StyledPlotWidget(PlotWidget):
     def set_title(self, title):
         text_color = self.get_text_color()
         self.setTitle(title, color=text_color, size="17pt")
+        self.frame_time = self.get_frame_time_metric(title)
+
+    def get_frame_time_metric(self, plot):
+        return MetricsRegistry().summary("gui_frame_seconds", "Time taken to draw a plot.", plot=plot)
+
+    def paintEvent(self, event):
+        if self.frame_time is None:
+            self.frame_time = self.get_frame_time_metric(type(self).__name__)
+        with self.frame_time.time():
+            super().paintEvent(event)
+
+        if len(self.pending_traces) > 0:
+            rendered = perf_counter()
+            tracer = LatencyTracer()
+            for trace in self.pending_traces:
+                trace.rendered = rendered
+                tracer.record(trace)
+            self.pending_traces = []
+
+    # Called when the data of an event is shown. Hidden plots are not painted, so their traces end here.
+    def add_trace(self, trace):
+        trace.deliver()
+        if self.isVisible():
+            self.pending_traces.append(trace)
+        else:
+            LatencyTracer().record(trace)
 
     def set_y_label(self, label):
         text_color = self.get_text_color()
@@ -1,8 +1,12 @@
-from PySide6.QtWidgets import QToolBar, QWidget, QSizePolicy, QPushButton
+import os
+from PySide6.QtWidgets import QToolBar, QWidget, QSizePolicy, QPushButton, QFileDialog
 from PySide6.QtGui import QIcon, QAction
 from icarus_v2.gui.settings_dialog import SettingsDialog
-from PySide6.QtCore import Signal, Qt
+from icarus_v2.gui.diagnostics_dialog import DiagnosticsDialog
+from PySide6.QtCore import Signal, Qt, QStandardPaths
 from icarus_v2.gui.scrollable_menu import ScrollableMenu
+from icarus_v2.gui.error_dialog import open_error_dialog
+from icarus_v2.backend.sampling_profiler import SamplingProfiler
 
 
 class ToolBar(QToolBar):
@@ -18,11 +22,24 @@ class ToolBar(QToolBar):
         self.connected = False
         self.pressure_signal = None
         self.sentry = None
+        self.calibration = {} # Latest valve calibration estimates, shown in the settings dialog
         settings_action = QAction(QIcon(), "Settings", self)
         settings_action.triggered.connect(self.open_settings)
         self.addAction(settings_action)
         self.settings_dialog = None
 
+        # Diagnostics button
+        diagnostics_action = QAction(QIcon(), "Diagnostics", self)
+        diagnostics_action.triggered.connect(self.open_diagnostics)
+        self.addAction(diagnostics_action)
+        self.diagnostics_dialog = None
+
+        # Profiler button. Samples every thread until stopped, then saves the flame graph data.
+        self.profile_action = QAction(QIcon(), "Start Profiling", self)
+        self.profile_action.triggered.connect(self.toggle_profiling)
+        self.addAction(self.profile_action)
+        self.profiler = SamplingProfiler()
+
         # History reset button
         self.history_reset_action = QAction(QIcon(), "Reset History", self)
         self.addAction(self.history_reset_action)
@@ -48,7 +65,7 @@ class ToolBar(QToolBar):
 
     def open_settings(self):
         # Open the settings dialog
-        self.settings_dialog = SettingsDialog(self.connected, self.pressure_signal, self.sentry)
+        self.settings_dialog = SettingsDialog(self.connected, self.pressure_signal, self.sentry, self.calibration)
 
         def on_dialog_finished():
             self.settings_dialog = None
@@ -57,6 +74,43 @@ class ToolBar(QToolBar):
 
         self.settings_dialog.show()
 
+    def open_diagnostics(self):
+        # Only one diagnostics dialog is open at a time
+        if self.diagnostics_dialog is not None:
+            self.diagnostics_dialog.raise_()
+            return
+        self.diagnostics_dialog = DiagnosticsDialog()
+
+        def on_dialog_finished():
+            self.diagnostics_dialog = None
+
+        self.diagnostics_dialog.finished.connect(on_dialog_finished)
+
+        self.diagnostics_dialog.show()
+
+    def toggle_profiling(self):
+        if not self.profiler.isRunning():
+            self.profiler.start()
+            self.profile_action.setText("Stop Profiling")
+            return
+
+        self.profiler.stop()
+        self.profile_action.setText("Start Profiling")
+
+        default_dir = QStandardPaths.writableLocation(QStandardPaths.DownloadLocation)
+        filename, _ = QFileDialog.getSaveFileName(
+            self,
+            "Save Profile",
+            os.path.join(default_dir, "icarus_profile.txt"),
+            "Collapsed Stack Files (*.txt)"
+        )
+        if not filename:
+            return
+        try:
+            self.profiler.export(filename)
+        except OSError as e:
+            self.error_dialog = open_error_dialog(e, parent=self)
+
     def change_log_mode(self):
         if self.change_mode_action.text() == "Open Logs":
             self.change_mode_action.setText("Close Logs")
@@ -76,6 +130,11 @@ class ToolBar(QToolBar):
         if self.settings_dialog is not None:
             self.settings_dialog.set_sentry(sentry)
 
+    def set_calibration(self, calibration):
+        self.calibration = calibration
+        if self.settings_dialog is not None:
+            self.settings_dialog.set_calibration(calibration)
+
     def set_connected(self, connected):
         self.connected = connected
         if self.settings_dialog is not None:
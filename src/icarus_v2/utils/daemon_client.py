@@ -0,0 +1,53 @@
+import argparse
+import json
+import sys
+from PySide6.QtNetwork import QLocalSocket
+from icarus_v2.backend.status_server import DEFAULT_SOCKET
+
+
+# Milliseconds to wait for the daemon to connect and answer
+TIMEOUT_MS = 5000
+
+
+# Sends one request to a headless daemon and returns its response as a dict
+def send_request(request, socket_name=DEFAULT_SOCKET, timeout_ms=TIMEOUT_MS):
+    socket = QLocalSocket()
+    socket.connectToServer(socket_name)
+    if not socket.waitForConnected(timeout_ms):
+        raise ConnectionError(f"Could not connect to {socket_name}: {socket.errorString()}")
+
+    socket.write((request + "\n").encode("utf-8"))
+    socket.flush()
+    response = b""
+    while not response.endswith(b"\n"):
+        if not socket.waitForReadyRead(timeout_ms):
+            raise TimeoutError(f"No response from {socket_name}: {socket.errorString()}")
+        response += bytes(socket.readAll())
+    socket.disconnectFromServer()
+    return json.loads(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="icarus-ctl",
+        description="Query or control an icarus --headless daemon."
+    )
+    parser.add_argument("request", nargs="*", default=["status"],
+                        help="status (default), pulse on, pulse off, shutdown or quit.")
+    parser.add_argument("--socket", metavar="NAME", default=DEFAULT_SOCKET,
+                        help=f"Name of the local status socket of the daemon. Default: {DEFAULT_SOCKET}")
+    args = parser.parse_args()
+
+    try:
+        response = send_request(" ".join(args.request), args.socket)
+    except (ConnectionError, TimeoutError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(response, indent=2))
+    if "error" in response:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+import argparse
+import math
+import random
+from threading import Condition
+from time import monotonic, perf_counter, sleep
+from types import SimpleNamespace
+import numpy as np
+import usb.backend
+import usb.core
+from icarus_v2.backend.dataq_interface import DataqInterface, DI_4108_VENDOR_ID, DI_4108_PRODUCT_ID
+
+
+ENDPOINT_IN = 0x81
+ENDPOINT_OUT = 0x01
+ENODEV = 19
+ETIMEDOUT = 110
+
+# Sent by the device when its buffer overflows. Scanning stops afterwards.
+OVERFLOW_TRAILER = b"stop 01\r\0"
+
+
+# Default signal source for the emulator. Each analog channel is a sine wave of a different frequency.
+# generate returns (num_points, 8) int16 values for analog channels 0-7 given the current dout value.
+class SineSource:
+    def __init__(self, amplitude=8000) -> None:
+        self.amplitude = amplitude
+        self.index = 0
+
+    def generate(self, num_points, dio, sample_rate):
+        t = (self.index + np.arange(num_points)) / sample_rate
+        self.index += num_points
+        frequencies = np.arange(1, 9) * 0.5
+        values = self.amplitude * np.sin(2 * np.pi * t[:, None] * frequencies[None, :])
+        return values.astype(np.int16)
+
+
+# In-process model of the DI-4108 ASCII/binary protocol.
+# Commands are echoed while not scanning. After "start", binary packets of ps bytes are released
+# at the configured sample rate, scaled by speed (None releases them as fast as they are read).
+# jitter is the maximum delay in seconds added to the release of each packet.
+# Unread data beyond fifo_bytes overflows the device, which then sends "stop 01" and stops scanning.
+# overflow_after and disconnect_after inject faults after that many seconds of acquired data.
+# While disconnected, every call fails as if the device was unplugged. It reappears after reconnect_delay seconds.
+class DI4108Emulator:
+    def __init__(
+            self,
+            source=None,
+            speed=1.0,
+            jitter=0.0,
+            fifo_bytes=1 << 16,
+            command_latency=0.0,
+            overflow_after=None,
+            disconnect_after=None,
+            reconnect_delay=1.0,
+            seed=None
+    ) -> None:
+        self.source = source if source is not None else SineSource()
+        self.speed = speed
+        self.jitter = jitter
+        self.fifo_bytes = fifo_bytes
+        self.command_latency = command_latency
+        self.overflow_after = overflow_after
+        self.disconnect_after = disconnect_after
+        self.reconnect_delay = reconnect_delay
+        self.random = random.Random(seed)
+        self.condition = Condition()
+
+        # Incremented every time the device is plugged in. Handles from earlier generations are invalid.
+        self.generation = 0
+        self.connected = True
+        self.reconnect_time = None
+
+        # Statistics
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.commands = 0
+        self.overflows = 0
+        self.disconnects = 0
+
+        self.reset()
+
+    # Power-on state
+    def reset(self):
+        with self.condition:
+            self.slist = {}
+            self.srate = 1000
+            self.dec = 1
+            self.deca = 1
+            self.packet_size = 1024
+            self.dout = 0b1111111
+            self.packet_dout = self.dout # dout at the first sample of the next packet
+            self.dout_changes = [] # (time, dout) of changes during a scan not yet in a packet
+            self.scanning = False
+            self.responses = [] # (time available, bytes)
+            self.pending = bytearray() # Acquired data not yet read by the host
+            self.packets_released = 0
+            self.start_time = None
+            self.next_release = None
+            self.fault = None
+            self.condition.notify_all()
+
+    def get_sample_rate(self):
+        return 60000000 / (self.srate * self.dec * self.deca)
+
+    def get_channels(self):
+        return [self.slist[i] for i in sorted(self.slist)]
+
+    # Number of samples of every channel in one packet
+    def get_packet_points(self):
+        return max(1, self.packet_size // (2 * max(1, len(self.slist))))
+
+    def get_packet_duration(self):
+        return self.get_packet_points() / self.get_sample_rate()
+
+    # Seconds of data acquired since the scan started
+    def get_acquired_seconds(self):
+        return self.packets_released * self.get_packet_duration()
+
+    # Unplug the device. It is plugged back in after duration seconds, or never if duration is None.
+    def disconnect(self, duration=None):
+        with self.condition:
+            self.connected = False
+            self.scanning = False
+            self.disconnects += 1
+            self.reconnect_time = None if duration is None else monotonic() + duration
+            self.condition.notify_all()
+
+    def reconnect(self):
+        with self.condition:
+            self.reset()
+            self.connected = True
+            self.reconnect_time = None
+            self.generation += 1
+
+    def inject_overflow(self):
+        with self.condition:
+            self.fault = "overflow"
+            self.condition.notify_all()
+
+    def is_connected(self):
+        with self.condition:
+            if not self.connected and self.reconnect_time is not None and monotonic() >= self.reconnect_time:
+                self.reconnect()
+            return self.connected
+
+    # Raises the same error as libusb when the device is unplugged or the handle is stale
+    def check_handle(self, handle):
+        if not self.is_connected() or handle.generation != self.generation:
+            raise usb.core.USBError("No such device (it may have been disconnected)", -4, ENODEV)
+
+    def write(self, handle, data):
+        with self.condition:
+            self.check_handle(handle)
+            for command in bytes(data).decode("utf-8", errors="ignore").split("\r"):
+                if command.strip() != "":
+                    self.handle_command(command.strip())
+            self.condition.notify_all()
+        return len(data)
+
+    def handle_command(self, command):
+        self.commands += 1
+        args = command.split()
+        name = args[0]
+        was_scanning = self.scanning
+
+        if name == "start":
+            self.scanning = True
+            self.pending = bytearray()
+            self.packets_released = 0
+            self.start_time = monotonic()
+            self.next_release = self.start_time
+            self.packet_dout = self.dout
+            self.dout_changes = []
+            self.schedule_next_packet()
+        elif name == "stop":
+            self.scanning = False
+            self.pending = bytearray()
+        elif name == "slist" and len(args) == 3:
+            self.slist[int(args[1])] = int(args[2])
+        elif name == "srate" and len(args) == 2:
+            self.srate = int(args[1])
+        elif name == "dec" and len(args) == 2:
+            self.dec = int(args[1])
+        elif name == "deca" and len(args) == 2:
+            self.deca = int(args[1])
+        elif name == "ps" and len(args) == 2:
+            self.packet_size = 16 << int(args[1])
+        elif name == "dout" and len(args) == 2:
+            self.dout = int(args[1])
+            if self.scanning and self.speed is not None:
+                self.dout_changes.append((monotonic(), self.dout))
+            else:
+                self.packet_dout = self.dout
+
+        # Commands are not echoed while scanning since the response would be mixed with binary data.
+        # stop ends the scan, so its echo follows the last of the data.
+        if not was_scanning or name == "stop":
+            self.responses.append((monotonic() + self.command_latency, (command + "\r").encode("utf-8")))
+
+    # Time the next packet is released, including jitter
+    def schedule_next_packet(self):
+        if self.speed is None:
+            self.next_release = monotonic()
+            return
+        interval = self.get_packet_duration() / self.speed
+        delay = self.random.uniform(0, self.jitter) if self.jitter > 0 else 0
+        self.next_release = max(self.next_release, self.start_time + (self.packets_released + 1) * interval + delay)
+
+    # dout at every sample of the next packet. Changes appear from the first sample acquired after the command.
+    def get_packet_dout(self, points):
+        dout = np.full(points, self.packet_dout)
+        if self.speed is None:
+            return dout
+        first = self.packets_released * points
+        times = self.start_time + (first + np.arange(points)) / (self.get_sample_rate() * self.speed)
+        while len(self.dout_changes) > 0 and self.dout_changes[0][0] <= times[-1]:
+            change_time, self.packet_dout = self.dout_changes.pop(0)
+            dout[times >= change_time] = self.packet_dout
+        return dout
+
+    # Binary packet of the current scan list
+    def generate_packet(self):
+        points = self.get_packet_points()
+        analog = self.source.generate(points, self.dout, self.get_sample_rate())
+        dout = self.get_packet_dout(points)
+        packet = np.empty((points, len(self.slist)), dtype="<i2")
+        for column, channel in enumerate(self.get_channels()):
+            if channel == 8:
+                # Digital inputs are reported in the upper byte
+                packet[:, column] = (dout & 0x7f) << 8
+            else:
+                packet[:, column] = analog[:, channel & 0x7]
+        return packet.tobytes()
+
+    # Moves packets that are due into the pending data and applies scheduled faults
+    def release_packets(self, size):
+        now = monotonic()
+        while self.scanning and (now >= self.next_release or (self.speed is None and len(self.pending) < size)):
+            self.pending += self.generate_packet()
+            self.packets_released += 1
+            self.schedule_next_packet()
+
+            acquired = self.get_acquired_seconds()
+            if self.disconnect_after is not None and acquired >= self.disconnect_after:
+                self.disconnect_after = None
+                self.disconnect(self.reconnect_delay)
+                return
+            if self.overflow_after is not None and acquired >= self.overflow_after:
+                self.overflow_after = None
+                self.fault = "overflow"
+            if self.fault == "overflow" or (self.speed is not None and len(self.pending) > self.fifo_bytes):
+                self.overflow()
+
+    def overflow(self):
+        self.fault = None
+        self.overflows += 1
+        self.scanning = False
+        del self.pending[self.fifo_bytes:]
+        self.pending += OVERFLOW_TRAILER
+
+    def read(self, handle, size, timeout):
+        deadline = None if timeout == 0 else monotonic() + timeout / 1000
+        with self.condition:
+            while True:
+                self.check_handle(handle)
+                now = monotonic()
+
+                if len(self.responses) > 0 and self.responses[0][0] <= now:
+                    return self.responses.pop(0)[1][:size]
+
+                self.release_packets(size)
+                self.check_handle(handle)
+                if len(self.pending) > 0:
+                    data = bytes(self.pending[:size])
+                    del self.pending[:size]
+                    self.packets_sent += len(data) / self.packet_size
+                    self.bytes_sent += len(data)
+                    return data
+
+                wake = deadline
+                if len(self.responses) > 0:
+                    wake = self.responses[0][0] if wake is None else min(wake, self.responses[0][0])
+                if self.scanning:
+                    wake = self.next_release if wake is None else min(wake, self.next_release)
+                if deadline is not None and now >= deadline:
+                    raise usb.core.USBTimeoutError("Operation timed out", -7, ETIMEDOUT)
+                self.condition.wait(None if wake is None else max(0, wake - now))
+
+
+# Minimal descriptor set of the DI-4108: one configuration, one interface, a bulk IN and a bulk OUT endpoint
+DEVICE_DESCRIPTOR = SimpleNamespace(
+    bLength=18, bDescriptorType=1, bcdUSB=0x0200, bDeviceClass=0xff, bDeviceSubClass=0, bDeviceProtocol=0,
+    bMaxPacketSize0=64, idVendor=DI_4108_VENDOR_ID, idProduct=DI_4108_PRODUCT_ID, bcdDevice=0x0100,
+    iManufacturer=0, iProduct=0, iSerialNumber=0, bNumConfigurations=1,
+    address=1, bus=1, port_number=1, port_numbers=(1,), speed=3
+)
+CONFIGURATION_DESCRIPTOR = SimpleNamespace(
+    bLength=9, bDescriptorType=2, wTotalLength=32, bNumInterfaces=1, bConfigurationValue=1,
+    iConfiguration=0, bmAttributes=0x80, bMaxPower=50, extra_descriptors=[]
+)
+INTERFACE_DESCRIPTOR = SimpleNamespace(
+    bLength=9, bDescriptorType=4, bInterfaceNumber=0, bAlternateSetting=0, bNumEndpoints=2,
+    bInterfaceClass=0xff, bInterfaceSubClass=0, bInterfaceProtocol=0, iInterface=0, extra_descriptors=[]
+)
+ENDPOINT_DESCRIPTORS = [
+    SimpleNamespace(bLength=7, bDescriptorType=5, bEndpointAddress=ENDPOINT_IN, bmAttributes=2,
+                    wMaxPacketSize=512, bInterval=0, bRefresh=0, bSynchAddress=0, extra_descriptors=[]),
+    SimpleNamespace(bLength=7, bDescriptorType=5, bEndpointAddress=ENDPOINT_OUT, bmAttributes=2,
+                    wMaxPacketSize=512, bInterval=0, bRefresh=0, bSynchAddress=0, extra_descriptors=[]),
+]
+
+
+# pyusb backend exposing a DI4108Emulator as a USB device.
+# Pass to DataqInterface(backend=...) or usb.core.find(backend=...).
+class DI4108Backend(usb.backend.IBackend):
+    def __init__(self, emulator=None) -> None:
+        self.emulator = emulator if emulator is not None else DI4108Emulator()
+
+    def enumerate_devices(self):
+        if self.emulator.is_connected():
+            yield self.emulator
+
+    def get_parent(self, dev):
+        return None
+
+    # Like a real host, a new address is given to the device every time it is plugged in
+    def get_device_descriptor(self, dev):
+        return SimpleNamespace(**{**vars(DEVICE_DESCRIPTOR), "address": self.emulator.generation + 1})
+
+    def get_configuration_descriptor(self, dev, config):
+        if config != 0:
+            raise IndexError("Invalid configuration index " + str(config))
+        return CONFIGURATION_DESCRIPTOR
+
+    def get_interface_descriptor(self, dev, intf, alt, config):
+        if intf != 0 or alt != 0 or config != 0:
+            raise IndexError("Invalid interface index " + str((intf, alt)))
+        return INTERFACE_DESCRIPTOR
+
+    def get_endpoint_descriptor(self, dev, ep, intf, alt, config):
+        self.get_interface_descriptor(dev, intf, alt, config)
+        return ENDPOINT_DESCRIPTORS[ep]
+
+    def open_device(self, dev):
+        handle = SimpleNamespace(generation=self.emulator.generation)
+        self.emulator.check_handle(handle)
+        return handle
+
+    def close_device(self, dev_handle):
+        pass
+
+    def set_configuration(self, dev_handle, config_value):
+        self.emulator.check_handle(dev_handle)
+
+    def get_configuration(self, dev_handle):
+        self.emulator.check_handle(dev_handle)
+        return CONFIGURATION_DESCRIPTOR.bConfigurationValue
+
+    def set_interface_altsetting(self, dev_handle, intf, altsetting):
+        self.emulator.check_handle(dev_handle)
+
+    def claim_interface(self, dev_handle, intf):
+        self.emulator.check_handle(dev_handle)
+
+    def release_interface(self, dev_handle, intf):
+        pass
+
+    def reset_device(self, dev_handle):
+        self.emulator.check_handle(dev_handle)
+        self.emulator.reset()
+
+    def clear_halt(self, dev_handle, ep):
+        self.emulator.check_handle(dev_handle)
+
+    def bulk_write(self, dev_handle, ep, intf, data, timeout):
+        return self.emulator.write(dev_handle, data)
+
+    def bulk_read(self, dev_handle, ep, intf, buff, timeout):
+        data = self.emulator.read(dev_handle, len(buff) * buff.itemsize, timeout)
+        memoryview(buff).cast("B")[:len(data)] = data
+        return len(data)
+
+    intr_write = bulk_write
+    intr_read = bulk_read
+    iso_write = bulk_write
+    iso_read = bulk_read
+
+
+# Reads from device until seconds of data were acquired or the scan ends.
+# Returns (samples read, wall time, error message or None)
+def acquire(device, seconds):
+    samples = 0
+    target = seconds * device.sample_rate
+    device.start_scan()
+    start = perf_counter()
+    error = None
+    try:
+        while samples < target:
+            data = device.read_data()
+            samples += len(data) // (2 * device.channels_to_read)
+    except (RuntimeError, usb.core.USBError) as e:
+        error = str(e)
+    elapsed = perf_counter() - start
+    device.end_scan()
+    return samples, elapsed, error
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="icarus-emulate",
+        description="Benchmark DataqInterface against an emulated DI-4108: setup latency, "
+                    "acquisition throughput, overflow handling and reconnection."
+    )
+    parser.add_argument("--seconds", type=float, default=10, help="Seconds of data to acquire.")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="Playback speed relative to real time. 0 releases data as fast as it is read.")
+    parser.add_argument("--jitter", type=float, default=0, help="Maximum packet delay in ms.")
+    parser.add_argument("--command-latency", type=float, default=0, help="Delay of command echoes in ms.")
+    parser.add_argument("--overflow-after", type=float, default=None, help="Inject an overflow after this many seconds.")
+    parser.add_argument("--disconnect-after", type=float, default=None,
+                        help="Unplug the device after this many seconds and measure reconnection.")
+    parser.add_argument("--reconnect-delay", type=float, default=1, help="Seconds the device stays unplugged.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for packet jitter.")
+    args = parser.parse_args()
+
+    emulator = DI4108Emulator(
+        speed=args.speed if args.speed > 0 else None,
+        jitter=args.jitter / 1000,
+        command_latency=args.command_latency / 1000,
+        overflow_after=args.overflow_after,
+        disconnect_after=args.disconnect_after,
+        reconnect_delay=args.reconnect_delay,
+        seed=args.seed
+    )
+    backend = DI4108Backend(emulator)
+
+    device = DataqInterface(backend=backend)
+    setup = device.get_setup_metrics()
+    print(f"Setup: {setup['setup_ms']:.1f} ms ({emulator.commands} commands)")
+    print(f"Sample rate: {device.sample_rate:.0f} Hz, {device.channels_to_read} channels")
+
+    samples, elapsed, error = acquire(device, args.seconds)
+    rate = samples / elapsed if elapsed > 0 else math.inf
+    print(f"Acquired {samples} samples in {elapsed:.2f}s ({rate:.0f} samples/s, "
+          f"{emulator.bytes_sent / elapsed / 1e6:.2f} MB/s)")
+    if error is not None:
+        print(f"Scan ended: {error}")
+
+    if not emulator.is_connected():
+        # Same retry loop as DataHandler
+        start = perf_counter()
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                device = DataqInterface(backend=backend)
+                break
+            except Exception as e:
+                if "USB device not found" not in str(e) and "No such device" not in str(e):
+                    raise e
+                sleep(0.05)
+        print(f"Reconnected after {perf_counter() - start:.2f}s ({attempts} attempts)")
+    else:
+        # The device keeps its configuration, so setting it up again only stops it
+        device.stop()
+        device.close_device()
+        commands = emulator.commands
+        device = DataqInterface(backend=backend)
+        setup = device.get_setup_metrics()
+        print(f"Setup of a configured device: {setup['setup_ms']:.1f} ms ({emulator.commands - commands} commands, "
+              f"{setup['commands_skipped']} skipped)")
+        device.stop()
+
+    device.close_device()
+    print(f"Overflows: {emulator.overflows}, disconnects: {emulator.disconnects}")
+
+
+if __name__ == "__main__":
+    main()
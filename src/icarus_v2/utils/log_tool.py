@@ -0,0 +1,187 @@
+import argparse
+import io
+import lzma
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from icarus_v2.backend.event import Event
+
+
+# Names accepted on the command line for --drop
+EVENT_TYPES = {
+    "pressurize": Event.PRESSURIZE,
+    "depressurize": Event.DEPRESSURIZE,
+    "period": Event.PERIOD,
+    "pressure": Event.PRESSURE,
+    "pump": Event.PUMP,
+}
+
+
+# One xz stream of a log file.
+# Log files are a sequence of xz streams, since the logger starts a new stream every time it flushes.
+# Every stream holds whole pickled records, so streams can be copied between files untouched.
+class LogStream:
+    def __init__(self, compressed, data) -> None:
+        self.compressed = compressed # Raw bytes of the stream as stored on disk
+        self.records = [] # (record, pickled bytes of record)
+
+        file = io.BytesIO(data)
+        while file.tell() < len(data):
+            start = file.tell()
+            record = pickle.load(file)
+            self.records.append((record, data[start:file.tell()]))
+
+    # event_time of the first event in the stream, or None if it has no events
+    def first_event_time(self):
+        for record, _ in self.records:
+            if is_event(record):
+                return record["event_time"]
+        return None
+
+    # Returns the stream, either untouched or re-encoded with only the records for which keep(record) is True
+    # Returns None if no records are kept
+    def filter(self, keep):
+        kept = [raw for record, raw in self.records if keep(record)]
+        if len(kept) == len(self.records):
+            return self.compressed, False
+        if len(kept) == 0:
+            return None, False
+        return lzma.compress(b"".join(kept), format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64), True
+
+
+# Yields the xz streams of a log file one at a time
+def iter_streams(filename, chunk_size=1 << 20):
+    with open(filename, "rb") as file:
+        buffer = b""
+        while True:
+            if len(buffer) == 0:
+                buffer = file.read(chunk_size)
+                if len(buffer) == 0:
+                    return
+
+            # Skip stream padding
+            if buffer[:4] == b"\0\0\0\0":
+                buffer = buffer[4:]
+                continue
+
+            decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+            compressed = []
+            data = []
+            while not decompressor.eof:
+                if len(buffer) == 0:
+                    buffer = file.read(chunk_size)
+                    if len(buffer) == 0:
+                        raise RuntimeError(f"Error: {filename} ends with an incomplete xz stream.")
+                data.append(decompressor.decompress(buffer))
+                if decompressor.eof:
+                    used = len(buffer) - len(decompressor.unused_data)
+                    compressed.append(buffer[:used])
+                    buffer = decompressor.unused_data
+                else:
+                    compressed.append(buffer)
+                    buffer = b""
+
+            yield LogStream(b"".join(compressed), b"".join(data))
+
+
+def is_event(record):
+    return isinstance(record, dict) and "event_type" in record
+
+
+# Extracts events between start and end seconds and drops event types in drop_types.
+# Times are relative to the first event of the log, as in the log viewer. None means unbounded.
+# Streams which keep all of their records are copied without being re-compressed.
+# Returns dictionary of statistics on the operation.
+def crop_log(filename, output, start=None, end=None, drop_types=()):
+    initial_time = None
+
+    def keep(record):
+        # Coefficients and other non-event records are always kept
+        if not is_event(record):
+            return True
+        if record["event_type"] in drop_types:
+            return False
+        time = record["event_time"] - initial_time
+        if start is not None and time < start:
+            return False
+        if end is not None and time > end:
+            return False
+        return True
+
+    stats = {"streams": 0, "copied": 0, "encoded": 0, "dropped": 0}
+    with open(output, "wb") as file:
+        for stream in iter_streams(filename):
+            stats["streams"] += 1
+            if initial_time is None:
+                initial_time = stream.first_event_time()
+            compressed, encoded = stream.filter(keep)
+            if compressed is None:
+                stats["dropped"] += 1
+                continue
+            stats["encoded" if encoded else "copied"] += 1
+            file.write(compressed)
+
+    return stats
+
+
+# Joins logs into one file by concatenating their streams. Nothing is decoded.
+# Files are joined in the order given. Coefficients of the last file take precedence when the result is read.
+def join_logs(filenames, output):
+    with open(output, "wb") as out_file:
+        for filename in filenames:
+            with open(filename, "rb") as in_file:
+                while chunk := in_file.read(1 << 20):
+                    out_file.write(chunk)
+
+
+def _crop_log_job(args):
+    filename, output, start, end, drop_types = args
+    return filename, crop_log(filename, output, start, end, drop_types)
+
+
+# Crops many logs in parallel, writing outputs with the same names to output_dir
+# Returns dictionary of statistics for each file
+def crop_logs(filenames, output_dir, start=None, end=None, drop_types=(), workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(f, os.path.join(output_dir, os.path.basename(f)), start, end, tuple(drop_types)) for f in filenames]
+    if len(jobs) == 1:
+        return dict([_crop_log_job(jobs[0])])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(_crop_log_job, jobs))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="icarus-log", description="Crop, trim and join icarus log files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crop_parser = subparsers.add_parser("crop", help="Extract a time range and/or drop event types.")
+    crop_parser.add_argument("files", nargs="+", help="Log files to crop.")
+    crop_parser.add_argument("-o", "--output", required=True,
+                             help="Output file, or output directory when cropping multiple files.")
+    crop_parser.add_argument("--start", type=float, default=None, help="Start time (s) from the first event.")
+    crop_parser.add_argument("--end", type=float, default=None, help="End time (s) from the first event.")
+    crop_parser.add_argument("--drop", nargs="+", default=[], choices=EVENT_TYPES.keys(),
+                             help="Event types to remove.")
+    crop_parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of parallel workers.")
+
+    join_parser = subparsers.add_parser("join", help="Concatenate logs into one file.")
+    join_parser.add_argument("files", nargs="+", help="Log files to join, in order.")
+    join_parser.add_argument("-o", "--output", required=True, help="Output file.")
+
+    args = parser.parse_args()
+
+    if args.command == "crop":
+        drop_types = [EVENT_TYPES[name] for name in args.drop]
+        if len(args.files) == 1 and not os.path.isdir(args.output):
+            results = {args.files[0]: crop_log(args.files[0], args.output, args.start, args.end, drop_types)}
+        else:
+            results = crop_logs(args.files, args.output, args.start, args.end, drop_types, args.jobs)
+        for filename, stats in results.items():
+            print(f"{filename}: {stats['copied']} streams copied, {stats['encoded']} re-encoded, "
+                  f"{stats['dropped']} dropped")
+    elif args.command == "join":
+        join_logs(args.files, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,22 @@ from threading import Lock
 from time import time, sleep
 import lzma
 import pickle
+from icarus_v2.backend.event import FULL_SCAN_LIST
 
 
 # Fake device to load example data files
 # Used only for testing.
+# speed is the playback speed relative to real time. If None, data is returned as fast as it is read.
+# Raw logs start with a device_settings header giving the sample rate. Older logs without one were all recorded at 4 kHz.
 class RawLogReader:
-    def __init__(self, filename) -> None:
+    def __init__(self, filename, speed=2) -> None:
         self.stop_lock = Lock() # Used to make sure you do not stop the device while reading
         self.sample_rate = 4000
         self.points_to_read = 64
         self.channels_to_read = 8
+        self.scan_list = list(FULL_SCAN_LIST)
+        self.srate = None
+        self.dec = None
         self.initial_time = None
         self.current_dio = None
         self.acquiring = None
@@ -21,24 +27,66 @@ class RawLogReader:
 
         # Used to tell how long to wait on reads
         self.read_count = 0
+        self.samples_read = 0
+        self.speed = speed
         # File
         self.file = lzma.open(filename, "rb")
+        # First block of a log without a header. Returned by the first read.
+        self.pending = None
+        self.read_header()
 
-    def read_data(self):
+    def read_header(self):
+        try:
+            first = pickle.load(self.file)
+        except EOFError:
+            return
+        if isinstance(first, dict) and "device_settings" in first:
+            self.apply_device_settings(first["device_settings"])
+        else:
+            self.pending = first
+
+    def apply_device_settings(self, settings):
+        self.sample_rate = settings["sample_rate"]
+        self.srate = settings.get("srate")
+        self.dec = settings.get("dec")
+        self.channels_to_read = settings.get("channels", self.channels_to_read)
+        self.points_to_read = settings.get("points", self.points_to_read)
+        self.scan_list = settings.get("scan_list", self.scan_list)
+        self.bytes_to_read = self.channels_to_read * 2 * self.points_to_read
+
+    def get_device_settings(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "srate": self.srate,
+            "dec": self.dec,
+            "channels": self.channels_to_read,
+            "points": self.points_to_read,
+            "scan_list": self.scan_list,
+        }
+
+    # Blocks are returned as they were logged. size is ignored.
+    def read_data(self, size=None):
         if self.read_count == 0:
             self.initial_time = time()
-        else:
-            speed = 2
-            next_read = self.initial_time + self.read_count * self.points_to_read / (self.sample_rate * speed)
+        elif self.speed is not None:
+            next_read = self.initial_time + self.samples_read / (self.sample_rate * self.speed)
             sleep(max(0, next_read - time()))
         self.read_count += 1
 
         try:
             # Deserialize each object from the file
-            data = pickle.load(self.file)
+            if self.pending is not None:
+                data = self.pending
+                self.pending = None
+            else:
+                data = pickle.load(self.file)
+            # Joined segments each start with a header
+            while isinstance(data, dict) and "device_settings" in data:
+                data = pickle.load(self.file)
             # Append the array if it matches the expected structure
             if not isinstance(data, array):
                 raise TypeError("Error parsing example data file: Data is not an array.")
+            self.samples_read += len(data) / (2 * self.channels_to_read)
             return data
         except EOFError:
             raise RuntimeError("End of file reached.")
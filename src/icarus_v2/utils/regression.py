@@ -0,0 +1,261 @@
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from time import perf_counter
+import numpy as np
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.event import Event, Channel
+from icarus_v2.utils.reprocess import Reprocessor
+
+
+EVENT_NAMES = {
+    Event.PRESSURIZE: "pressurize",
+    Event.DEPRESSURIZE: "depressurize",
+    Event.PERIOD: "period",
+    Event.PRESSURE: "pressure",
+    Event.PUMP: "pump",
+}
+
+# Tolerance for statistics. Event types, indices and data checksums must match exactly.
+RELATIVE_TOLERANCE = 1e-6
+ABSOLUTE_TOLERANCE = 1e-9
+
+
+# Resident set size of this process in bytes, or None if it cannot be measured on this platform
+def current_rss():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current RSS. Reported in kB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Accumulates time spent in each stage of the pipeline and the highest RSS seen while in it.
+# Stages may be nested, in which case time in the inner stage is not counted towards the outer one.
+class StageProfiler:
+    def __init__(self) -> None:
+        self.stages = {} # name: {"seconds", "calls", "peak_rss"}
+        self.stack = [] # time spent in nested stages of each open stage
+
+    @contextmanager
+    def measure(self, stage):
+        self.stack.append(0.0)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            nested = self.stack.pop()
+            if len(self.stack) > 0:
+                self.stack[-1] += elapsed
+
+            record = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "peak_rss": None})
+            record["seconds"] += elapsed - nested
+            record["calls"] += 1
+            rss = current_rss()
+            if rss is not None and (record["peak_rss"] is None or rss > record["peak_rss"]):
+                record["peak_rss"] = rss
+
+
+# Values compared against the golden output for one event.
+# sample is the index of the event in the raw file, derived from the simulated event time.
+def summarize_event(event, sample_rate):
+    stats = {}
+    match event.event_type:
+        case Event.PRESSURIZE | Event.DEPRESSURIZE:
+            stats["origin_slope"] = event.get_slope(Channel.HI_PRE_ORIG)
+            stats["sample_slope"] = event.get_slope(Channel.HI_PRE_SAMPLE)
+            stats["origin_switch_time"] = event.get_origin_switch_time()
+            stats["sample_switch_time"] = event.get_sample_switch_time()
+            if event.event_type == Event.DEPRESSURIZE:
+                stats["initial_origin"] = event.get_initial_origin()
+                stats["initial_sample"] = event.get_initial_sample()
+        case Event.PRESSURE:
+            stats["origin_pressure"] = event.get_origin_pressure()
+            stats["target_pressure"] = event.get_target_pressure()
+        case Event.PUMP:
+            stats["initial_target"] = event.get_initial_target()
+
+    return {
+        "type": EVENT_NAMES[event.event_type],
+        "sample": int(round(event.event_time * sample_rate)),
+        "event_index": None if event.event_index is None else int(event.event_index),
+        "length": int(len(event.data)),
+        "checksum": int(event.data.astype(np.int64).sum()),
+        "stats": {name: float(value) for name, value in stats.items()},
+    }
+
+
+# Returns list of differences between two event summaries
+def compare_events(golden, actual):
+    differences = []
+    for key in ("type", "sample", "event_index", "length", "checksum"):
+        if golden[key] != actual[key]:
+            differences.append(f"{key} {golden[key]} != {actual[key]}")
+    for name, expected in golden["stats"].items():
+        value = actual["stats"].get(name)
+        if value is None:
+            differences.append(f"{name} missing")
+        elif not math.isclose(expected, value, rel_tol=RELATIVE_TOLERANCE, abs_tol=ABSOLUTE_TOLERANCE):
+            if not (math.isnan(expected) and math.isnan(value)):
+                differences.append(f"{name} {expected} != {value}")
+    return differences
+
+
+# Returns list of human readable mismatches between golden and actual event lists.
+# Events are compared per type, so interleaving between handlers does not matter.
+def compare_outputs(golden, actual):
+    mismatches = []
+    for name in EVENT_NAMES.values():
+        golden_events = [e for e in golden if e["type"] == name]
+        actual_events = [e for e in actual if e["type"] == name]
+        if len(golden_events) != len(actual_events):
+            mismatches.append(f"{name}: expected {len(golden_events)} events, got {len(actual_events)}")
+        for i, (expected, event) in enumerate(zip(golden_events, actual_events)):
+            differences = compare_events(expected, event)
+            if len(differences) > 0:
+                mismatches.append(f"{name} #{i}: " + ", ".join(differences))
+    return mismatches
+
+
+def golden_filename(raw_file, golden_dir):
+    name = os.path.splitext(os.path.basename(raw_file))[0]
+    return os.path.join(golden_dir, name + ".json")
+
+
+# Replays one raw file through the pipeline.
+# Returns (list of event summaries, benchmark results)
+def run_raw_file(raw_file):
+    profiler = StageProfiler()
+    with tempfile.TemporaryDirectory() as directory:
+        # Fixed start time so event times depend only on the data
+        reprocessor = Reprocessor(raw_file, os.path.join(directory, "events.xz"), start_time=0.0)
+        reprocessor.profiler = profiler
+        sample_rate = reprocessor.device.sample_rate
+
+        # Summaries are computed while the handler emits, so they are measured as their own stage
+        # to keep them out of the handler timings
+        events = []
+        def collect(event):
+            with profiler.measure("summarize"):
+                events.append(summarize_event(event, sample_rate))
+        for signal in [
+            reprocessor.pressurize_event_signal,
+            reprocessor.depressurize_event_signal,
+            reprocessor.period_event_signal,
+            reprocessor.pressure_event_signal,
+            reprocessor.pump_event_signal
+        ]:
+            signal.connect(collect)
+
+        start = perf_counter()
+        samples = reprocessor.run()
+        elapsed = perf_counter() - start
+
+    stages = {}
+    for stage, record in profiler.stages.items():
+        stages[stage] = {
+            "seconds": record["seconds"],
+            "calls": record["calls"],
+            "samples_per_second": samples / record["seconds"] if record["seconds"] > 0 else None,
+            "peak_rss_mb": None if record["peak_rss"] is None else record["peak_rss"] / 1e6,
+        }
+
+    benchmark = {
+        "samples": samples,
+        "seconds": elapsed,
+        "samples_per_second": samples / elapsed if elapsed > 0 else None,
+        "stages": stages,
+    }
+    return events, benchmark
+
+
+def print_benchmark(raw_file, benchmark):
+    print(f"{os.path.basename(raw_file)}: {benchmark['samples']} samples in {benchmark['seconds']:.2f}s "
+          f"({benchmark['samples_per_second']:.0f} samples/s)")
+    for stage, record in sorted(benchmark["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        rate = record["samples_per_second"]
+        rate = "-" if rate is None else f"{rate:.0f}"
+        rss = record["peak_rss_mb"]
+        rss = "-" if rss is None else f"{rss:.1f}"
+        print(f"  {stage:<20} {record['seconds']:8.3f}s {rate:>14} samples/s  peak RSS {rss:>8} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="icarus-regress",
+        description="Replay raw logs through the detection pipeline, compare events with golden outputs "
+                    "and report throughput and memory of each stage."
+    )
+    parser.add_argument("files", nargs="*", help="Raw logs to replay. Defaults to logs/raw/*.xz.")
+    parser.add_argument("--golden-dir", default=None,
+                        help="Directory of golden outputs. Defaults to a golden directory next to each raw log.")
+    parser.add_argument("--update", action="store_true", help="Overwrite golden outputs with the current results.")
+    parser.add_argument("--json", default=None, help="Write benchmark results to this file.")
+    args = parser.parse_args()
+
+    files = args.files
+    if len(files) == 0:
+        files = sorted(glob.glob(os.path.join("logs", "raw", "*.xz")))
+    if len(files) == 0:
+        parser.error("no raw logs given and none found in logs/raw")
+
+    # Use the same settings as the application
+    ConfigurationManager()
+
+    failed = False
+    results = {}
+    for raw_file in files:
+        golden_dir = args.golden_dir or os.path.join(os.path.dirname(raw_file), "golden")
+        golden_file = golden_filename(raw_file, golden_dir)
+
+        events, benchmark = run_raw_file(raw_file)
+        results[raw_file] = benchmark
+        print_benchmark(raw_file, benchmark)
+
+        if args.update:
+            os.makedirs(golden_dir, exist_ok=True)
+            with open(golden_file, "w") as file:
+                json.dump({"raw_file": os.path.basename(raw_file), "events": events}, file, indent=1)
+            print(f"  wrote {len(events)} events to {golden_file}")
+            continue
+
+        if not os.path.exists(golden_file):
+            print(f"  no golden output at {golden_file}, run with --update to create it")
+            failed = True
+            continue
+
+        with open(golden_file) as file:
+            golden = json.load(file)["events"]
+        mismatches = compare_outputs(golden, events)
+        if len(mismatches) == 0:
+            print(f"  PASS: {len(events)} events match")
+        else:
+            failed = True
+            print(f"  FAIL: {len(mismatches)} mismatches")
+            for mismatch in mismatches[:20]:
+                print(f"    {mismatch}")
+            if len(mismatches) > 20:
+                print(f"    ... {len(mismatches) - 20} more")
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
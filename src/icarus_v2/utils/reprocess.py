@@ -0,0 +1,115 @@
+import argparse
+import os
+from time import time, perf_counter
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.event import Event
+from icarus_v2.backend.logger import Logger
+from icarus_v2.backend.pipeline import Pipeline, LOG, WARNING, ERROR
+from icarus_v2.utils.raw_log_reader import RawLogReader
+
+
+# Time of the newest sample in the buffer, assuming samples arrive at exactly sample_rate from start_time.
+# Replaces time() for event timestamps so events are timed as if the data had been acquired live.
+class SampleClock:
+    def __init__(self, buffer, sample_rate, start_time) -> None:
+        self.buffer = buffer
+        self.sample_rate = sample_rate
+        self.start_time = start_time
+
+    def __call__(self):
+        return self.start_time + self.buffer.write_index / self.sample_rate
+
+
+# Runs a raw log through the acquisition and detection pipeline without a GUI and without pacing.
+# Any other device that ends its scan with "End of file reached." may be given instead of a raw log.
+# Handlers are driven synchronously after every block instead of from their threads,
+# and all events are written to a single event log.
+class Reprocessor:
+    def __init__(self, raw_file, output, start_time=0.0, device=None):
+        self.device = device if device is not None else RawLogReader(raw_file, speed=None)
+        self.output = output
+        self.logger = Logger()
+        self.pipeline = Pipeline(self.device, logger=self.logger)
+        self.clock = SampleClock(self.pipeline.loader.buffer, self.device.sample_rate, start_time)
+        for handler in self.pipeline.handlers:
+            handler.clock = self.clock
+
+        # Topics of the pipeline. Connected to like the signals of DataHandler.
+        bus = self.pipeline.bus
+        self.pressurize_event_signal = bus.topic(Event.PRESSURIZE)
+        self.depressurize_event_signal = bus.topic(Event.DEPRESSURIZE)
+        self.period_event_signal = bus.topic(Event.PERIOD)
+        self.pressure_event_signal = bus.topic(Event.PRESSURE)
+        self.pump_event_signal = bus.topic(Event.PUMP)
+        self.log_signal = bus.topic(LOG)
+        self.pipeline.subscribe(WARNING, lambda x: print(str(x)))
+        self.pipeline.subscribe(ERROR, lambda x: print(str(x)))
+
+        # Count emitted events by type
+        self.event_counts = {}
+        for signal in [
+            self.pressurize_event_signal,
+            self.depressurize_event_signal,
+            self.period_event_signal,
+            self.pressure_event_signal,
+            self.pump_event_signal
+        ]:
+            signal.connect(self.count_event)
+
+    # Optional object with a measure(stage) context manager, used to time each stage of the pipeline
+    @property
+    def profiler(self):
+        return self.pipeline.profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self.pipeline.profiler = profiler
+
+    def count_event(self, event):
+        self.event_counts[event.event_type] = self.event_counts.get(event.event_type, 0) + 1
+
+    # Returns number of samples processed
+    def run(self):
+        self.logger.new_log_file(filename=self.output)
+        return self.pipeline.run_to_end()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="icarus-reprocess",
+        description="Run a raw log through the event detection pipeline as fast as possible and write an event log."
+    )
+    parser.add_argument("raw_file", help="Raw log to reprocess.")
+    parser.add_argument("-o", "--output", required=True, help="Event log to write.")
+    parser.add_argument("-f", "--force", action="store_true", help="Overwrite the event log if it exists.")
+    parser.add_argument("--start-time", type=float, default=None,
+                        help="Unix time of the first sample. Defaults to the current time.")
+    args = parser.parse_args()
+    if os.path.exists(args.output) and not args.force:
+        parser.error(f"{args.output} already exists. Use --force to overwrite it.")
+
+    # Use the same settings as the application
+    ConfigurationManager()
+
+    start_time = time() if args.start_time is None else args.start_time
+    reprocessor = Reprocessor(args.raw_file, args.output, start_time)
+
+    begin = perf_counter()
+    samples = reprocessor.run()
+    elapsed = perf_counter() - begin
+
+    recorded = samples / reprocessor.device.sample_rate
+    print(f"Processed {recorded:.1f}s of data in {elapsed:.2f}s ({samples / elapsed:.0f} samples/s).")
+    names = {
+        Event.PRESSURIZE: "pressurize",
+        Event.DEPRESSURIZE: "depressurize",
+        Event.PERIOD: "period",
+        Event.PRESSURE: "pressure",
+        Event.PUMP: "pump",
+    }
+    for event_type, count in sorted(reprocessor.event_counts.items()):
+        print(f"{names[event_type]}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import socket
+import sys
+from icarus_v2.backend.event_server import (
+    DEFAULT_ADDRESS, TOPICS, EVENT_TOPICS, POLICIES, DROP_OLDEST, HELLO, EVENT, SUMMARY, ALERT, LOG, DROPPED,
+    parse_address, read_frame, decode_frame
+)
+
+
+# Topic name of each event type
+EVENT_NAMES = {event_type: topic for topic, event_type in EVENT_TOPICS.items()}
+
+
+# Subscribes to an EventServer, e.g. of `icarus --stream`. Iterating gives (frame type, item) until the server closes:
+#   EVENT: Event, with data only if samples were requested
+#   SUMMARY: dict of time, target and origin pressure
+#   ALERT: dict of topic, type, time and message
+#   LOG: new state of the log bit
+#   DROPPED: number of frames dropped because this client fell behind
+class StreamClient:
+    def __init__(self, address=DEFAULT_ADDRESS, topics=None, decimate=1, samples=False, queue=256, policy=DROP_OLDEST):
+        family, connect_address = parse_address(address)
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.connect(connect_address)
+        self.file = self.socket.makefile("rb")
+
+        request = {
+            "topics": TOPICS if topics is None else topics,
+            "decimate": decimate,
+            "samples": samples,
+            "queue": queue,
+            "policy": policy,
+        }
+        self.socket.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        frame = read_frame(self.file)
+        if frame is None or frame[0] != HELLO:
+            raise ConnectionError(f"No response from {address}.")
+        self.subscription = decode_frame(*frame)
+        if "error" in self.subscription:
+            raise ValueError(self.subscription["error"])
+
+    def __iter__(self):
+        while True:
+            frame = read_frame(self.file)
+            if frame is None:
+                return
+            yield frame[0], decode_frame(*frame)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="icarus-stream",
+        description="Print live events from an icarus instance started with --stream."
+    )
+    parser.add_argument("address", nargs="?", default=DEFAULT_ADDRESS,
+                        help=f"host:port or Unix socket path of the server. Default: {DEFAULT_ADDRESS}")
+    parser.add_argument("-t", "--topics", nargs="+", choices=TOPICS, default=None,
+                        help="Topics to receive. Default: all")
+    parser.add_argument("--decimate", type=int, default=1, help="Receive every nth event of each type.")
+    parser.add_argument("--samples", action="store_true", help="Receive the samples of events.")
+    parser.add_argument("--queue", type=int, default=256, help="Frames the server queues before dropping.")
+    parser.add_argument("--policy", choices=POLICIES, default=DROP_OLDEST, help="What the server does when the queue is full.")
+    args = parser.parse_args()
+
+    try:
+        client = StreamClient(args.address, args.topics, args.decimate, args.samples, args.queue, args.policy)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    with client:
+        try:
+            for frame_type, item in client:
+                if frame_type == EVENT:
+                    shape = "" if item.data is None else f" {item.data.shape[0]}x{item.data.shape[1]} samples"
+                    print(f"{item.event_time:.3f} {EVENT_NAMES[item.event_type]}{shape}", flush=True)
+                elif frame_type == SUMMARY:
+                    print(f"{item['time']:.3f} pressure target {item['target']:.3f} origin {item['origin']:.3f}", flush=True)
+                elif frame_type == ALERT:
+                    print(f"{item['time']:.3f} {item['topic']}: {item['message']}", flush=True)
+                elif frame_type == LOG:
+                    print(f"log bit {'high' if item else 'low'}", flush=True)
+                elif frame_type == DROPPED:
+                    print(f"dropped {item} frames", flush=True)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import argparse
+import lzma
+import pickle
+from array import array
+from threading import Lock
+from time import time, sleep, perf_counter
+import numpy as np
+from icarus_v2.backend.event import FULL_SCAN_LIST, SCAN_PROFILES
+
+
+# kbar per count of the pressure channels. Same as the default plotting coefficients.
+TARGET_COEFFICIENT = 0.00015891062810171653
+ORIGIN_COEFFICIENT = 0.00021041129395578411
+SAMPLE_COEFFICIENT = 0.00020670162896002954
+
+PUMP_BIT = 1 << 0
+DEPRESSURIZE_BIT = 1 << 1
+PRESSURIZE_BIT = 1 << 2
+
+
+# Applies y[n] = a * y[n-1] + (1 - a) * x[n] to x, starting from y0.
+# This is the exact discretization of a first order lag with time constant tau when a = exp(-1 / (tau * sample_rate)).
+# Evaluated in closed form in short pieces so a^-n does not overflow.
+def first_order(x, y0, a, piece=64):
+    y = np.empty(len(x))
+    for start in range(0, len(x), piece):
+        x_piece = x[start:start + piece]
+        n = np.arange(1, len(x_piece) + 1)
+        weights = a ** -n
+        y[start:start + piece] = a ** n * (y0 + np.cumsum((1 - a) * x_piece * weights))
+        y0 = y[start + len(x_piece) - 1]
+    return y
+
+
+# Lumped model of the pressure jump apparatus. Pressures are in kbar.
+# The pump keeps a reservoir at target_pressure. Each stroke compresses the reservoir back to target,
+# then the intake briefly drops the target reading.
+# The pressurize valve connects the reservoir to the sample cell, drawing some reservoir pressure.
+# The depressurize valve vents the cell to ambient. Both valves open after a dead time.
+# The sample transducer follows the origin transducer with a lag.
+# Valve sensors respond to the valve actuation with a fast rise and a slower decay.
+# generate returns (num_points, 8) int16 counts of analog channels 0-7 given the DIO value,
+# so it can also be used as the signal source of DI4108Emulator.
+class PressureModel:
+    def __init__(self, target_pressure=1.5, noise=8, seed=None) -> None:
+        self.target_pressure = target_pressure
+        self.noise = noise # Standard deviation of noise in counts
+        self.random = np.random.default_rng(seed)
+
+        # Dynamics in seconds
+        self.valve_delay = 0.003
+        self.pressurize_tau = 0.002
+        self.depressurize_tau = 0.002
+        self.sample_tau = 0.002
+        self.cell_leak_tau = 600
+        self.reservoir_leak_tau = 900
+        self.sensor_rise_tau = 0.004
+        self.sensor_decay_tau = 0.025
+
+        # Fraction of the cell pressure increase drawn from the reservoir
+        self.draw = 0.03
+        # Pump strokes pump_delay after the reservoir falls this fraction below target, at most once per stroke_interval
+        self.pump_hysteresis = 0.04
+        self.pump_delay = 0.5
+        self.stroke_interval = 1.0
+        self.compression_time = 0.02
+        self.compression_tau = 0.01
+        self.stroke_depth = 0.3 # Fraction of the target reading lost at the intake of a stroke
+        self.stroke_tau = 0.5
+
+        # Sensor offsets and valve sensor amplitudes in counts
+        self.origin_offset = -130
+        self.sample_offset = -10
+        self.lower_sensor_baseline = 60
+        self.lower_sensor_amplitude = 14000
+        self.upper_sensor_baseline = 6300
+        self.upper_sensor_amplitude = 8000
+
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.reservoir = self.target_pressure
+        self.origin = 0.0
+        self.sample = 0.0
+        self.stroke_dip = 0.0
+        self.last_stroke = -np.inf
+        self.low_since = None # Time the reservoir fell below the pump threshold
+        self.compression_end = None # Index at which the current stroke reaches its intake
+        # Valve state: commanded open, physically open, index at which the physical state follows the command
+        self.valves = {
+            PRESSURIZE_BIT: {"command": False, "open": False, "actuate": None},
+            DEPRESSURIZE_BIT: {"command": False, "open": False, "actuate": None},
+        }
+        self.sensors = {PRESSURIZE_BIT: [0.0, 0.0], DEPRESSURIZE_BIT: [0.0, 0.0]} # lower, upper
+
+    def coefficient(self, tau, sample_rate):
+        return np.exp(-1 / (tau * sample_rate))
+
+    def generate(self, num_points, dio, sample_rate):
+        # Outputs are active low
+        for bit, valve in self.valves.items():
+            command = not dio & bit
+            if command != valve["command"]:
+                valve["command"] = command
+                valve["actuate"] = self.index + int(round(self.valve_delay * sample_rate))
+        pumping = not dio & PUMP_BIT
+
+        output = np.zeros((num_points, 8))
+        start = 0
+        while start < num_points:
+            # Split where a valve actuates or a stroke reaches its intake so that every segment has constant states
+            end = num_points
+            if self.compression_end is not None:
+                end = min(end, start + max(1, self.compression_end - self.index))
+            for valve in self.valves.values():
+                if valve["actuate"] is not None:
+                    actuate = valve["actuate"] - self.index
+                    if actuate <= 0:
+                        valve["open"] = valve["command"]
+                        valve["actuate"] = None
+                    else:
+                        end = min(end, start + actuate)
+            self.simulate(output[start:end], pumping, sample_rate)
+            start = end
+
+        output += self.random.normal(0, self.noise, output.shape)
+        return np.clip(np.round(output), -32768, 32767).astype(np.int16)
+
+    # Simulates a segment with constant valve states, filling output in place
+    def simulate(self, output, pumping, sample_rate):
+        n = len(output)
+        pressurize = self.valves[PRESSURIZE_BIT]["open"]
+        depressurize = self.valves[DEPRESSURIZE_BIT]["open"]
+
+        # Pump strokes when the reservoir has been low for pump_delay
+        time = self.index / sample_rate
+        if self.reservoir >= self.target_pressure * (1 - self.pump_hysteresis):
+            self.low_since = None
+        elif self.low_since is None:
+            self.low_since = time
+        if (pumping and self.low_since is not None and time - self.low_since >= self.pump_delay
+                and time - self.last_stroke >= self.stroke_interval):
+            self.last_stroke = time
+            self.low_since = None
+            self.compression_end = self.index + int(round(self.compression_time * sample_rate))
+        if self.compression_end is not None and self.index >= self.compression_end:
+            self.compression_end = None
+            self.stroke_dip += self.stroke_depth * self.target_pressure
+        compressing = self.compression_end is not None
+
+        # Cell pressure relaxes towards the pressure of whichever valves are open
+        rate = 1 / self.cell_leak_tau
+        equilibrium = 0.0
+        if pressurize:
+            rate += 1 / self.pressurize_tau
+            equilibrium += self.reservoir / self.pressurize_tau
+        if depressurize:
+            rate += 1 / self.depressurize_tau
+        equilibrium /= rate
+        origin = first_order(np.full(n, equilibrium), self.origin, self.coefficient(1 / rate, sample_rate))
+        sample = first_order(origin, self.sample, self.coefficient(self.sample_tau, sample_rate))
+
+        # Reservoir is compressed by the pump, loses pressure to the cell and slowly leaks
+        if compressing:
+            reservoir = first_order(np.full(n, self.target_pressure), self.reservoir,
+                                    self.coefficient(self.compression_tau, sample_rate))
+        else:
+            reservoir = self.reservoir * self.coefficient(self.reservoir_leak_tau, sample_rate) ** np.arange(1, n + 1)
+        if pressurize:
+            reservoir -= self.draw * np.maximum(0, origin - self.origin)
+        dip = self.stroke_dip * self.coefficient(self.stroke_tau, sample_rate) ** np.arange(1, n + 1)
+
+        output[:, 0] = (reservoir - dip) / TARGET_COEFFICIENT
+        output[:, 5] = origin / ORIGIN_COEFFICIENT + self.origin_offset
+        output[:, 6] = sample / SAMPLE_COEFFICIENT + self.sample_offset
+
+        # Valve sensors. Channels 3, 4 for the pressurize valve, 1, 2 for the depressurize valve.
+        for bit, (lower_channel, upper_channel) in ((PRESSURIZE_BIT, (3, 4)), (DEPRESSURIZE_BIT, (1, 2))):
+            opened = self.valves[bit]["open"]
+            tau = self.sensor_rise_tau if opened else self.sensor_decay_tau
+            lower = first_order(np.full(n, float(opened)), self.sensors[bit][0], self.coefficient(tau, sample_rate))
+            upper = first_order(lower, self.sensors[bit][1], self.coefficient(tau, sample_rate))
+            self.sensors[bit] = [lower[-1], upper[-1]]
+            output[:, lower_channel] = self.lower_sensor_baseline + self.lower_sensor_amplitude * lower
+            output[:, upper_channel] = self.upper_sensor_baseline + self.upper_sensor_amplitude * upper
+
+        self.origin = origin[-1]
+        self.sample = sample[-1]
+        self.reservoir = reservoir[-1]
+        self.stroke_dip = dip[-1]
+        self.index += n
+
+
+# Synthetic device with the same interface as DataqInterface, generating data from a PressureModel.
+# Reacts to DIO commands, e.g. from PulseGenerator, at the sample they would have occurred.
+# speed is the playback speed relative to real time. If None, data is generated as fast as it is read
+# and DIO commands take effect at the start of the next read.
+# duration ends the scan after that many seconds of data, as if the end of a raw log was reached.
+# scan_list is the analog channels to report, as in the scan list of the DI-4108.
+class SyntheticPressureDevice:
+    def __init__(self, sample_rate=4000, speed=1.0, duration=None, model=None, seed=None, scan_list=None) -> None:
+        self.stop_lock = Lock() # Used to make sure you do not stop the device while reading
+        self.dio_lock = Lock()
+        self.sample_rate = sample_rate
+        self.scan_list = list(FULL_SCAN_LIST if scan_list is None else scan_list)
+        self.points_to_read = 64
+        self.channels_to_read = len(self.scan_list) + 1
+        self.bytes_to_read = self.channels_to_read * 2 * self.points_to_read
+        self.packet_bytes = self.bytes_to_read # Reads are a multiple of this
+        self.speed = speed
+        self.duration = duration
+        self.model = model if model is not None else PressureModel(seed=seed)
+        self.current_dio = None
+        self.acquiring = None
+
+        self.initial_time = None
+        self.read_count = 0
+        self.samples_read = 0
+        # (sample index, dio) of DIO changes not yet applied, in order
+        self.dio_changes = []
+        self.dio = 0b1111111
+        self.stop()
+
+    # Index of the sample being acquired now
+    def get_sample_index(self):
+        if self.initial_time is None or self.speed is None:
+            return self.samples_read
+        return int((time() - self.initial_time) * self.speed * self.sample_rate)
+
+    def set_dio(self, value=0b1111111, check_echo=True):
+        self.schedule_dio(self.get_sample_index(), value)
+
+    # Sets DIO at a given sample, e.g. to script pulses when reading faster than real time
+    def schedule_dio(self, sample_index, value):
+        with self.dio_lock:
+            self.current_dio = int(value)
+            self.dio_changes.append((max(sample_index, self.samples_read), int(value)))
+            self.dio_changes.sort(key=lambda change: change[0])
+
+    # Schedules the same sequence of pulses as PulseGenerator. Times in seconds, widths in ms.
+    # idle is the DIO value between pulses, e.g. with the pump on.
+    def schedule_pulses(self, period, pressurize_width, depressurize_width, delay, count, start=0.0, idle=0b1111111):
+        for i in range(count):
+            begin = start + i * period
+            depressurize = int(begin * self.sample_rate)
+            pressurize = int((begin + delay) * self.sample_rate)
+            self.schedule_dio(depressurize, idle ^ DEPRESSURIZE_BIT)
+            self.schedule_dio(depressurize + int(depressurize_width / 1000 * self.sample_rate), idle)
+            self.schedule_dio(pressurize, idle ^ PRESSURIZE_BIT)
+            self.schedule_dio(pressurize + int(pressurize_width / 1000 * self.sample_rate), idle)
+
+    # size is the number of bytes to read, rounded down to whole samples. Defaults to bytes_to_read.
+    def read_data(self, size=None):
+        points = self.points_to_read if size is None else max(1, size // (2 * self.channels_to_read))
+        first = self.samples_read
+        if self.read_count == 0:
+            self.initial_time = time()
+        if self.speed is not None:
+            # Wait until the last sample of this read would have been acquired
+            next_read = self.initial_time + (first + points) / (self.sample_rate * self.speed)
+            sleep(max(0, next_read - time()))
+
+        if self.duration is not None and first >= self.duration * self.sample_rate:
+            raise RuntimeError("End of file reached.")
+        self.read_count += 1
+        self.samples_read += points
+
+        # Generate data in segments of constant DIO
+        data = np.empty((points, self.channels_to_read), dtype=np.int16)
+        index = first
+        end = first + points
+        while index < end:
+            with self.dio_lock:
+                while len(self.dio_changes) > 0 and self.dio_changes[0][0] <= index:
+                    self.dio = self.dio_changes.pop(0)[1]
+                next_change = self.dio_changes[0][0] if len(self.dio_changes) > 0 else end
+            segment_end = min(end, next_change)
+            analog = self.model.generate(segment_end - index, self.dio, self.sample_rate)
+            data[index - first:segment_end - first, :-1] = analog[:, self.scan_list]
+            # Digital inputs are reported in the upper byte
+            data[index - first:segment_end - first, -1] = (self.dio & 0x7f) << 8
+            index = segment_end
+
+        return array('B', data.tobytes())
+
+    def close_device(self):
+        pass
+
+    def start_scan(self):
+        # Prevent stopping device while reading
+        self.stop_lock.acquire()
+        # Start reading
+        self.acquiring = True
+
+    def end_scan(self):
+        if self.stop_lock.locked():
+            self.stop_lock.release()
+
+    def stop(self):
+        """
+        - stops data acquisition
+        - set digital IO to all high
+        """
+        self.acquiring = False # Signals to stop acquiring
+        with self.stop_lock:
+            pass
+        # Turn all valves off
+        self.set_dio(0b1111111, check_echo=False)
+
+    def get_current_dio(self):
+        return self.current_dio
+
+    # Settings needed to interpret the data. Written to the header of raw logs.
+    def get_device_settings(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "srate": None,
+            "dec": None,
+            "channels": self.channels_to_read,
+            "points": self.points_to_read,
+            "scan_list": self.scan_list,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="icarus-synth",
+        description="Generate synthetic pressure jump data and either save it as a raw log "
+                    "or run it through the event detection pipeline."
+    )
+    parser.add_argument("-o", "--output", required=True, help="Raw log to write, or event log with --run.")
+    parser.add_argument("--run", action="store_true", help="Run the detection pipeline and write an event log.")
+    parser.add_argument("--seconds", type=float, default=60, help="Seconds of data to generate.")
+    parser.add_argument("--sample-rate", type=float, default=4000, help="Sample rate in Hz.")
+    parser.add_argument("--pressure", type=float, default=1.5, help="Target pressure in kbar.")
+    parser.add_argument("--period", type=float, default=5, help="Pulse period in s.")
+    parser.add_argument("--delay", type=float, default=2, help="Delay from depressurize to pressurize in s.")
+    parser.add_argument("--pressurize-width", type=float, default=10, help="Pressurize pulse width in ms.")
+    parser.add_argument("--depressurize-width", type=float, default=10, help="Depressurize pulse width in ms.")
+    parser.add_argument("--no-pump", action="store_true", help="Leave the pump off.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for sensor noise.")
+    parser.add_argument("--scan-profile", default="All Channels", choices=SCAN_PROFILES.keys(),
+                        help="Analog channels to sample.")
+    args = parser.parse_args()
+
+    device = SyntheticPressureDevice(
+        sample_rate=args.sample_rate,
+        speed=None,
+        duration=args.seconds,
+        model=PressureModel(target_pressure=args.pressure, seed=args.seed),
+        scan_list=SCAN_PROFILES[args.scan_profile]
+    )
+    idle = 0b1111111 if args.no_pump else 0b1111111 ^ PUMP_BIT
+    device.schedule_dio(0, idle)
+    count = int(args.seconds // args.period)
+    device.schedule_pulses(args.period, args.pressurize_width, args.depressurize_width, args.delay, count,
+                           start=0.5, idle=idle)
+
+    begin = perf_counter()
+    if args.run:
+        from icarus_v2.backend.configuration_manager import ConfigurationManager
+        from icarus_v2.utils.reprocess import Reprocessor
+        from icarus_v2.utils.regression import EVENT_NAMES
+
+        ConfigurationManager()
+
+        reprocessor = Reprocessor(None, args.output, start_time=time(), device=device)
+        samples = reprocessor.run()
+        elapsed = perf_counter() - begin
+        print(f"Processed {samples / args.sample_rate:.1f}s of data in {elapsed:.2f}s ({samples / elapsed:.0f} samples/s).")
+        for event_type, count in sorted(reprocessor.event_counts.items()):
+            print(f"{EVENT_NAMES[event_type]}: {count}")
+    else:
+        samples = 0
+        with lzma.open(args.output, "wb") as file:
+            pickle.dump({"device_settings": device.get_device_settings()}, file)
+            while True:
+                try:
+                    data = device.read_data()
+                except RuntimeError:
+                    break
+                pickle.dump(data, file)
+                samples += device.points_to_read
+        elapsed = perf_counter() - begin
+        print(f"Wrote {samples / args.sample_rate:.1f}s of data in {elapsed:.2f}s ({samples / elapsed:.0f} samples/s).")
+
+
+if __name__ == "__main__":
+    main()
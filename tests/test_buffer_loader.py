@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+from icarus_v2.backend.buffer_loader import BufferLoader
+
+
+CHANNELS = 8
+FRAME_BYTES = 2 * CHANNELS
+DIGITAL = 127
+
+
+class FakeDevice:
+    sample_rate = 4000
+    channels_to_read = CHANNELS
+    packet_bytes = 1024
+
+
+# Frames of random analog values followed by the digital word of the device, with the inputs in its high byte
+def make_frames(count, seed=0):
+    random = np.random.default_rng(seed)
+    frames = random.integers(-30000, 30000, size=(count, CHANNELS), dtype=np.int16)
+    frames[:, -1] = DIGITAL << 8
+    return frames
+
+
+class ProcessFramesTest(unittest.TestCase):
+    def setUp(self):
+        self.loader = BufferLoader(buffer_seconds=1)
+        self.loader.set_device(FakeDevice())
+
+    def load(self, data, read_bytes):
+        blocks = [self.loader.process_data(bytearray(data[i:i + read_bytes])) for i in range(0, len(data), read_bytes)]
+        return np.concatenate(blocks)
+
+    def test_partial_frames_across_reads(self):
+        frames = make_frames(300)
+        result = self.load(frames.tobytes(), 1000)
+        self.assertEqual(len(result), 300)
+        self.assertTrue(np.array_equal(result[:, :-1], frames[:, :-1]))
+        self.assertTrue(np.all(result[:, -1] == DIGITAL))
+        self.assertEqual(len(self.loader.partial), 0)
+        self.assertEqual((self.loader.resyncs, self.loader.dropped_bytes, self.loader.framing_errors), (0, 0, 0))
+
+    def test_resync_after_lost_bytes(self):
+        frames = make_frames(300)
+        data = frames.tobytes()
+        # Lose 6 bytes of frame 100
+        data = data[:100 * FRAME_BYTES + 4] + data[100 * FRAME_BYTES + 10:]
+        result = self.load(data, 512)
+        self.assertEqual(self.loader.resyncs, 1)
+        self.assertEqual(self.loader.dropped_bytes, FRAME_BYTES - 6)
+        # Frame 100 is incomplete, and every other frame is kept
+        self.assertEqual(len(result), 299)
+        self.assertTrue(np.array_equal(result[100:, :-1], frames[101:, :-1]))
+        self.assertTrue(np.all(result[:, -1] == DIGITAL))
+
+    def test_corrupt_frame_is_dropped_alone(self):
+        frames = make_frames(300)
+        frames[150, -1] = -1 # Every bit set, including those which are always 0
+        result = self.load(frames.tobytes(), 2048)
+        self.assertEqual(self.loader.framing_errors, 1)
+        self.assertEqual(self.loader.dropped_bytes, FRAME_BYTES)
+        self.assertEqual(self.loader.resyncs, 0)
+        self.assertEqual(len(result), 299)
+        self.assertTrue(np.array_equal(result[150:, :-1], frames[151:, :-1]))
+        self.assertTrue(np.all(result[:, -1] == DIGITAL))
+
+    def test_find_alignment(self):
+        data = bytes(6) + make_frames(100).tobytes()
+        self.loader.last_digital = DIGITAL
+        self.assertEqual(self.loader.count_aligned(data, 0, 50), 0)
+        self.assertEqual(self.loader.find_alignment(data, 0, 50), 6)
+        self.assertEqual(self.loader.count_aligned(data, 6, 99), 99)
+
+    def test_no_alignment_in_noise(self):
+        data = np.random.default_rng(1).integers(0, 256, size=100 * FRAME_BYTES, dtype=np.uint8).tobytes()
+        self.assertIsNone(self.loader.find_alignment(data, 0, 99))
+
+
+if __name__ == "__main__":
+    unittest.main()
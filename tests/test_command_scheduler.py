@@ -0,0 +1,98 @@
+import threading
+import unittest
+from array import array
+from icarus_v2.backend.command_scheduler import CommandScheduler
+from icarus_v2.backend.dataq_interface import DataqInterface
+
+
+class CommandSchedulerTest(unittest.TestCase):
+    def test_priority_order(self):
+        written = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def write(command, check_echo):
+            if command == "first":
+                started.set()
+                release.wait(5)
+            written.append(command)
+
+        scheduler = CommandScheduler(write)
+        scheduler.start()
+        try:
+            # Everything below is queued while the first command is being written
+            first = scheduler.submit("first", CommandScheduler.CONFIG, wait=False)
+            self.assertTrue(started.wait(5))
+            queued = [
+                scheduler.submit("config 1", CommandScheduler.CONFIG, wait=False),
+                scheduler.submit("control", CommandScheduler.CONTROL, wait=False),
+                scheduler.submit("config 2", CommandScheduler.CONFIG, wait=False),
+                scheduler.submit("valve 1", CommandScheduler.VALVE, wait=False),
+                scheduler.submit("valve 2", CommandScheduler.VALVE, wait=False),
+            ]
+            release.set()
+            for scheduled in [first] + queued:
+                scheduler.wait(scheduled)
+        finally:
+            scheduler.stop()
+        self.assertEqual(written, ["first", "valve 1", "valve 2", "control", "config 1", "config 2"])
+        self.assertEqual(scheduler.get_metrics()["valve_commands"], 2)
+
+    def test_errors_reach_the_caller(self):
+        def write(command, check_echo):
+            raise OSError("write failed")
+
+        scheduler = CommandScheduler(write)
+        scheduler.start()
+        try:
+            with self.assertRaises(OSError):
+                scheduler.submit("dout 0")
+        finally:
+            scheduler.stop()
+
+    def test_written_directly_once_stopped(self):
+        threads = []
+        scheduler = CommandScheduler(lambda command, check_echo: threads.append(threading.current_thread()))
+        scheduler.submit("stop")
+        self.assertEqual(threads, [threading.current_thread()])
+
+
+# Echoes every command written to it, except that it answers replace[command] instead if given
+class EchoDevice:
+    def __init__(self, replace=None) -> None:
+        self.replace = replace if replace is not None else {}
+        self.responses = b""
+
+    def write(self, endpoint, data):
+        for command in data.decode("utf-8").split("\r")[:-1]:
+            self.responses += (self.replace.get(command, command) + "\r").encode("utf-8")
+        return len(data)
+
+    # Returns the echoes a few bytes at a time, as the device may split them between reads
+    def read(self, endpoint, size, timeout=None):
+        data, self.responses = self.responses[:5], self.responses[5:]
+        return array("B", data)
+
+
+class SendBatchTest(unittest.TestCase):
+    def make_interface(self, device):
+        interface = DataqInterface.__new__(DataqInterface)
+        interface.device = device
+        interface.endpoint_out = None
+        interface.endpoint_in = None
+        interface.usb_buff = 64
+        interface.acquiring = False
+        interface.scheduler = CommandScheduler(interface._write_cmd)
+        return interface
+
+    def test_matching_echoes(self):
+        interface = self.make_interface(EchoDevice())
+        self.assertTrue(interface.send_batch(["srate 1000", "dec 1", "slist 0 0"]))
+
+    def test_mismatched_echo(self):
+        interface = self.make_interface(EchoDevice({"dec 1": "dec 2"}))
+        self.assertFalse(interface.send_batch(["srate 1000", "dec 1", "slist 0 0"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
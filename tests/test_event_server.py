@@ -0,0 +1,86 @@
+import io
+import socket
+import unittest
+import numpy as np
+from icarus_v2.backend.event import Event
+from icarus_v2.backend.event_server import (
+    Subscriber, encode_event, encode_frame, encode_json, read_frame, decode_frame,
+    EVENT, HELLO, LOG, LOG_FORMAT, DROP_OLDEST, DROP_NEWEST, DISCONNECT
+)
+
+
+class FramingTest(unittest.TestCase):
+    def test_event_round_trip(self):
+        data = np.arange(24, dtype=np.int16).reshape(3, 8)
+        event = Event(Event.DEPRESSURIZE, data, event_index=1, event_time=12.5, step_time=0.25)
+        stream = io.BytesIO(encode_event(event, True) + encode_event(event, False) + encode_json(HELLO, {"version": 1}))
+
+        frame_type, payload = read_frame(stream)
+        self.assertEqual(frame_type, EVENT)
+        decoded = decode_frame(frame_type, payload)
+        self.assertEqual((decoded.event_type, decoded.event_time, decoded.event_index, decoded.step_time),
+                         (Event.DEPRESSURIZE, 12.5, 1, 0.25))
+        self.assertTrue(np.array_equal(decoded.data, data))
+
+        self.assertIsNone(decode_frame(*read_frame(stream)).data)
+        self.assertEqual(decode_frame(*read_frame(stream)), {"version": 1})
+        self.assertIsNone(read_frame(stream))
+
+    def test_truncated_frame(self):
+        frame = encode_frame(LOG, LOG_FORMAT.pack(True))
+        self.assertEqual(decode_frame(*read_frame(io.BytesIO(frame))), True)
+        self.assertIsNone(read_frame(io.BytesIO(frame[:-1])))
+
+
+class SubscriberTest(unittest.TestCase):
+    def setUp(self):
+        self.connection, self.client = socket.socketpair()
+
+    def tearDown(self):
+        self.connection.close()
+        self.client.close()
+
+    def make_subscriber(self, **request):
+        subscriber = Subscriber(None, self.connection, "test")
+        subscriber.subscribe(request)
+        return subscriber
+
+    def test_drop_oldest(self):
+        subscriber = self.make_subscriber(queue=3, policy=DROP_OLDEST)
+        for frame in [b"1", b"2", b"3", b"4", b"5"]:
+            subscriber.put(frame)
+        self.assertEqual(list(subscriber.frames), [b"3", b"4", b"5"])
+        self.assertEqual((subscriber.dropped, subscriber.unreported_drops), (2, 2))
+
+    def test_drop_newest(self):
+        subscriber = self.make_subscriber(queue=3, policy=DROP_NEWEST)
+        for frame in [b"1", b"2", b"3", b"4", b"5"]:
+            subscriber.put(frame)
+        self.assertEqual(list(subscriber.frames), [b"1", b"2", b"3"])
+        self.assertEqual(subscriber.dropped, 2)
+
+    def test_disconnect(self):
+        subscriber = self.make_subscriber(queue=2, policy=DISCONNECT)
+        for frame in [b"1", b"2", b"3", b"4"]:
+            subscriber.put(frame)
+        self.assertTrue(subscriber.closed)
+        self.assertEqual(list(subscriber.frames), [b"1", b"2"])
+        self.assertEqual(subscriber.dropped, 0)
+
+    def test_decimation(self):
+        subscriber = self.make_subscriber(topics=["pressure", "log"], decimate={"pressure": 3})
+        self.assertEqual([subscriber.wants("pressure") for _ in range(6)], [True, False, False, True, False, False])
+        # The log bit is never decimated, and unsubscribed topics are never sent
+        self.assertTrue(all(subscriber.wants("log") for _ in range(3)))
+        self.assertFalse(subscriber.wants("pump"))
+
+    def test_invalid_subscriptions(self):
+        subscriber = Subscriber(None, self.connection, "test")
+        with self.assertRaises(ValueError):
+            subscriber.subscribe({"topics": ["unknown"]})
+        with self.assertRaises(ValueError):
+            subscriber.subscribe({"policy": "block"})
+
+
+if __name__ == "__main__":
+    unittest.main()
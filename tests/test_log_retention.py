@@ -0,0 +1,107 @@
+import os
+import tempfile
+import time
+import unittest
+from icarus_v2.backend.log_retention import LogRetentionManager, SegmentManifest
+
+
+def settings(max_size_mb=0, max_age_days=0, segment_size_mb=0, segment_minutes=0):
+    return {
+        "temp_max_size_mb": max_size_mb,
+        "temp_max_age_days": max_age_days,
+        "segment_max_size_mb": segment_size_mb,
+        "segment_max_minutes": segment_minutes,
+    }
+
+
+# Writes a log of size bytes last modified age seconds ago
+def write_log(directory, name, size, age=0):
+    filename = os.path.join(directory, name)
+    with open(filename, "wb") as file:
+        file.write(bytes(size))
+    modified = time.time() - age
+    os.utime(filename, (modified, modified))
+    return filename
+
+
+class PruneTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_oldest_deleted_until_under_budget(self):
+        oldest = write_log(self.path, "a.xz", 400000, age=300)
+        older = write_log(self.path, "b.xz", 400000, age=200)
+        newest = write_log(self.path, "c.xz", 400000, age=100)
+        other = write_log(self.path, "notes.txt", 400000, age=400)
+        deleted = LogRetentionManager(settings(max_size_mb=1)).prune(self.path)
+        self.assertEqual(deleted, [os.path.abspath(oldest)])
+        self.assertTrue(os.path.exists(older) and os.path.exists(newest) and os.path.exists(other))
+
+    def test_old_logs_deleted(self):
+        old = write_log(self.path, "a.xz", 10, age=3 * 86400)
+        new = write_log(self.path, "b.xz", 10, age=60)
+        deleted = LogRetentionManager(settings(max_age_days=1)).prune(self.path)
+        self.assertEqual(deleted, [os.path.abspath(old)])
+        self.assertTrue(os.path.exists(new))
+
+    def test_excluded_log_kept(self):
+        current = write_log(self.path, "a.xz", 2000000, age=300)
+        deleted = LogRetentionManager(settings(max_size_mb=1, max_age_days=0.001)).prune(self.path, exclude=[current])
+        self.assertEqual(deleted, [])
+
+    def test_manifests_follow_deleted_segments(self):
+        first = write_log(self.path, "log.xz", 300000, age=300)
+        manifest = SegmentManifest(first)
+        manifest.add_segment(first, 1)
+        for index in (1, 2, 3):
+            segment = write_log(self.path, os.path.basename(manifest.segment_filename(index)), 300000, age=300 - index)
+            manifest.add_segment(segment, 1 + index)
+        manifest.save()
+
+        LogRetentionManager(settings(max_size_mb=1)).prune(self.path)
+        segments = [s["filename"] for s in SegmentManifest.load(manifest.filename).segments]
+        self.assertEqual(segments, ["log_001.xz", "log_002.xz", "log_003.xz"])
+
+    def test_should_roll(self):
+        manager = LogRetentionManager(settings(segment_size_mb=1, segment_minutes=1))
+        self.assertFalse(manager.should_roll(10, time.time()))
+        self.assertTrue(manager.should_roll(1000000, time.time()))
+        self.assertTrue(manager.should_roll(10, time.time() - 61))
+        self.assertFalse(LogRetentionManager(settings()).should_roll(10 ** 12, 0))
+
+
+class SegmentManifestTest(unittest.TestCase):
+    def test_save_load_and_find(self):
+        with tempfile.TemporaryDirectory() as path:
+            first = os.path.join(path, "log_2024.xz")
+            manifest = SegmentManifest(first)
+            manifest.add_segment(first, 10)
+            manifest.close_segment(20, 5)
+            # One segment needs no manifest
+            manifest.save()
+            self.assertFalse(os.path.exists(manifest.filename))
+
+            second = manifest.segment_filename(1)
+            self.assertEqual(os.path.basename(second), "log_2024_001.xz")
+            manifest.add_segment(second, 20)
+            manifest.close_segment(30, 7)
+            manifest.rename_segment(second, os.path.join(path, "renamed.xz"))
+            manifest.save()
+
+            loaded = SegmentManifest.find(os.path.join(path, "renamed.xz"))
+            self.assertIsNotNone(loaded)
+            self.assertEqual(loaded.get_segment_files(), [first, os.path.join(path, "renamed.xz")])
+            self.assertEqual([s["event_count"] for s in loaded.segments], [5, 7])
+            self.assertIsNone(SegmentManifest.find(os.path.join(path, "other.xz")))
+
+            loaded.remove_segment("renamed.xz")
+            loaded.save()
+            self.assertFalse(os.path.exists(manifest.filename))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import lzma
+import os
+import pickle
+import tempfile
+import unittest
+from icarus_v2.backend.event import Event
+from icarus_v2.utils.log_tool import crop_log, join_logs, iter_streams
+
+
+def make_event(event_type, event_time):
+    return {"event_type": event_type, "data": None, "event_time": event_time, "event_index": None, "step_time": None}
+
+
+# Writes a log with one xz stream per list of records, as the logger does when it flushes
+def write_log(filename, streams):
+    with open(filename, "wb") as file:
+        for records in streams:
+            file.write(lzma.compress(b"".join(pickle.dumps(record) for record in records)))
+
+
+def read_records(filename):
+    return [record for stream in iter_streams(filename) for record, _ in stream.records]
+
+
+class LogToolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.directory.name, "log.xz")
+        self.output = os.path.join(self.directory.name, "out.xz")
+        write_log(self.log, [
+            [make_event(Event.PRESSURIZE, 100), make_event(Event.DEPRESSURIZE, 101)],
+            [make_event(Event.PRESSURIZE, 110), make_event(Event.PUMP, 111)],
+            [make_event(Event.PRESSURIZE, 120), {"plotting_coefficients": {}}],
+        ])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_crop(self):
+        stats = crop_log(self.log, self.output, start=5, end=15)
+        self.assertEqual(stats, {"streams": 3, "copied": 1, "encoded": 1, "dropped": 1})
+        records = read_records(self.output)
+        self.assertEqual([record["event_time"] for record in records if "event_time" in record], [110, 111])
+        # Records other than events are always kept
+        self.assertIn({"plotting_coefficients": {}}, records)
+
+    def test_unchanged_streams_are_copied(self):
+        stats = crop_log(self.log, self.output, drop_types=[Event.PUMP])
+        self.assertEqual(stats, {"streams": 3, "copied": 2, "encoded": 1, "dropped": 0})
+        self.assertEqual(len(read_records(self.output)), 5)
+
+    def test_join(self):
+        second = os.path.join(self.directory.name, "second.xz")
+        write_log(second, [[make_event(Event.PUMP, 200)]])
+        join_logs([self.log, second], self.output)
+        records = read_records(self.output)
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records[-1]["event_time"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_LOG = os.path.join(ROOT, "logs", "raw", "5sec_1.5kBar3.xz")
+
+# Runs in a fresh interpreter in which importing PySide6 fails, as if it were not installed
+SCRIPT = f"""
+import sys
+import importlib.abc
+
+class BlockPySide6(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if name == "PySide6" or name.startswith("PySide6."):
+            raise ImportError("PySide6 is blocked")
+
+sys.meta_path.insert(0, BlockPySide6())
+
+from icarus_v2.backend.pipeline import Pipeline
+from icarus_v2.backend.async_adapter import EventStream
+from icarus_v2.backend.configuration_manager import ConfigurationManager
+from icarus_v2.backend.interlock import Interlock
+from icarus_v2.backend.pulse_generator import PulseGenerator
+from icarus_v2.backend.event import Event
+from icarus_v2.utils.raw_log_reader import RawLogReader
+
+updated = []
+config_manager = ConfigurationManager()
+config_manager.settings_updated.connect(updated.append)
+config_manager.save_settings("sentry_settings", config_manager.get_settings("sentry_settings"))
+assert updated == ["sentry_settings"], updated
+
+Interlock(PulseGenerator())
+
+counts = {{}}
+pipeline = Pipeline(RawLogReader({RAW_LOG!r}, speed=None))
+for topic in (Event.PRESSURIZE, Event.DEPRESSURIZE, Event.PUMP):
+    pipeline.subscribe(topic, lambda event, topic=topic: counts.update({{topic: counts.get(topic, 0) + 1}}))
+pipeline.run_to_end()
+assert counts.get(Event.DEPRESSURIZE, 0) > 0, counts
+
+assert not any(name.startswith("PySide6") for name in sys.modules)
+print("ok")
+"""
+
+
+# The pipeline core, its settings and the sentry's interlock must work where PySide6 is not installed
+class QtFreeImportTest(unittest.TestCase):
+    def test_pipeline_without_pyside6(self):
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(os.environ)
+            env["PYTHONPATH"] = os.path.join(ROOT, "src") + os.pathsep + env.get("PYTHONPATH", "")
+            # Settings and logs are written to a temporary directory rather than those of the user
+            env["HOME"] = home
+            env["XDG_CONFIG_HOME"] = os.path.join(home, "config")
+            env["XDG_DATA_HOME"] = os.path.join(home, "data")
+            env["APPDATA"] = env["LOCALAPPDATA"] = home
+            result = subprocess.run([sys.executable, "-c", SCRIPT], env=env, capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
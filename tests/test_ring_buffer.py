@@ -0,0 +1,74 @@
+import multiprocessing
+import unittest
+import numpy as np
+from icarus_v2.backend.ring_buffer import SharedRingBuffer, SPMCRingBufferReader
+
+
+# Reads count rows from the buffer in a child process and sends back their sum.
+# Also tries to write, which only the creator may do, and releases the buffer as a reader would.
+def read_in_child(buffer, count, ready, results):
+    try:
+        reader = SPMCRingBufferReader(buffer)
+        ready.set()
+        data, _ = reader.read(count, timeout=10)
+        total = int(data.sum())
+        try:
+            buffer.enqueue(np.zeros((1, 2), dtype=np.int16))
+            wrote = True
+        except RuntimeError:
+            wrote = False
+        buffer.release()
+        results.put((total, wrote))
+    except Exception as e:
+        results.put(repr(e))
+
+
+class SharedRingBufferTest(unittest.TestCase):
+    def read_from_child(self, start_method):
+        context = multiprocessing.get_context(start_method)
+        buffer = SharedRingBuffer((100, 2), np.int16, context=context)
+        try:
+            ready = context.Event()
+            results = context.Queue()
+            process = context.Process(target=read_in_child, args=(buffer, 30, ready, results))
+            process.start()
+            self.assertTrue(ready.wait(30))
+            data = np.arange(60, dtype=np.int16).reshape(30, 2)
+            buffer.enqueue(data[:10])
+            buffer.enqueue(data[10:])
+            result = results.get(timeout=30)
+            process.join(30)
+            self.assertEqual(result, (int(data.sum()), False))
+            self.assertEqual(process.exitcode, 0)
+            # The child released its mapping without freeing the memory
+            buffer.enqueue(data[:1])
+            self.assertEqual(buffer.write_index, 31)
+        finally:
+            buffer.release()
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "fork is not available")
+    def test_forked_reader(self):
+        self.read_from_child("fork")
+
+    def test_spawned_reader(self):
+        self.read_from_child("spawn")
+
+    def test_attach_by_name(self):
+        buffer = SharedRingBuffer((50, 3), np.int16)
+        try:
+            attached = SharedRingBuffer.attach(buffer.get_name())
+            reader = SPMCRingBufferReader(attached)
+            buffer.enqueue(np.ones((60, 3), dtype=np.int16))
+            reader.read_index = 20
+            data, start = reader.read(40, timeout=1)
+            self.assertEqual(data.shape, (40, 3))
+            self.assertEqual(start, 20)
+            with self.assertRaises(RuntimeError):
+                attached.enqueue(data)
+            attached.release()
+        finally:
+            buffer.release()
+
+
+if __name__ == "__main__":
+    unittest.main()